@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from .models import User, Skill, ExchangeRequest
+from .models import User, Skill, ExchangeRequest, ImageTask, OutboundEmail
 
 
 @admin.register(User)
@@ -36,6 +36,9 @@ class UserAdmin(DjangoUserAdmin):
     list_filter = ("role", "is_staff", "is_active")
     search_fields = ("username", "email", "full_name", "university")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_balances()
+
 
 @admin.register(Skill)
 class SkillAdmin(admin.ModelAdmin):
@@ -49,4 +52,17 @@ class ExchangeRequestAdmin(admin.ModelAdmin):
     list_filter = ("status", "created_at")
     search_fields = ("sender__username", "receiver__username", "skill__name")
 
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject",)
+
+
+@admin.register(ImageTask)
+class ImageTaskAdmin(admin.ModelAdmin):
+    list_display = ("model", "object_id", "field", "status", "attempts", "created_at", "processed_at")
+    list_filter = ("status", "model")
+
 # Register your models here.
@@ -4,11 +4,34 @@ Admin panel views for SkillSwap application
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Q
 from django.core.paginator import Paginator
-from django.utils import timezone
-from datetime import timedelta
 from .models import User, Skill, ExchangeRequest
+from .search import search_users, ADMIN_SEARCH_FIELDS
+from .exports import export_response
+from .pagination import KeysetPaginator, InvalidCursor, wants_count
+from .stats import get_dashboard_stats
+
+USER_EXPORT_COLUMNS = (
+    'id', 'username', 'email', 'full_name', 'university', 'role', 'is_active',
+    'date_joined', 'last_login', 'ledger_points', 'ledger_points_hold',
+)
+SKILL_EXPORT_COLUMNS = (
+    'id', 'name', 'slug', 'experience_years', 'teachers_count', 'learners_count', 'updated_at',
+)
+EXCHANGE_EXPORT_COLUMNS = (
+    'id', 'created_at', 'status', 'price', 'sender_id', 'sender__username',
+    'receiver_id', 'receiver__username', 'skill_id', 'skill__name',
+    'sender_confirmed', 'receiver_confirmed', 'sender_confirmed_at', 'receiver_confirmed_at',
+)
+
+
+def keyset_page(request, queryset, ordering, per_page=20):
+    """Страница по курсору из ?cursor=, без OFFSET"""
+    paginator = KeysetPaginator(queryset, per_page, ordering, with_count=wants_count(request.GET))
+    try:
+        return paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return paginator.get_page()
 
 
 def is_admin(user):
@@ -19,68 +42,52 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     """Главная страница админ-панели"""
-    # Статистика пользователей
-    total_users = User.objects.count()
-    active_users = User.objects.filter(is_active=True).count()
-    new_users_today = User.objects.filter(
-        date_joined__date=timezone.now().date()
-    ).count()
-    new_users_week = User.objects.filter(
-        date_joined__gte=timezone.now() - timedelta(days=7)
-    ).count()
-    
-    # Статистика навыков
-    total_skills = Skill.objects.count()
-    popular_skills = Skill.objects.annotate(
-        teachers_count=Count('teachers'),
-        learners_count=Count('learners')
-    ).order_by('-teachers_count')[:5]
-    
-    # Статистика обменов
-    total_exchanges = ExchangeRequest.objects.count()
-    pending_exchanges = ExchangeRequest.objects.filter(
-        status=ExchangeRequest.STATUS_PENDING
-    ).count()
-    completed_exchanges = ExchangeRequest.objects.filter(
-        status=ExchangeRequest.STATUS_COMPLETED
-    ).count()
+    # Статистика пользователей, навыков и обменов из кэшированного снимка
+    context = dict(get_dashboard_stats())
+    context['stats_computed_at'] = context.pop('computed_at')
     
     # Последние обмены
-    recent_exchanges = ExchangeRequest.objects.select_related(
+    context['recent_exchanges'] = ExchangeRequest.objects.select_related(
         'sender', 'receiver', 'skill'
     ).order_by('-created_at')[:10]
     
-    context = {
-        'total_users': total_users,
-        'active_users': active_users,
-        'new_users_today': new_users_today,
-        'new_users_week': new_users_week,
-        'total_skills': total_skills,
-        'popular_skills': popular_skills,
-        'total_exchanges': total_exchanges,
-        'pending_exchanges': pending_exchanges,
-        'completed_exchanges': completed_exchanges,
-        'recent_exchanges': recent_exchanges,
-    }
     return render(request, 'admin/dashboard.html', context)
 
 
+def filtered_users(search_query):
+    """Пользователи админ-панели по запросу ?q= (по релевантности) или все, новые первыми"""
+    if search_query:
+        return search_users(
+            User.objects.with_balances(), search_query,
+            fields=ADMIN_SEARCH_FIELDS, ordering=('-date_joined',),
+        )
+    return User.objects.with_balances().order_by('-date_joined', '-id')
+
+
+def filtered_skills(search_query):
+    skills = Skill.objects.all()
+    if search_query:
+        skills = skills.filter(name__icontains=search_query)
+    return skills.order_by('-teachers_count', 'name')
+
+
+def filtered_exchanges(status_filter):
+    exchanges = ExchangeRequest.objects.all()
+    if status_filter:
+        exchanges = exchanges.filter(status=status_filter)
+    return exchanges.order_by('-created_at', '-id')
+
+
 @user_passes_test(is_admin)
 def admin_users(request):
     """Управление пользователями"""
     search_query = request.GET.get('q', '')
-    users = User.objects.all()
-    
+    users = filtered_users(search_query)
     if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(full_name__icontains=search_query)
-        )
-    
-    paginator = Paginator(users.order_by('-date_joined'), 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        # Результаты поиска упорядочены по релевантности
+        page_obj = Paginator(users, 20).get_page(request.GET.get('page'))
+    else:
+        page_obj = keyset_page(request, users, ('-date_joined', '-id'))
     
     return render(request, 'admin/users.html', {
         'users': page_obj,
@@ -94,8 +101,7 @@ def admin_user_detail(request, user_id):
     user = get_object_or_404(User, id=user_id)
     sent_exchanges = ExchangeRequest.objects.filter(sender=user).count()
     received_exchanges = ExchangeRequest.objects.filter(receiver=user).count()
-    completed_exchanges = ExchangeRequest.objects.filter(
-        Q(sender=user) | Q(receiver=user),
+    completed_exchanges = ExchangeRequest.objects.involving(user).filter(
         status=ExchangeRequest.STATUS_COMPLETED
     ).count()
     
@@ -111,15 +117,7 @@ def admin_user_detail(request, user_id):
 def admin_skills(request):
     """Управление навыками"""
     search_query = request.GET.get('q', '')
-    skills = Skill.objects.annotate(
-        teachers_count=Count('teachers'),
-        learners_count=Count('learners')
-    )
-    
-    if search_query:
-        skills = skills.filter(name__icontains=search_query)
-    
-    paginator = Paginator(skills.order_by('-teachers_count'), 20)
+    paginator = Paginator(filtered_skills(search_query), 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -133,16 +131,8 @@ def admin_skills(request):
 def admin_exchanges(request):
     """Управление обменами"""
     status_filter = request.GET.get('status', '')
-    exchanges = ExchangeRequest.objects.select_related(
-        'sender', 'receiver', 'skill'
-    )
-    
-    if status_filter:
-        exchanges = exchanges.filter(status=status_filter)
-    
-    paginator = Paginator(exchanges.order_by('-created_at'), 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    exchanges = filtered_exchanges(status_filter).select_related('sender', 'receiver', 'skill')
+    page_obj = keyset_page(request, exchanges, ('-created_at', '-id'))
     
     return render(request, 'admin/exchanges.html', {
         'exchanges': page_obj,
@@ -163,3 +153,23 @@ def admin_exchange_detail(request, exchange_id):
         'exchange': exchange,
     })
 
+
+@user_passes_test(is_admin)
+def admin_users_export(request):
+    """Выгрузка пользователей (?format=csv|ndjson) с фильтром ?q= как в списке"""
+    users = filtered_users(request.GET.get('q', ''))
+    return export_response(request, users, USER_EXPORT_COLUMNS, 'users', request.GET.get('format'))
+
+
+@user_passes_test(is_admin)
+def admin_skills_export(request):
+    """Выгрузка навыков (?format=csv|ndjson) с фильтром ?q= как в списке"""
+    skills = filtered_skills(request.GET.get('q', ''))
+    return export_response(request, skills, SKILL_EXPORT_COLUMNS, 'skills', request.GET.get('format'))
+
+
+@user_passes_test(is_admin)
+def admin_exchanges_export(request):
+    """Выгрузка обменов (?format=csv|ndjson) с фильтром ?status= как в списке"""
+    exchanges = filtered_exchanges(request.GET.get('status', ''))
+    return export_response(request, exchanges, EXCHANGE_EXPORT_COLUMNS, 'exchanges', request.GET.get('format'))
@@ -1,11 +1,12 @@
 from django.urls import path
 from .api_views import (
-    UserListAPIView, UserDetailAPIView,
-    SkillListAPIView, SkillDetailAPIView,
+    UserListAPIView, UserMatchesAPIView, UserDetailAPIView,
+    SkillListAPIView, SkillDetailAPIView, skill_suggest, skill_bulk_create,
     ExchangeRequestListAPIView, ExchangeRequestDetailAPIView,
-    InboxRequestsAPIView, exchange_action,
+    InboxRequestsAPIView, exchange_action, exchange_bulk_action, exchange_counters,
     api_login, api_logout
 )
+from .streams import exchange_events
 
 app_name = 'api'
 
@@ -16,15 +17,23 @@ urlpatterns = [
     
     # Users
     path('users/', UserListAPIView.as_view(), name='user-list'),
+    path('users/matches/', UserMatchesAPIView.as_view(), name='user-matches'),
     path('users/<int:pk>/', UserDetailAPIView.as_view(), name='user-detail'),
     
     # Skills
     path('skills/', SkillListAPIView.as_view(), name='skill-list'),
+    path('skills/suggest/', skill_suggest, name='skill-suggest'),
+    path('skills/bulk/', skill_bulk_create, name='skill-bulk-create'),
     path('skills/<slug:slug>/', SkillDetailAPIView.as_view(), name='skill-detail'),
     
     # Exchange Requests
     path('exchanges/', ExchangeRequestListAPIView.as_view(), name='exchange-list'),
     path('exchanges/inbox/', InboxRequestsAPIView.as_view(), name='exchange-inbox'),
+    path('exchanges/counters/', exchange_counters, name='exchange-counters'),
+    path('exchanges/bulk-action/', exchange_bulk_action, name='exchange-bulk-action'),
     path('exchanges/<int:pk>/', ExchangeRequestDetailAPIView.as_view(), name='exchange-detail'),
     path('exchanges/<int:pk>/action/', exchange_action, name='exchange-action'),
+
+    # Server-Sent Events (served by skillswap.asgi)
+    path('events/', exchange_events, name='events'),
 ]
@@ -1,56 +1,177 @@
-from rest_framework import generics, status, permissions
+from rest_framework import generics, status, permissions, serializers
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from django.db import transaction
-from django.utils import timezone
+from django.utils.decorators import method_decorator
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from .models import Skill, ExchangeRequest
+from . import exchanges
+from .async_views import AsyncListMixin
+from .conditional import (
+    conditional_get, not_modified, set_validators, askill_list_validators, skill_validators, user_validators,
+)
+from .inbox import get_inbox_counters
+from .matching import match_index, load_matches
+from .search import search_users
+from .pagination import AsyncPageNumberPagination, ExchangeKeysetPagination, UserKeysetPagination
+from .permissions import IsModeratorOrReadOnly
+from .skill_index import skill_index, SUGGEST_DEFAULT_LIMIT, SUGGEST_MAX_LIMIT
 from .serializers import (
-    UserSerializer, UserListSerializer, SkillSerializer,
+    UserSerializer, UserListSerializer, UserMatchSerializer, SkillSerializer,
+    SkillSuggestionSerializer, SkillBulkCreateSerializer, InboxCountersSerializer,
     ExchangeRequestSerializer, ExchangeRequestCreateSerializer,
-    ExchangeRequestActionSerializer
+    ExchangeRequestActionSerializer, ExchangeBulkActionSerializer, ExchangeBulkActionResultSerializer
 )
 
 User = get_user_model()
 
 
-class UserListAPIView(generics.ListAPIView):
-    """API endpoint for listing users with search"""
+class ShapedQuerysetMixin:
+    """Loads only what the ``?fields=`` / ``?expand=`` shape of a GET response renders"""
+
+    def shape_queryset(self, queryset):
+        if self.request.method not in ('GET', 'HEAD'):
+            return queryset
+        serializer_class = self.get_serializer_class()
+        # Keyset cursors are built from the ordering columns of the page's boundary rows
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', ())]
+        return serializer_class.setup_queryset(queryset, serializer_class.get_shape(self.request), ordering)
+
+
+MULTI_GET_MAX = 100
+
+
+class MultiGetMixin:
+    """``?ids=1,2,3`` on a list endpoint: those objects in one query, as the detail view renders them.
+
+    The result is ``{"results": [...], "missing": [...]}`` in the requested
+    order; keys that do not exist or are not visible to the user are listed
+    in ``missing``. Visibility comes from ``get_queryset``, so views whose
+    listing is narrower than their detail view check ``is_multi_get()``.
+    """
+    multi_get_param = 'ids'
+    multi_get_field = 'pk'
+
+    def is_multi_get(self) -> bool:
+        return self.request.method == 'GET' and self.multi_get_param in self.request.query_params
+
+    def get_multi_get_keys(self) -> list:
+        raw = self.request.query_params[self.multi_get_param]
+        keys = list(dict.fromkeys(key.strip() for key in raw.split(',') if key.strip()))
+        if self.multi_get_field == 'pk':
+            try:
+                keys = list(dict.fromkeys(int(key) for key in keys))
+            except ValueError:
+                raise serializers.ValidationError({self.multi_get_param: ['Expected comma-separated integers']})
+        if not keys:
+            raise serializers.ValidationError({self.multi_get_param: ['Nothing requested']})
+        if len(keys) > MULTI_GET_MAX:
+            raise serializers.ValidationError({self.multi_get_param: [f'At most {MULTI_GET_MAX} per request']})
+        return keys
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_multi_get():
+            return super().list(request, *args, **kwargs)
+        keys = self.get_multi_get_keys()
+        queryset = self.filter_queryset(self.get_queryset()).filter(**{f'{self.multi_get_field}__in': keys})
+        return self.multi_get_response(keys, {getattr(obj, self.multi_get_field): obj for obj in queryset})
+
+    async def alist(self, request, *args, **kwargs):
+        if not self.is_multi_get():
+            return await super().alist(request, *args, **kwargs)
+        keys = self.get_multi_get_keys()
+        queryset = (await self.aget_queryset()).filter(**{f'{self.multi_get_field}__in': keys})
+        found = {getattr(obj, self.multi_get_field): obj async for obj in queryset.aiterator()}
+        return self.multi_get_response(keys, found, await self.aserialize([found[key] for key in keys if key in found]))
+
+    def multi_get_response(self, keys, found, data=None):
+        if data is None:
+            data = self.get_serializer([found[key] for key in keys if key in found], many=True).data
+        return Response({'results': data, 'missing': [key for key in keys if key not in found]})
+
+
+class UserListAPIView(MultiGetMixin, ShapedQuerysetMixin, AsyncListMixin, generics.ListAPIView):
+    """API endpoint for listing users with search; ``?ids=`` returns users as the detail endpoint does"""
     serializer_class = UserListSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+    def get_serializer_class(self):
+        return UserSerializer if self.is_multi_get() else UserListSerializer
+
+    @property
+    def paginator(self):
+        # Search results are ordered by relevance, plain listings by (username, id)
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            if request is not None and request.query_params.get('search'):
+                self._paginator = AsyncPageNumberPagination()
+            else:
+                self._paginator = UserKeysetPagination()
+        return self._paginator
     
     def get_queryset(self):
-        queryset = User.objects.exclude(id=self.request.user.id).order_by('username')
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(
-                Q(username__icontains=search) |
-                Q(full_name__icontains=search) |
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search)
-            )
-        return queryset
-
-
-class UserDetailAPIView(generics.RetrieveAPIView):
+        if self.is_multi_get():
+            # Same visibility as UserDetailAPIView
+            return self.shape_queryset(User.objects.all())
+        queryset = User.objects.exclude(id=self.request.user.id)
+        search = self.request.query_params.get('search', '')
+        return self.shape_queryset(search_users(queryset, search))
+
+    async def aget_queryset(self):
+        # On SQLite search_users checks once whether the full-text index exists
+        return self.filter_queryset(await sync_to_async(self.get_queryset)())
+
+
+class UserMatchesAPIView(generics.ListAPIView):
+    """API endpoint for reciprocal skill matches of the current user"""
+    serializer_class = UserMatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return match_index.matches_for(self.request.user.pk)
+
+    def list(self, request, *args, **kwargs):
+        matches = self.get_queryset()
+        page = self.paginate_queryset(matches)
+        if page is not None:
+            serializer = self.get_serializer(load_matches(page), many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(load_matches(matches), many=True)
+        return Response(serializer.data)
+
+
+@method_decorator(conditional_get(user_validators), name='get')
+class UserDetailAPIView(ShapedQuerysetMixin, generics.RetrieveAPIView):
     """API endpoint for user details"""
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = User.objects.all()
+
+    def get_queryset(self):
+        return self.shape_queryset(User.objects.all())
 
 
-class SkillListAPIView(generics.ListCreateAPIView):
-    """API endpoint for listing and creating skills"""
+class SkillListAPIView(MultiGetMixin, ShapedQuerysetMixin, AsyncListMixin, generics.ListCreateAPIView):
+    """API endpoint for listing and creating skills; ``?slugs=`` fetches several by slug"""
     serializer_class = SkillSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AsyncPageNumberPagination
+    multi_get_param = 'slugs'
+    multi_get_field = 'slug'
     
     def get_queryset(self):
-        return Skill.objects.all().order_by('name')
+        return self.shape_queryset(Skill.objects.all().order_by('name'))
+
+    async def get(self, request, *args, **kwargs):
+        parts, last_modified = await askill_list_validators(request)
+        etag, response = not_modified(request, parts, last_modified)
+        if response is not None:
+            return response
+        return set_validators(await self.alist(request, *args, **kwargs), etag, last_modified)
     
     def perform_create(self, serializer):
         skill = serializer.save()
@@ -64,17 +185,51 @@ class SkillListAPIView(generics.ListCreateAPIView):
             self.request.user.skills_to_learn.add(skill)
 
 
-class SkillDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def skill_suggest(request):
+    """API endpoint for skill autocomplete by name or slug prefix"""
+    prefix = request.query_params.get('prefix', '')
+    try:
+        limit = int(request.query_params.get('limit', SUGGEST_DEFAULT_LIMIT))
+    except ValueError:
+        limit = SUGGEST_DEFAULT_LIMIT
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    suggestions = skill_index.suggest(prefix, limit)
+    return Response(SkillSuggestionSerializer(suggestions, many=True).data)
+
+
+@swagger_auto_schema(
+    method='post',
+    request_body=SkillBulkCreateSerializer,
+    responses={201: SkillSerializer(many=True), 400: 'Bad Request', 403: 'Forbidden'},
+    tags=['Skills'],
+)
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated, IsModeratorOrReadOnly])
+def skill_bulk_create(request):
+    """API endpoint for importing many skills at once (moderators only)"""
+    serializer = SkillBulkCreateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    created = serializer.save()
+    return Response(SkillSerializer(created, many=True).data, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(conditional_get(skill_validators), name='get')
+class SkillDetailAPIView(ShapedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     """API endpoint for skill details"""
     serializer_class = SkillSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Skill.objects.all()
     lookup_field = 'slug'
 
+    def get_queryset(self):
+        return self.shape_queryset(Skill.objects.all())
+
 
-class ExchangeRequestListAPIView(generics.ListCreateAPIView):
-    """API endpoint for listing and creating exchange requests"""
+class ExchangeRequestListAPIView(MultiGetMixin, ShapedQuerysetMixin, generics.ListCreateAPIView):
+    """API endpoint for listing and creating exchange requests; ``?ids=`` fetches several of them"""
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ExchangeKeysetPagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -83,26 +238,17 @@ class ExchangeRequestListAPIView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         # Return requests where user is sender or receiver
-        return ExchangeRequest.objects.filter(
-            Q(sender=self.request.user) | Q(receiver=self.request.user)
-        ).order_by('-created_at')
+        return self.shape_queryset(ExchangeRequest.objects.involving(self.request.user).order_by('-created_at'))
     
     def perform_create(self, serializer):
-        # Set sender to current user
-        serializer.save(sender=self.request.user)
-        
-        # Deduct points atomically
+        # Set sender to current user and hold the price; the request is rolled back without points
         with transaction.atomic():
-            user = User.objects.select_for_update().get(pk=self.request.user.pk)
-            if user.points < serializer.validated_data['price']:
+            exchange = serializer.save(sender=self.request.user)
+            if not exchange.hold_from_sender():
                 raise serializers.ValidationError("Недостаточно баллов")
-            
-            user.points -= serializer.validated_data['price']
-            user.points_hold += serializer.validated_data['price']
-            user.save(update_fields=['points', 'points_hold'])
 
 
-class ExchangeRequestDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ExchangeRequestDetailAPIView(ShapedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     """API endpoint for exchange request details"""
     serializer_class = ExchangeRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -110,21 +256,28 @@ class ExchangeRequestDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     
     def get_queryset(self):
         # Only allow access to requests where user is sender or receiver
-        return ExchangeRequest.objects.filter(
-            Q(sender=self.request.user) | Q(receiver=self.request.user)
-        )
+        return self.shape_queryset(ExchangeRequest.objects.involving(self.request.user))
 
 
-class InboxRequestsAPIView(generics.ListAPIView):
+class InboxRequestsAPIView(ShapedQuerysetMixin, AsyncListMixin, generics.ListAPIView):
     """API endpoint for incoming requests"""
     serializer_class = ExchangeRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ExchangeKeysetPagination
     
     def get_queryset(self):
-        return ExchangeRequest.objects.filter(
+        return self.shape_queryset(ExchangeRequest.objects.filter(
             receiver=self.request.user,
             status=ExchangeRequest.STATUS_PENDING
-        ).order_by('-created_at')
+        ).order_by('-created_at'))
+
+
+@swagger_auto_schema(method='get', responses={200: InboxCountersSerializer}, tags=['Exchanges'])
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def exchange_counters(request):
+    """API endpoint for inbox badge counters, served from the cache"""
+    return Response(InboxCountersSerializer(get_inbox_counters(request.user.pk)).data)
 
 
 @api_view(['POST'])
@@ -152,43 +305,47 @@ def exchange_action(request, pk):
         if request.user != exchange.receiver:
             return Response({'error': 'Only receiver can accept'}, 
                            status=status.HTTP_403_FORBIDDEN)
-        exchange.status = ExchangeRequest.STATUS_ACCEPTED
-        exchange.save()
+        if not exchanges.accept(exchange):
+            return Response({'error': 'Only pending requests can be accepted'},
+                           status=status.HTTP_409_CONFLICT)
         
     elif action == 'decline':
         if request.user != exchange.receiver:
             return Response({'error': 'Only receiver can decline'}, 
                            status=status.HTTP_403_FORBIDDEN)
-        exchange.status = ExchangeRequest.STATUS_DECLINED
-        exchange.save()
-        
-        # Return points to sender
-        with transaction.atomic():
-            sender = User.objects.select_for_update().get(pk=exchange.sender.pk)
-            sender.points += exchange.price
-            sender.points_hold -= exchange.price
-            sender.save(update_fields=['points', 'points_hold'])
+        # Return points to sender and mark the request declined
+        if not exchanges.decline(exchange):
+            return Response({'error': 'Exchange request is already closed'},
+                           status=status.HTTP_409_CONFLICT)
             
     elif action == 'confirm':
-        if request.user == exchange.sender:
-            exchange.sender_confirmed = True
-            exchange.sender_confirmed_at = timezone.now()
-        elif request.user == exchange.receiver:
-            exchange.receiver_confirmed = True
-            exchange.receiver_confirmed_at = timezone.now()
-        else:
-            return Response({'error': 'Invalid user'}, 
-                           status=status.HTTP_403_FORBIDDEN)
-        
-        exchange.save()
-        
-        # Try to complete the exchange
-        if exchange.try_complete():
+        result = exchanges.confirm(exchange, request.user)
+        if result.completed:
             return Response({'message': 'Exchange completed successfully'})
+        if not result.confirmed:
+            return Response({'error': 'Exchange request is already confirmed or closed'},
+                           status=status.HTTP_409_CONFLICT)
     
     return Response(ExchangeRequestSerializer(exchange).data)
 
 
+@swagger_auto_schema(
+    method='post',
+    request_body=ExchangeBulkActionSerializer,
+    responses={200: ExchangeBulkActionResultSerializer(many=True), 400: 'Bad Request'},
+    tags=['Exchanges'],
+)
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def exchange_bulk_action(request):
+    """API endpoint for applying many exchange actions at once; results follow the request order"""
+    serializer = ExchangeBulkActionSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    items = [(item['id'], item['action']) for item in serializer.validated_data['actions']]
+    results = exchanges.apply_actions(request.user, items)
+    return Response({'results': ExchangeBulkActionResultSerializer(results, many=True).data})
+
+
 @swagger_auto_schema(
     method='post',
     request_body=openapi.Schema(
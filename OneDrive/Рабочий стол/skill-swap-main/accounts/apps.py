@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _install_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .search import install_search_index
+    install_search_index(connections[using])
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(_install_search_index, sender=self)
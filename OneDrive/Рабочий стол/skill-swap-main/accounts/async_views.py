@@ -0,0 +1,66 @@
+"""
+Async read endpoints for DRF views.
+
+Under ASGI a sync view holds a thread for the whole request, including
+every query it waits on. DRF's ``APIView`` is sync only, so
+``AsyncAPIViewMixin`` gives a view an async ``dispatch``: authentication,
+permissions and throttling - and any handler that stays sync, such as the
+POST of a list/create view - run in a thread through ``sync_to_async``,
+while async handlers run on the event loop.
+
+``AsyncListMixin`` is the async ``get`` of a list view. The page is read with
+``aiterator()`` / ``acount()`` (the paginator's ``apaginate_queryset``, see
+``accounts.pagination``); serialization runs in a thread, as list
+serializers may load extra data for the whole page (e.g. point balances).
+"""
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from rest_framework.response import Response
+
+
+class AsyncAPIViewMixin:
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        # APIView.dispatch with the sync steps moved off the event loop
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListMixin(AsyncAPIViewMixin):
+    """``ListModelMixin.list`` on the async ORM; the paginator must provide ``apaginate_queryset``."""
+
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+    async def aget_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.aget_queryset()
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(await self.aserialize(page))
+        return Response(await self.aserialize([obj async for obj in queryset.aiterator()]))
+
+    async def aserialize(self, rows):
+        return await sync_to_async(lambda: self.get_serializer(rows, many=True).data)()
@@ -0,0 +1,113 @@
+"""
+Authentication with cached user lookups.
+
+Both the session backend and the DRF token authenticator read the user from
+a short-lived snapshot in the Django cache instead of querying
+``accounts_user`` (and ``authtoken_token``) on every request. Snapshots are
+dropped by ``accounts.signals`` whenever the user row is saved or deleted
+(password, role, ``is_active``…) and when a token is deleted - right away and
+again once the transaction commits, so a request that read the row before
+the commit cannot leave its copy behind. The TTL bounds how long a change
+made behind the ORM's back can go unnoticed.
+
+Dropping a snapshot only reaches the workers that share the cache, so with
+a per-process cache (``cache_is_shared``) both classes fall back to the
+plain database lookups.
+
+``ModelBackend`` stays in ``AUTHENTICATION_BACKENDS`` after the cached one
+only so that sessions stored with its path still load their user; a failed
+password check here ends ``authenticate()`` so the password is not hashed
+a second time by it.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .models import User
+from .versioning import cache_is_shared
+
+DEFAULT_AUTH_CACHE_TTL = 60
+
+
+def _ttl() -> int:
+    return getattr(settings, 'AUTH_CACHE_TTL', DEFAULT_AUTH_CACHE_TTL)
+
+
+def _user_key(user_id) -> str:
+    return f'accounts:auth:user:{user_id}'
+
+
+def _token_key(key) -> str:
+    # Tokens are credentials: keep them out of cache keys
+    return f'accounts:auth:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def get_cached_user(user_id):
+    """The user with ``user_id`` from the snapshot cache, or ``None`` if there is no such user."""
+    user = cache.get(_user_key(user_id))
+    if user is None:
+        user = User._default_manager.filter(pk=user_id).first()
+        if user is not None:
+            cache.set(_user_key(user_id), user, _ttl())
+    return user
+
+
+def _drop(key) -> None:
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key), robust=True)
+
+
+def invalidate_cached_user(user_id) -> None:
+    _drop(_user_key(user_id))
+
+
+def invalidate_cached_token(key) -> None:
+    _drop(_token_key(key))
+
+
+class CachedModelBackend(ModelBackend):
+    """``ModelBackend`` whose per-request ``get_user`` is served from the cache."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # ModelBackend would check the same row again
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        if not cache_is_shared():
+            return super().get_user(user_id)
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` without the token/user join on cache hits."""
+
+    def authenticate_credentials(self, key):
+        if not cache_is_shared():
+            return super().authenticate_credentials(key)
+        model = self.get_model()
+        user_id = cache.get(_token_key(key))
+        if user_id is None:
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            cache.set_many({_token_key(key): user.pk, _user_key(user.pk): user}, _ttl())
+        else:
+            user = get_cached_user(user_id)
+
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # The key is the token's primary key, so this stands in for the row as request.auth
+        return user, model(key=key, user=user)
@@ -0,0 +1,35 @@
+"""
+Skill catalog version.
+
+One shared counter covers everything derived from the ``Skill`` table: the
+autocomplete index of every worker and the cached catalog fragment of
+``core.views.skill_list``. ``accounts.signals`` bumps it when a skill is
+saved or deleted; code that writes skills without signals (``bulk_create``,
+``QuerySet.update``) calls ``invalidate_skill_catalog`` itself. The bump
+waits for the write to commit: bumped earlier, a concurrent request could
+render the catalog from the old rows under the new version and cache it.
+
+With a per-process cache the bump reaches only the worker that wrote the
+skill, so the cached fragment lives at most ``LOCAL_CACHE_TTL`` seconds there.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .versioning import bump_version, cache_is_shared, get_version, local_cache_ttl
+
+SKILL_CATALOG_VERSION_KEY = 'accounts:skill_catalog:version'
+DEFAULT_SKILL_CATALOG_CACHE_TTL = 3600
+
+
+def catalog_version() -> int:
+    return get_version(SKILL_CATALOG_VERSION_KEY)
+
+
+def catalog_cache_ttl() -> int:
+    """Lifetime of the cached catalog fragment."""
+    ttl = getattr(settings, 'SKILL_CATALOG_CACHE_TTL', DEFAULT_SKILL_CATALOG_CACHE_TTL)
+    return ttl if cache_is_shared() else min(ttl, local_cache_ttl())
+
+
+def invalidate_skill_catalog() -> None:
+    transaction.on_commit(lambda: bump_version(SKILL_CATALOG_VERSION_KEY), robust=True)
@@ -0,0 +1,104 @@
+"""
+Conditional GET for read endpoints.
+
+A view decorated with ``conditional_get(validators)`` first calls
+``validators(request, *args, **kwargs)``, which returns the values the
+response body depends on - usually ``updated_at`` columns read with one
+narrow query - and optionally a ``Last-Modified`` datetime. A request whose
+``If-None-Match`` / ``If-Modified-Since`` still matches gets an empty 304
+without the object being serialized or the template rendered. Responses are
+marked ``private, no-cache``: clients may keep them but revalidate each time.
+
+Works on function views and, through ``method_decorator``, on the ``get``
+of DRF views (the ETag then also covers the negotiated renderer). Views
+that need the object anyway call ``not_modified`` / ``set_validators``
+themselves instead of querying it twice, as do async views (validators
+named ``a…`` are coroutines for them).
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Skill, User
+
+
+def make_etag(parts) -> str:
+    digest = hashlib.md5(repr(tuple(parts)).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request, parts, last_modified=None):
+    """``(etag, response)``: the ETag for ``parts`` and a 304 if the client has it, else ``None``."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    etag = make_etag((*parts, renderer.format if renderer else 'html'))
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return etag, response
+
+
+def set_validators(response, etag, last_modified=None):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_get(validators):
+    """Answer GET/HEAD with 304 when the client's copy is current.
+
+    ``validators`` returns ``(parts, last_modified)``, or ``None`` to skip
+    the check (e.g. the object does not exist and the view should 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            found = validators(request, *args, **kwargs) if request.method in ('GET', 'HEAD') else None
+            if found is None:
+                return view(request, *args, **kwargs)
+            parts, last_modified = found
+            etag, response = not_modified(request, parts, last_modified)
+            if response is not None:
+                return response
+            return set_validators(view(request, *args, **kwargs), etag, last_modified)
+        return wrapper
+    return decorator
+
+
+# Validators of the skill and user read endpoints
+
+async def askill_list_validators(request, *args, **kwargs):
+    # The count catches deletions, which leave the newest updated_at alone
+    found = await Skill.objects.aaggregate(last=Max('updated_at'), count=Count('pk'))
+    return ('skills', found['last'], found['count']), None
+
+
+def skill_validators(request, slug, *args, **kwargs):
+    row = Skill.objects.filter(slug=slug).values_list('pk', 'updated_at').first()
+    if row is None:
+        return None
+    return ('skill', *row), row[1]
+
+
+def _newest_skill(relation):
+    newest = Skill.objects.filter(**{relation: OuterRef('pk')}).order_by('-updated_at').values('updated_at')[:1]
+    return Subquery(newest)
+
+
+def user_validators(request, pk, *args, **kwargs):
+    """A user's row, available points and the newest of the skills the serializer nests."""
+    row = (
+        User.objects.filter(pk=pk).with_balances()
+        .annotate(teach_updated=_newest_skill('teachers'), learn_updated=_newest_skill('learners'))
+        .values_list('pk', 'updated_at', 'ledger_points', 'teach_updated', 'learn_updated')
+        .first()
+    )
+    if row is None:
+        return None
+    return ('user', *row), None
@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from .inbox import get_inbox_counters
+
+
+def inbox_counters(request):
+    """Exchange badge counters of the current user, read from the cache only when a template uses them"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'inbox_counters': SimpleLazyObject(lambda: get_inbox_counters(user.pk))}
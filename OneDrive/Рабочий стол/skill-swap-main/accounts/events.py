@@ -0,0 +1,227 @@
+"""
+Per-user stream of exchange events.
+
+Exchange changes are published once their transaction commits and relayed
+to both participants by the Server-Sent Events view in ``accounts.streams``.
+The broker is chosen with ``EXCHANGE_EVENTS_BACKEND``:
+
+* ``LocalBroker`` (default) hands events to the subscribers of the same
+  process - enough when one ASGI process serves the writes and the streams;
+* ``CacheBroker`` keeps a short per-user event log in the Django cache that
+  subscribers poll, so every process sharing the cache sees every event and
+  clients can resume with ``Last-Event-ID``. Events are numbered with
+  ``cache.incr``, so it needs a cache where that is atomic (Redis,
+  Memcached; see ``accounts.versioning.cache_is_shared``).
+
+A broker has ``publish(user_ids, event)``, called from sync code, and
+``async subscribe(user_id, last_event_id)`` returning a subscription with
+``async get(timeout)`` (an ``(event_id, event)`` pair or ``None``) and
+``close()``.
+"""
+import asyncio
+import itertools
+import threading
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .versioning import cache_is_shared
+
+DEFAULT_BACKEND = 'accounts.events.LocalBroker'
+DEFAULT_EVENT_TTL = 300
+DEFAULT_POLL_INTERVAL = 1.0
+# How long a subscriber waits for an event whose number is taken but not written yet
+DEFAULT_GAP_TIMEOUT = 5.0
+# Events kept for a subscriber that does not read them
+SUBSCRIPTION_BACKLOG = 100
+
+
+class _LocalSubscription:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def offer(self, item) -> None:
+        # publish() runs in whichever thread committed the change
+        try:
+            self._loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            # The event loop of a disconnected client is already closed
+            pass
+
+    def _put(self, item) -> None:
+        if self._queue.qsize() >= SUBSCRIPTION_BACKLOG:
+            # A stalled client loses its oldest events rather than our memory
+            self._queue.get_nowait()
+        self._queue.put_nowait(item)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.broker._unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process fan-out to the subscribers of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+
+    def publish(self, user_ids, event) -> None:
+        item = (next(self._ids), event)
+        with self._lock:
+            subscriptions = [sub for user_id in user_ids for sub in self._subscribers.get(user_id, ())]
+        for subscription in subscriptions:
+            subscription.offer(item)
+
+    async def subscribe(self, user_id, last_event_id=None):
+        subscription = _LocalSubscription(self, user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.user_id, None)
+
+
+def _sequence_key(user_id) -> str:
+    return f'accounts:events:{user_id}:seq'
+
+
+def _event_key(user_id, sequence) -> str:
+    return f'accounts:events:{user_id}:{sequence}'
+
+
+class _CacheSubscription:
+    def __init__(self, broker, user_id, last_seen):
+        self.broker = broker
+        self.user_id = user_id
+        self._last_seen = last_seen
+        self._ready = deque()
+        self._gap_since = None
+
+    def _skip_gaps(self, now) -> bool:
+        # publish() takes a number before it writes the event, so a missing
+        # event is waited for; past the timeout it has expired or was lost
+        if self._gap_since is None:
+            self._gap_since = now
+        return now - self._gap_since >= self.broker.gap_timeout
+
+    async def get(self, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self._ready:
+            sequence = await cache.aget(_sequence_key(self.user_id), 0)
+            if sequence < self._last_seen:
+                # The counter was evicted and restarted
+                self._last_seen = 0
+            if sequence > self._last_seen:
+                first = max(self._last_seen + 1, sequence - SUBSCRIPTION_BACKLOG + 1)
+                keys = {_event_key(self.user_id, number): number for number in range(first, sequence + 1)}
+                found = await cache.aget_many(keys)
+                for key, number in keys.items():
+                    if key in found:
+                        self._ready.append((number, found[key]))
+                        self._gap_since = None
+                    elif not self._skip_gaps(loop.time()):
+                        break
+                    self._last_seen = number
+                if self._ready:
+                    continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.broker.poll_interval, remaining))
+        return self._ready.popleft()
+
+    def close(self) -> None:
+        pass
+
+
+class CacheBroker:
+    """Per-user event log in the shared cache, polled by subscribers."""
+
+    def __init__(self):
+        if not cache_is_shared():
+            raise ImproperlyConfigured(
+                'CacheBroker needs a cache shared by all workers with an atomic incr (Redis, Memcached)'
+            )
+        self.ttl = getattr(settings, 'EXCHANGE_EVENTS_TTL', DEFAULT_EVENT_TTL)
+        self.poll_interval = getattr(settings, 'EXCHANGE_EVENTS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+        self.gap_timeout = getattr(settings, 'EXCHANGE_EVENTS_GAP_TIMEOUT', DEFAULT_GAP_TIMEOUT)
+
+    def publish(self, user_ids, event) -> None:
+        for user_id in user_ids:
+            key = _sequence_key(user_id)
+            cache.add(key, 0, timeout=None)
+            try:
+                sequence = cache.incr(key)
+            except ValueError:
+                sequence = 1
+                cache.set(key, sequence, timeout=None)
+            cache.set(_event_key(user_id, sequence), event, self.ttl)
+
+    async def subscribe(self, user_id, last_event_id=None):
+        if last_event_id is not None and str(last_event_id).isdigit():
+            last_seen = int(last_event_id)
+        else:
+            last_seen = await cache.aget(_sequence_key(user_id), 0)
+        return _CacheSubscription(self, user_id, last_seen)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'EXCHANGE_EVENTS_BACKEND', DEFAULT_BACKEND))()
+
+
+def event_type(old_state, new_state):
+    """``exchange.<what happened>`` for a change between two ``inbox.exchange_state`` tuples."""
+    if old_state is None:
+        return 'exchange.created'
+    if new_state is None:
+        return 'exchange.deleted'
+    if old_state[0] != new_state[0]:
+        return f'exchange.{new_state[0]}'
+    if old_state[3:] != new_state[3:]:
+        return 'exchange.confirmed'
+    return None
+
+
+def publish_exchange_event(exchange, kind) -> None:
+    """Send ``kind`` to both participants after the current transaction commits."""
+    event = {
+        'type': kind,
+        'exchange': {
+            'id': exchange.pk,
+            'status': exchange.status,
+            'sender': exchange.sender_id,
+            'receiver': exchange.receiver_id,
+            'sender_confirmed': exchange.sender_confirmed,
+            'receiver_confirmed': exchange.receiver_confirmed,
+        },
+    }
+    user_ids = {exchange.sender_id, exchange.receiver_id}
+    transaction.on_commit(lambda: get_broker().publish(user_ids, event), robust=True)
+
+
+def publish_exchange_change(exchange, old_state, new_state) -> None:
+    kind = event_type(old_state, new_state)
+    if kind is not None:
+        publish_exchange_event(exchange, kind)
@@ -0,0 +1,230 @@
+"""
+Exchange state transitions.
+
+Every transition is a single conditional ``UPDATE … WHERE id = %s AND
+status = %s`` (plus the confirmation flag for ``confirm``). Only the request
+whose UPDATE changed the row goes on to post points, so racing clicks cannot
+refund or complete an exchange twice. ``queryset.update()`` sends no
+signals, so what ``accounts.signals`` does for saved exchanges (inbox
+counters, dashboard stats, exchange events) is done here.
+
+Callers check who may perform a transition; the functions only check that
+the exchange is still in a state the transition starts from.
+"""
+from dataclasses import dataclass
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import ledger
+from .events import publish_exchange_change
+from .inbox import exchange_state, record_exchange_change
+from .models import ExchangeRequest
+from .stats import invalidate_dashboard_stats
+
+ACCEPT = 'accept'
+DECLINE = 'decline'
+CONFIRM = 'confirm'
+ACTIONS = (ACCEPT, DECLINE, CONFIRM)
+
+OPEN_STATUSES = (ExchangeRequest.STATUS_PENDING, ExchangeRequest.STATUS_ACCEPTED)
+STATE_ATTNAMES = ('status', 'sender_id', 'receiver_id', 'sender_confirmed', 'receiver_confirmed')
+
+
+@dataclass(frozen=True)
+class Confirmation:
+    confirmed: bool
+    completed: bool
+
+
+def _swap(exchange, expected: dict, **changes) -> bool:
+    """Apply ``changes`` if the row still matches ``expected``; returns whether it did.
+
+    On success the state fields of ``exchange`` are reloaded (the row is
+    locked by the UPDATE until the transaction ends) and the inbox counters
+    are moved from the state described by ``expected`` to the new one.
+    """
+    if not ExchangeRequest.objects.filter(pk=exchange.pk, **expected).update(**changes):
+        return False
+    exchange.refresh_from_db(fields=[*STATE_ATTNAMES, *changes])
+    new = exchange_state(exchange)
+    previous = dict(zip(STATE_ATTNAMES, new))
+    previous.update((name, value) for name, value in expected.items() if name in previous)
+    old = tuple(previous.values())
+    record_exchange_change(old, new)
+    publish_exchange_change(exchange, old, new)
+    exchange._inbox_state = new
+    if 'status' in changes:
+        transaction.on_commit(invalidate_dashboard_stats)
+    return True
+
+
+def accept(exchange) -> bool:
+    """pending → accepted."""
+    return _swap(
+        exchange, {'status': ExchangeRequest.STATUS_PENDING},
+        status=ExchangeRequest.STATUS_ACCEPTED,
+    )
+
+
+def decline(exchange) -> bool:
+    """pending/accepted → declined, releasing the sender's hold."""
+    if exchange.status not in OPEN_STATUSES:
+        return False
+    with transaction.atomic():
+        # The row may have been accepted since it was loaded; both open
+        # statuses may be declined, so swap from the one stored now
+        current = (
+            ExchangeRequest.objects.select_for_update()
+            .filter(pk=exchange.pk).values_list('status', flat=True).first()
+        )
+        if current not in OPEN_STATUSES:
+            return False
+        if not _swap(exchange, {'status': current}, status=ExchangeRequest.STATUS_DECLINED):
+            return False
+        if exchange.price > 0:
+            ledger.release(exchange)
+    exchange._forget_balances()
+    return True
+
+
+def complete(exchange) -> bool:
+    """Settle an exchange both sides have confirmed; returns whether this call completed it."""
+    if exchange.status not in OPEN_STATUSES or not (exchange.sender_confirmed and exchange.receiver_confirmed):
+        return False
+    with transaction.atomic():
+        completed = _swap(
+            exchange,
+            {'status': exchange.status, 'sender_confirmed': True, 'receiver_confirmed': True},
+            status=ExchangeRequest.STATUS_COMPLETED,
+        )
+        if not completed:
+            return False
+        # Only the sender is debited, so only the sender's balance is locked
+        ledger.lock_balance(exchange.sender_id)
+        ledger.settle(exchange)
+    exchange._forget_balances()
+    return True
+
+
+def confirm(exchange, user) -> Confirmation:
+    """Record ``user``'s confirmation of the session and complete the exchange if both sides did."""
+    if user.pk == exchange.sender_id:
+        side = 'sender'
+    elif user.pk == exchange.receiver_id:
+        side = 'receiver'
+    else:
+        raise ValueError(f'User {user.pk} does not take part in exchange {exchange.pk}')
+    with transaction.atomic():
+        confirmed = _swap(
+            exchange,
+            {'status__in': OPEN_STATUSES, f'{side}_confirmed': False},
+            **{f'{side}_confirmed': True, f'{side}_confirmed_at': timezone.now()},
+        )
+        completed = complete(exchange)
+    return Confirmation(confirmed, completed)
+
+
+def _refusal(exchange, user, action) -> str:
+    """Why ``user`` cannot apply ``action`` to ``exchange`` as loaded, or ``''``."""
+    if exchange is None:
+        return 'Exchange request not found'
+    if action in (ACCEPT, DECLINE) and user.pk != exchange.receiver_id:
+        return f'Only receiver can {action}'
+    if action == ACCEPT and exchange.status != ExchangeRequest.STATUS_PENDING:
+        return 'Only pending requests can be accepted'
+    if action == DECLINE and exchange.status not in OPEN_STATUSES:
+        return 'Exchange request is already closed'
+    if action == CONFIRM:
+        side = 'sender' if user.pk == exchange.sender_id else 'receiver'
+        if exchange.status not in OPEN_STATUSES or getattr(exchange, f'{side}_confirmed'):
+            return 'Exchange request is already confirmed or closed'
+    return ''
+
+
+def _update_all(exchanges, expected: dict, **changes) -> None:
+    if not exchanges:
+        return
+    updated = ExchangeRequest.objects.filter(pk__in=[ex.pk for ex in exchanges], **expected).update(**changes)
+    if updated != len(exchanges):
+        # The rows are locked, so this means the lock was not honoured
+        raise DatabaseError(f'{len(exchanges) - updated} exchange(s) changed during a bulk {changes}')
+    for exchange in exchanges:
+        for name, value in changes.items():
+            setattr(exchange, name, value)
+
+
+def apply_actions(user, items) -> list:
+    """Apply many ``(exchange_id, action)`` pairs of ``user`` in one transaction.
+
+    Ownership and state of the whole batch are read with one locking query;
+    every transition is then one UPDATE for all exchanges it applies to, and
+    the holds of declined exchanges are released with a single INSERT.
+    Returns one result dict per item, in input order.
+    """
+    results = []
+    with transaction.atomic():
+        found = ExchangeRequest.objects.involving(user).select_for_update().in_bulk([pk for pk, _action in items])
+        before = {pk: exchange_state(exchange) for pk, exchange in found.items()}
+        batches = {ACCEPT: [], DECLINE: [], 'sender': [], 'receiver': []}
+        seen = set()
+        for pk, action in items:
+            exchange = found.get(pk)
+            error = 'Duplicate exchange request in batch' if pk in seen else _refusal(exchange, user, action)
+            seen.add(pk)
+            results.append({'id': pk, 'action': action, 'error': error, 'exchange': exchange})
+            if error:
+                continue
+            if action == CONFIRM:
+                batches['sender' if user.pk == exchange.sender_id else 'receiver'].append(exchange)
+            else:
+                batches[action].append(exchange)
+
+        now = timezone.now()
+        _update_all(
+            batches[ACCEPT], {'status': ExchangeRequest.STATUS_PENDING},
+            status=ExchangeRequest.STATUS_ACCEPTED,
+        )
+        _update_all(batches[DECLINE], {'status__in': OPEN_STATUSES}, status=ExchangeRequest.STATUS_DECLINED)
+        for side in ('sender', 'receiver'):
+            _update_all(
+                batches[side], {'status__in': OPEN_STATUSES, f'{side}_confirmed': False},
+                **{f'{side}_confirmed': True, f'{side}_confirmed_at': now},
+            )
+        completing = [
+            exchange for exchange in batches['sender'] + batches['receiver']
+            if exchange.sender_confirmed and exchange.receiver_confirmed
+        ]
+        _update_all(
+            completing, {'status__in': OPEN_STATUSES, 'sender_confirmed': True, 'receiver_confirmed': True},
+            status=ExchangeRequest.STATUS_COMPLETED,
+        )
+
+        ledger.release_many([exchange for exchange in batches[DECLINE] if exchange.price > 0])
+        # Sorted so that concurrent batches lock shared senders in the same order
+        for sender_id in sorted({exchange.sender_id for exchange in completing}):
+            ledger.lock_balance(sender_id)
+        for exchange in completing:
+            ledger.settle(exchange)
+
+        status_changed = False
+        for pk, exchange in found.items():
+            after = exchange_state(exchange)
+            if after != before[pk]:
+                record_exchange_change(before[pk], after)
+                publish_exchange_change(exchange, before[pk], after)
+                exchange._inbox_state = after
+                status_changed = status_changed or exchange.status != before[pk][0]
+        if status_changed:
+            transaction.on_commit(invalidate_dashboard_stats)
+
+    return [
+        {
+            'id': result['id'],
+            'action': result['action'],
+            'ok': not result['error'],
+            'status': result['exchange'].status if result['exchange'] is not None else None,
+            'error': result['error'],
+        }
+        for result in results
+    ]
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from .models import User, Skill, ExchangeRequest
+from .widgets import SkillAutocompleteWidget
 
 
 class RegisterForm(UserCreationForm):
@@ -32,10 +33,10 @@ class LoginForm(AuthenticationForm):
 
 class ProfileForm(forms.ModelForm):
     skills_can_teach = forms.ModelMultipleChoiceField(
-        queryset=Skill.objects.all(), required=False, widget=forms.SelectMultiple(attrs={"size": 8})
+        queryset=Skill.objects.all(), required=False, widget=SkillAutocompleteWidget()
     )
     skills_to_learn = forms.ModelMultipleChoiceField(
-        queryset=Skill.objects.all(), required=False, widget=forms.SelectMultiple(attrs={"size": 8})
+        queryset=Skill.objects.all(), required=False, widget=SkillAutocompleteWidget()
     )
 
     class Meta:
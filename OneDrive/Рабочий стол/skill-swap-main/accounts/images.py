@@ -0,0 +1,286 @@
+"""
+Thumbnails for avatars and skill photos.
+
+Every new upload is queued as an ``ImageTask``. Processing re-encodes the
+original without metadata (EXIF, ICC profile, comments) and no larger than
+``IMAGE_MAX_DIMENSION``, then writes fixed-size WebP and JPEG thumbnails to
+a ``thumbs/`` directory next to it. Every written name carries a digest of
+its content (``skillswap.media.hashed_name``), so media responses for them
+can be cached as immutable. The result is stored on the row in the
+``<field>_variants`` JSON::
+
+    {"source": "avatars/me.3f2a….jpg", "sizes": {"64": {"webp": "avatars/thumbs/me_64.9c1e….webp", "jpeg": …}}}
+
+Uploads up to ``IMAGE_INLINE_MAX_BYTES`` are processed as soon as the upload
+commits, larger ones by ``manage.py process_images``. Until then ``source``
+differs from the field and pages fall back to the original.
+"""
+import io
+import logging
+import posixpath
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from skillswap.media import hashed_name
+
+from .models import ImageTask
+
+logger = logging.getLogger('accounts')
+
+
+@dataclass(frozen=True)
+class ImageSpec:
+    sizes: tuple  # CSS pixels; the next size up serves 2x screens
+    crop: bool  # square crop (avatars) or scale to the height (photos)
+
+
+IMAGE_SPECS = {
+    ('accounts.user', 'avatar'): ImageSpec(sizes=(48, 64, 96, 128), crop=True),
+    ('accounts.skill', 'photo'): ImageSpec(sizes=(180, 360), crop=False),
+}
+
+# Thumbnail formats: variants key -> (Pillow format, extension, MIME type)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+# Originals keep their format when it is one of these, PNG otherwise
+ORIGINAL_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+DEFAULT_MAX_DIMENSION = 2048
+DEFAULT_INLINE_MAX_BYTES = 1024 * 1024
+DEFAULT_QUALITY = 82
+DEFAULT_BATCH_SIZE = 20
+MAX_ATTEMPTS = 3
+
+
+def variants_field(field: str) -> str:
+    return f'{field}_variants'
+
+
+def image_fields(model) -> list:
+    return [field for label, field in IMAGE_SPECS if label == model._meta.label_lower]
+
+
+def ready_variants(instance, field) -> dict:
+    """``{size: {format: name}}`` when the thumbnails belong to the current file, else ``{}``."""
+    name = getattr(instance, field).name
+    variants = getattr(instance, variants_field(field)) or {}
+    if not name or variants.get('source') != name:
+        return {}
+    return {int(size): files for size, files in variants.get('sizes', {}).items()}
+
+
+def pick(variants: dict, size: int):
+    """The smallest thumbnail size that covers ``size`` pixels (the largest one otherwise)."""
+    if not variants:
+        return None
+    covering = [candidate for candidate in variants if candidate >= size]
+    return min(covering) if covering else max(variants)
+
+
+def thumbnail_url(instance, field, size: int, fmt: str = 'jpeg') -> str:
+    """URL of the thumbnail for ``size`` CSS pixels, or of the original while none is ready."""
+    file = getattr(instance, field)
+    if not file:
+        return ''
+    variants = ready_variants(instance, field)
+    chosen = pick(variants, size)
+    if chosen is None:
+        return file.url
+    return file.storage.url(variants[chosen][fmt])
+
+
+def srcset(instance, field, size: int, fmt: str = 'jpeg') -> str:
+    """``srcset`` with 1x and 2x candidates for an image shown at ``size`` CSS pixels."""
+    variants = ready_variants(instance, field)
+    storage = getattr(instance, field).storage
+    candidates = []
+    for density in (1, 2):
+        chosen = pick(variants, size * density)
+        if chosen is not None and chosen not in [taken for taken, _ in candidates]:
+            candidates.append((chosen, f'{storage.url(variants[chosen][fmt])} {density}x'))
+    return ', '.join(candidate for _, candidate in candidates)
+
+
+def queue_image(instance, field) -> None:
+    """Queue thumbnails for ``instance.<field>`` if the file changed since they were built."""
+    file = getattr(instance, field)
+    name = file.name or ''
+    if name == (getattr(instance, variants_field(field)) or {}).get('source', ''):
+        return
+    task = ImageTask.objects.create(
+        model=instance._meta.label_lower, object_id=instance.pk, field=field, source=name,
+    )
+    try:
+        small = not name or file.size <= getattr(settings, 'IMAGE_INLINE_MAX_BYTES', DEFAULT_INLINE_MAX_BYTES)
+    except (OSError, ValueError):
+        small = False
+    if small:
+        transaction.on_commit(lambda: process_task(task.pk), robust=True)
+
+
+def _flatten(image):
+    """RGB copy of ``image`` with transparency composed over white (for JPEG)."""
+    rgba = image.convert('RGBA')
+    background = Image.new('RGB', rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def _encode(image, fmt: str) -> bytes:
+    if fmt == 'JPEG':
+        image = _flatten(image) if image.mode != 'RGB' else image
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    # No exif/icc_profile/pnginfo arguments: the metadata is dropped
+    image.save(buffer, fmt, quality=getattr(settings, 'IMAGE_QUALITY', DEFAULT_QUALITY), optimize=True)
+    return buffer.getvalue()
+
+
+def _resize(image, size: int, crop: bool):
+    if crop:
+        side = min(size, *image.size)
+        return ImageOps.fit(image, (side, side), Image.LANCZOS)
+    thumb = image.copy()
+    thumb.thumbnail((size * 3, size), Image.LANCZOS)
+    return thumb
+
+
+def _save(storage, name: str, content: bytes) -> str:
+    return storage.save(hashed_name(name, content), ContentFile(content))
+
+
+def build_derivatives(storage, source: str, spec: ImageSpec):
+    """Write the cleaned original and its thumbnails; returns ``(original, variants, written)``."""
+    with storage.open(source, 'rb') as fh:
+        image = Image.open(fh)
+        original_format = image.format
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    max_dimension = getattr(settings, 'IMAGE_MAX_DIMENSION', DEFAULT_MAX_DIMENSION)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    directory, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    fmt = original_format if original_format in ORIGINAL_FORMATS else 'PNG'
+    written = []
+    try:
+        original = _save(storage, posixpath.join(directory, f'{stem}.{ORIGINAL_FORMATS[fmt]}'), _encode(image, fmt))
+        written.append(original)
+        sizes = {}
+        for size in spec.sizes:
+            thumb = _resize(image, size, spec.crop)
+            sizes[str(size)] = {}
+            for key, (thumb_format, extension, _mime) in FORMATS.items():
+                name = _save(
+                    storage, posixpath.join(directory, 'thumbs', f'{stem}_{size}.{extension}'),
+                    _encode(thumb, thumb_format),
+                )
+                written.append(name)
+                sizes[str(size)][key] = name
+    except Exception:
+        _delete(storage, written)
+        raise
+    return original, {'source': original, 'sizes': sizes}, written
+
+
+def _delete(storage, names) -> None:
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError as exc:
+            logger.warning(f'Could not delete {name}: {exc}')
+
+
+def _variant_files(variants) -> list:
+    return [name for files in (variants or {}).get('sizes', {}).values() for name in files.values()]
+
+
+def _process(task) -> None:
+    model = apps.get_model(task.model)
+    field = task.field
+    vfield = variants_field(field)
+    storage = model._meta.get_field(field).storage
+    current = model._default_manager.filter(pk=task.object_id).values_list(field, flat=True).first()
+    if (current or '') != task.source:
+        # Deleted, or replaced by a newer upload with its own task
+        return
+
+    if task.source:
+        original, variants, written = build_derivatives(storage, task.source, IMAGE_SPECS[(task.model, field)])
+    else:
+        original, variants, written = '', {}, []
+
+    try:
+        with transaction.atomic():
+            instance = model._default_manager.select_for_update().filter(
+                pk=task.object_id, **{field: task.source},
+            ).first()
+            if instance is None:
+                # Replaced while the thumbnails were being built
+                _delete(storage, written)
+                return
+            stale = _variant_files(getattr(instance, vfield))
+            if task.source and original != task.source:
+                stale.append(task.source)
+            setattr(instance, field, original)
+            setattr(instance, vfield, variants)
+            # A regular save, so the signal handlers drop whatever caches show the image
+            instance.save(update_fields=[field, vfield])
+    except Exception:
+        _delete(storage, written)
+        raise
+    transaction.on_commit(lambda: _delete(storage, stale))
+
+
+def process_task(task_id):
+    """Process one pending task unless another worker holds it.
+
+    Returns the task status afterwards, or ``None`` if it was not run.
+    """
+    with transaction.atomic():
+        task = ImageTask.objects.select_for_update(skip_locked=True).filter(
+            pk=task_id, status=ImageTask.STATUS_PENDING,
+        ).first()
+        if task is None:
+            return None
+        task.attempts += 1
+        try:
+            with transaction.atomic():
+                _process(task)
+        except Exception as exc:
+            task.last_error = str(exc)
+            if task.attempts >= MAX_ATTEMPTS:
+                task.status = ImageTask.STATUS_FAILED
+                logger.error(f'Image task {task.pk} failed permanently: {exc}')
+            else:
+                logger.warning(f'Image task {task.pk} failed (attempt {task.attempts}): {exc}')
+        else:
+            task.status = ImageTask.STATUS_DONE
+            task.processed_at = timezone.now()
+            task.last_error = ''
+        task.save(update_fields=['status', 'attempts', 'last_error', 'processed_at'])
+    return task.status
+
+
+def process_pending(batch_size=None):
+    """Process up to ``batch_size`` pending tasks. Returns ``(done, failed)`` attempt counts."""
+    batch_size = batch_size or getattr(settings, 'IMAGE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    done = failed = 0
+    task_ids = list(
+        ImageTask.objects.filter(status=ImageTask.STATUS_PENDING).values_list('pk', flat=True)[:batch_size]
+    )
+    for task_id in task_ids:
+        status = process_task(task_id)
+        if status == ImageTask.STATUS_DONE:
+            done += 1
+        elif status is not None:
+            failed += 1
+    return done, failed
@@ -0,0 +1,128 @@
+"""
+Per-user exchange counters for navigation badges.
+
+Every active exchange puts each of its two participants into at most one
+bucket:
+
+* ``pending_incoming`` - I received it and have not answered yet;
+* ``awaiting_my_confirmation`` - it was accepted and I have not confirmed the session;
+* ``awaiting_other_side`` - I sent it and it is unanswered, or I confirmed
+  and the other participant has not.
+
+The counters live in the cache as one integer per user and bucket. A miss
+is filled with one aggregate query; after that ``accounts.signals`` moves
+exchanges between buckets with ``incr``/``decr`` once the transaction that
+changed them commits, so polling the badges never reads the exchange table.
+
+The moves are exact only with a cache every worker shares. With a
+per-process cache (LocMemCache) they reach the writing worker alone and the
+others may show stale badges; there the counters are kept for at most
+``LOCAL_CACHE_TTL`` seconds and then recomputed, which bounds the drift.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import ExchangeRequest
+from .versioning import cache_is_shared, local_cache_ttl
+
+PENDING_INCOMING = 'pending_incoming'
+AWAITING_MY_CONFIRMATION = 'awaiting_my_confirmation'
+AWAITING_OTHER_SIDE = 'awaiting_other_side'
+INBOX_COUNTERS = (PENDING_INCOMING, AWAITING_MY_CONFIRMATION, AWAITING_OTHER_SIDE)
+
+DEFAULT_INBOX_COUNTERS_TTL = 300
+
+
+def _key(user_id, counter) -> str:
+    return f'accounts:inbox:{user_id}:{counter}'
+
+
+def exchange_state(exchange) -> tuple:
+    """The fields that decide the buckets, as stored before/after a change."""
+    return (
+        exchange.status, exchange.sender_id, exchange.receiver_id,
+        exchange.sender_confirmed, exchange.receiver_confirmed,
+    )
+
+
+def buckets(state) -> dict:
+    """``{user_id: counter}`` for the participants an exchange in ``state`` is counted for."""
+    if state is None:
+        return {}
+    status, sender_id, receiver_id, sender_confirmed, receiver_confirmed = state
+    if status == ExchangeRequest.STATUS_PENDING:
+        return {receiver_id: PENDING_INCOMING, sender_id: AWAITING_OTHER_SIDE}
+    if status == ExchangeRequest.STATUS_ACCEPTED:
+        found = {}
+        for user_id, mine, theirs in (
+            (sender_id, sender_confirmed, receiver_confirmed),
+            (receiver_id, receiver_confirmed, sender_confirmed),
+        ):
+            if not mine:
+                found[user_id] = AWAITING_MY_CONFIRMATION
+            elif not theirs:
+                found[user_id] = AWAITING_OTHER_SIDE
+        return found
+    return {}
+
+
+def compute_inbox_counters(user_id) -> dict:
+    accepted = Q(status=ExchangeRequest.STATUS_ACCEPTED)
+    pending = Q(status=ExchangeRequest.STATUS_PENDING)
+    as_sender, as_receiver = Q(sender_id=user_id), Q(receiver_id=user_id)
+    return ExchangeRequest.objects.involving(user_id).aggregate(**{
+        PENDING_INCOMING: Count('id', filter=pending & as_receiver),
+        AWAITING_MY_CONFIRMATION: Count('id', filter=accepted & (
+            (as_sender & Q(sender_confirmed=False)) | (as_receiver & Q(receiver_confirmed=False))
+        )),
+        AWAITING_OTHER_SIDE: Count('id', filter=(pending & as_sender) | (accepted & (
+            (as_sender & Q(sender_confirmed=True, receiver_confirmed=False))
+            | (as_receiver & Q(receiver_confirmed=True, sender_confirmed=False))
+        ))),
+    })
+
+
+def get_inbox_counters(user_id) -> dict:
+    keys = {counter: _key(user_id, counter) for counter in INBOX_COUNTERS}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        return {counter: max(cached[key], 0) for counter, key in keys.items()}
+    counters = compute_inbox_counters(user_id)
+    ttl = getattr(settings, 'INBOX_COUNTERS_CACHE_TTL', DEFAULT_INBOX_COUNTERS_TTL)
+    if not cache_is_shared():
+        ttl = min(ttl, local_cache_ttl())
+    for counter, key in keys.items():
+        # add() keeps values a concurrent commit may already have adjusted
+        cache.add(key, counters[counter], ttl)
+    return counters
+
+
+def _apply(changes) -> None:
+    for (user_id, counter), delta in changes.items():
+        if not delta:
+            continue
+        try:
+            if delta > 0:
+                cache.incr(_key(user_id, counter), delta)
+            else:
+                cache.decr(_key(user_id, counter), -delta)
+        except ValueError:
+            # Not cached: the next read computes it from the table
+            pass
+
+
+def record_exchange_change(old_state, new_state) -> None:
+    """Move the exchange between buckets after the current transaction commits."""
+    changes = {}
+    for user_id, counter in buckets(old_state).items():
+        changes[(user_id, counter)] = changes.get((user_id, counter), 0) - 1
+    for user_id, counter in buckets(new_state).items():
+        changes[(user_id, counter)] = changes.get((user_id, counter), 0) + 1
+    if any(changes.values()):
+        transaction.on_commit(lambda: _apply(changes))
+
+
+def invalidate_inbox_counters(user_ids) -> None:
+    cache.delete_many([_key(user_id, counter) for user_id in user_ids for counter in INBOX_COUNTERS])
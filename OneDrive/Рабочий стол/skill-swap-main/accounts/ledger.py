@@ -0,0 +1,190 @@
+"""
+Append-only double-entry points ledger.
+
+Every balance change is a posting: ``PointsEntry`` legs that share a ``txn``
+and sum to zero. A user's ``points`` / ``points_hold`` are the
+``available`` / ``hold`` accounts; points enter and leave circulation
+through the ``system`` account.
+
+Balances are read as the ``PointsBalance`` snapshot plus the entries posted
+after it (``UserQuerySet.with_balances``), and ``manage.py snapshot_balances``
+periodically rolls entries into the snapshots. Credits are plain inserts;
+only a debit of available points locks the debited user's snapshot row to
+check that the points are there, so a popular receiver is never a hotspot.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import PointsBalance, PointsEntry, User
+
+INITIAL_POINTS = 20
+COMPLETION_BONUS = 10
+# Entries younger than this may belong to transactions still in flight
+SNAPSHOT_LAG = timedelta(seconds=60)
+
+AVAILABLE = PointsEntry.ACCOUNT_AVAILABLE
+HOLD = PointsEntry.ACCOUNT_HOLD
+SYSTEM = PointsEntry.ACCOUNT_SYSTEM
+
+
+@dataclass(frozen=True)
+class Balance:
+    points: int
+    points_hold: int
+
+
+def _entries(kind, legs, exchange) -> list:
+    legs = [leg for leg in legs if leg[2]]
+    if sum(amount for _user_id, _account, amount in legs) != 0:
+        raise ValueError(f'Unbalanced {kind} posting: {legs}')
+    txn = uuid.uuid4()
+    return [
+        PointsEntry(txn=txn, user_id=user_id, account=account, kind=kind, exchange=exchange, amount=amount)
+        for user_id, account, amount in legs
+    ]
+
+
+def post(*postings, exchange=None) -> None:
+    """Insert postings in one statement.
+
+    Each posting is ``(kind, legs)`` with legs ``(user_id, account, amount)``;
+    zero legs are dropped and the remaining amounts must sum to zero.
+    """
+    entries = [entry for kind, legs in postings for entry in _entries(kind, legs, exchange)]
+    if entries:
+        PointsEntry.objects.bulk_create(entries)
+
+
+def balance_of(user_id) -> Balance:
+    points, points_hold = (
+        User.objects.filter(pk=user_id).with_balances()
+        .values_list('ledger_points', 'ledger_points_hold').get()
+    )
+    return Balance(points, points_hold)
+
+
+def lock_balance(user_id) -> None:
+    """Serialize debits of one user's points until the end of the transaction."""
+    PointsBalance.objects.select_for_update().get_or_create(user_id=user_id)
+
+
+def open_account(user, points: int) -> None:
+    PointsBalance.objects.create(user=user)
+    post((PointsEntry.KIND_OPENING, [(user.pk, AVAILABLE, points), (None, SYSTEM, -points)]))
+
+
+def adjust(user, points: int) -> None:
+    """Bring the user's available balance to ``points`` with an ``adjust`` entry."""
+    with transaction.atomic():
+        lock_balance(user.pk)
+        delta = points - balance_of(user.pk).points
+        post((PointsEntry.KIND_ADJUST, [(user.pk, AVAILABLE, delta), (None, SYSTEM, -delta)]))
+
+
+def hold(exchange) -> None:
+    """Move the price from the sender's available points to hold (caller checks funds)."""
+    sender = exchange.sender_id
+    post(
+        (PointsEntry.KIND_HOLD, [(sender, AVAILABLE, -exchange.price), (sender, HOLD, exchange.price)]),
+        exchange=exchange,
+    )
+
+
+def release(exchange) -> None:
+    release_many([exchange])
+
+
+def release_many(exchanges) -> None:
+    """Return the holds of many exchanges to their senders in one INSERT.
+
+    Releases only credit available points, so no balance is locked.
+    """
+    entries = [
+        entry
+        for exchange in exchanges
+        for entry in _entries(PointsEntry.KIND_RELEASE, [
+            (exchange.sender_id, HOLD, -exchange.price),
+            (exchange.sender_id, AVAILABLE, exchange.price),
+        ], exchange)
+    ]
+    if entries:
+        PointsEntry.objects.bulk_create(entries)
+
+
+def settle(exchange) -> None:
+    """Completion postings; the caller holds the sender's balance lock."""
+    sender, receiver = exchange.sender_id, exchange.receiver_id
+    amount = min(max(balance_of(sender).points_hold, 0), max(exchange.price, 0))
+    post(
+        (PointsEntry.KIND_TRANSFER, [(sender, HOLD, -amount), (receiver, AVAILABLE, amount)]),
+        # Completion also charges the price from the sender's available points
+        (PointsEntry.KIND_CHARGE, [(sender, AVAILABLE, -amount), (None, SYSTEM, amount)]),
+        (PointsEntry.KIND_BONUS, [
+            (sender, AVAILABLE, COMPLETION_BONUS),
+            (receiver, AVAILABLE, COMPLETION_BONUS),
+            (None, SYSTEM, -2 * COMPLETION_BONUS),
+        ]),
+        exchange=exchange,
+    )
+
+
+def attach_balances(users) -> None:
+    """Load balances for already fetched users in one query."""
+    pending = {user.pk: user for user in users if user is not None and 'ledger_points' not in user.__dict__}
+    if not pending:
+        return
+    rows = User.objects.filter(pk__in=pending).with_balances().values_list('pk', 'ledger_points', 'ledger_points_hold')
+    for pk, points, points_hold in rows:
+        pending[pk].ledger_points = points
+        pending[pk].ledger_points_hold = points_hold
+
+
+def take_snapshots(lag=SNAPSHOT_LAG) -> int:
+    """Roll settled entries into ``PointsBalance``; returns the number of users updated."""
+    cutoff = PointsEntry.objects.filter(created_at__lte=timezone.now() - lag).aggregate(last=Max('id'))['last']
+    if cutoff is None:
+        return 0
+    since = PointsBalance.objects.filter(user=OuterRef('user')).values('last_entry_id')
+    unsettled = PointsEntry.objects.filter(
+        user__isnull=False,
+        id__lte=cutoff,
+        id__gt=Coalesce(Subquery(since, output_field=BigIntegerField()), 0),
+    ).order_by()
+    with transaction.atomic():
+        user_ids = list(unsettled.values_list('user', flat=True).distinct())
+        if not user_ids:
+            return 0
+        # Lock the snapshots before summing: an overlapping run waits here and
+        # then sums only what lies past the last_entry_id the other run stored
+        snapshots = PointsBalance.objects.select_for_update().in_bulk(user_ids)
+        deltas = list(
+            unsettled.filter(user__in=user_ids)
+            .values('user')
+            .annotate(
+                points=Sum('amount', filter=Q(account=AVAILABLE), default=0),
+                points_hold=Sum('amount', filter=Q(account=HOLD), default=0),
+            )
+        )
+        created, updated = [], []
+        for row in deltas:
+            snapshot = snapshots.get(row['user'])
+            if snapshot is None:
+                snapshot = PointsBalance(user_id=row['user'])
+                created.append(snapshot)
+            else:
+                updated.append(snapshot)
+            snapshot.points += row['points']
+            snapshot.points_hold += row['points_hold']
+            snapshot.last_entry_id = cutoff
+            snapshot.updated_at = timezone.now()
+        # A snapshot another run created meanwhile already holds these entries;
+        # the rest is summed from its last_entry_id next time
+        PointsBalance.objects.bulk_create(created, ignore_conflicts=True)
+        PointsBalance.objects.bulk_update(updated, ['points', 'points_hold', 'last_entry_id', 'updated_at'])
+    return len(deltas)
@@ -0,0 +1,147 @@
+"""
+Transactional email outbox.
+
+Request handlers call ``queue_mail`` inside the transaction that changes the
+exchange; ``deliver_outbox`` (run by ``manage.py send_outbox --loop``) sends
+due messages in batches over one SMTP connection and retries failures with
+exponential backoff.
+
+A batch is first claimed in a short transaction that moves its
+``next_attempt_at`` ``OUTBOX_LEASE`` seconds ahead, so no row lock is held
+during SMTP I/O and other senders skip the batch meanwhile. If the sender
+dies mid-batch the lease runs out and the messages are due again. A slow
+server can outlast the lease of a whole batch, so each message's lease is
+renewed just before it is sent - unless another sender has taken it over -
+and its outcome is saved right after.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger('accounts')
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BACKOFF = 30  # seconds, doubled after every failed attempt
+DEFAULT_LEASE = 300
+MAX_RETRY_DELAY = 3600
+RESULT_FIELDS = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+
+
+def queue_mail(subject, message, recipient_list):
+    """Store an email for background delivery; no-op without recipients."""
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        return None
+    return OutboundEmail.objects.create(subject=subject, body=message, recipients=recipients)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    backoff = getattr(settings, 'OUTBOX_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF)
+    return timedelta(seconds=min(backoff * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', DEFAULT_LEASE))
+
+
+def claim_batch(batch_size) -> list:
+    """Lease up to ``batch_size`` due messages and commit the lease before they are sent."""
+    with transaction.atomic():
+        # skip_locked lets several workers claim batches concurrently
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('id')[:batch_size]
+        )
+        if batch:
+            leased_until = timezone.now() + _lease()
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=leased_until,
+            )
+            for email in batch:
+                email.next_attempt_at = leased_until
+    return batch
+
+
+def renew_lease(email) -> bool:
+    """Extend the lease on ``email`` if this sender still holds it.
+
+    The lease is held while ``next_attempt_at`` is still the value this
+    sender wrote; once it ran out another sender may have claimed the
+    message and moved it.
+    """
+    leased_until = timezone.now() + _lease()
+    renewed = OutboundEmail.objects.filter(
+        pk=email.pk, status=OutboundEmail.STATUS_PENDING, next_attempt_at=email.next_attempt_at,
+    ).update(next_attempt_at=leased_until)
+    if renewed:
+        email.next_attempt_at = leased_until
+    return bool(renewed)
+
+
+def _record_failure(email, exc, max_attempts) -> None:
+    email.last_error = str(exc)
+    if email.attempts >= max_attempts:
+        email.status = OutboundEmail.STATUS_FAILED
+        logger.error(f'Outbox email {email.pk} failed permanently: {exc}')
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+        logger.warning(f'Outbox email {email.pk} failed (attempt {email.attempts}): {exc}')
+
+
+def deliver_outbox(batch_size=None, max_attempts=None):
+    """Send one batch of due messages. Returns ``(sent, failed)`` counts."""
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    max_attempts = max_attempts or getattr(settings, 'OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    sent = failed = 0
+
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        # SMTP unreachable: a failed attempt for the whole batch
+        for email in batch:
+            email.attempts += 1
+            _record_failure(email, exc, max_attempts)
+        OutboundEmail.objects.bulk_update(batch, RESULT_FIELDS)
+        return 0, len(batch)
+
+    try:
+        for email in batch:
+            if not renew_lease(email):
+                # The batch outlasted the lease and another sender took this one
+                continue
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=None,
+                to=email.recipients,
+                connection=connection,
+            )
+            email.attempts += 1
+            try:
+                message.send()
+            except Exception as exc:
+                failed += 1
+                _record_failure(email, exc, max_attempts)
+            else:
+                sent += 1
+                email.status = OutboundEmail.STATUS_SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+            # Saved at once: a sent message must not wait out its lease as pending
+            email.save(update_fields=RESULT_FIELDS)
+    finally:
+        connection.close()
+    return sent, failed
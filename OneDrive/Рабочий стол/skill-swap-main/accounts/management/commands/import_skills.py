@@ -0,0 +1,25 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Skill
+
+
+class Command(BaseCommand):
+    help = 'Create skills from a file with one name per line (stdin if omitted); existing names are skipped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='File with skill names')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['path']:
+            with open(options['path'], encoding='utf-8') as source:
+                names = source.read().splitlines()
+        else:
+            names = sys.stdin.read().splitlines()
+        created = Skill.objects.bulk_create_skills(
+            (Skill(name=name) for name in names if name.strip()),
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} skills'))
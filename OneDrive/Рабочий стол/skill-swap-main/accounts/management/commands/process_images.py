@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.images import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Build thumbnails for uploaded avatars and skill photos queued for background processing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new uploads')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = process_pending(options['batch_size'])
+            if done or failed:
+                self.stdout.write(f'Processed {done}, failed {failed}')
+            if not options['loop']:
+                break
+            if not (done or failed):
+                time.sleep(options['interval'])
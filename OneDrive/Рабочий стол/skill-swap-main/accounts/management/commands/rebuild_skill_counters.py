@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Skill
+
+
+class Command(BaseCommand):
+    help = 'Recompute Skill.teachers_count and Skill.learners_count from the M2M tables'
+
+    def handle(self, *args, **options):
+        updated = Skill.objects.all().refresh_counters()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} skills'))
@@ -0,0 +1,36 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.mail import deliver_outbox
+
+logger = logging.getLogger('accounts')
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox in batches over a single connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-attempts', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = deliver_outbox(options['batch_size'], options['max_attempts'])
+            except Exception:
+                if not options['loop']:
+                    raise
+                # Database or mail backend trouble: keep the sender alive and retry later
+                logger.exception('Outbox delivery failed')
+                time.sleep(options['interval'])
+                continue
+            if sent or failed:
+                self.stdout.write(f'Sent {sent}, failed {failed}')
+            if not options['loop']:
+                break
+            if not sent:
+                time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Roll settled points ledger entries into the per-user balance snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep taking snapshots')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds between snapshots')
+
+    def handle(self, *args, **options):
+        while True:
+            updated = take_snapshots()
+            self.stdout.write(self.style.SUCCESS(f'Snapshotted balances of {updated} users'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,143 @@
+"""
+Reciprocal skill matching.
+
+The index maps every skill to the set of users who teach it and the set of
+users who want to learn it (a bipartite user/skill graph). It is built from
+the ``User.skills_can_teach`` / ``User.skills_to_learn`` through tables once
+per worker, kept up to date by the ``m2m_changed`` handlers in
+``accounts.signals`` once the change commits, and rebuilt whenever another worker bumps the shared
+version counter - or, without a shared cache, at least every
+``LOCAL_CACHE_TTL`` seconds (see ``accounts.versioning``).
+"""
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from .versioning import bump_version, get_version
+
+MATCH_INDEX_VERSION_KEY = 'accounts:match_index:version'
+
+TEACH = 'teach'
+LEARN = 'learn'
+
+
+@dataclass
+class SkillMatch:
+    """A user I can swap with and the skills that make the swap possible."""
+    user_id: int
+    teaches_me: set = field(default_factory=set)
+    learns_from_me: set = field(default_factory=set)
+    user: object = None
+    teaches_me_skills: list = field(default_factory=list)
+    learns_from_me_skills: list = field(default_factory=list)
+
+    @property
+    def score(self) -> int:
+        return len(self.teaches_me) + len(self.learns_from_me)
+
+
+class SkillMatchIndex:
+    """Per-worker skill → teachers/learners index."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._skill_users = {TEACH: defaultdict(set), LEARN: defaultdict(set)}
+        self._user_skills = {TEACH: defaultdict(set), LEARN: defaultdict(set)}
+
+    def rebuild(self) -> None:
+        """Load both through tables (two queries) and replace the index."""
+        from .models import User
+
+        with self._lock:
+            version = get_version(MATCH_INDEX_VERSION_KEY)
+            skill_users = {TEACH: defaultdict(set), LEARN: defaultdict(set)}
+            user_skills = {TEACH: defaultdict(set), LEARN: defaultdict(set)}
+            sources = {
+                TEACH: User.skills_can_teach.through.objects,
+                LEARN: User.skills_to_learn.through.objects,
+            }
+            for kind, manager in sources.items():
+                for user_id, skill_id in manager.values_list('user_id', 'skill_id').iterator():
+                    skill_users[kind][skill_id].add(user_id)
+                    user_skills[kind][user_id].add(skill_id)
+            self._skill_users = skill_users
+            self._user_skills = user_skills
+            self._version = version
+
+    def ensure_fresh(self) -> None:
+        if self._version != get_version(MATCH_INDEX_VERSION_KEY):
+            self.rebuild()
+
+    def update(self, kind: str, pairs, add: bool = True) -> None:
+        """Apply committed (user_id, skill_id) additions or removals made in this worker.
+
+        The shared version is bumped so that other workers reload; this
+        worker patches its index in place only if the bump follows the
+        version it was built from - otherwise another worker changed the
+        graph in between and the index is rebuilt on the next lookup.
+        """
+        with self._lock:
+            old_version = self._version
+            new_version = bump_version(MATCH_INDEX_VERSION_KEY)
+            if old_version is None or new_version != old_version + 1:
+                self._version = None
+                return
+            for user_id, skill_id in pairs:
+                if add:
+                    self._skill_users[kind][skill_id].add(user_id)
+                    self._user_skills[kind][user_id].add(skill_id)
+                else:
+                    self._skill_users[kind][skill_id].discard(user_id)
+                    self._user_skills[kind][user_id].discard(skill_id)
+            self._version = new_version
+
+    def matches_for(self, user_id: int) -> list:
+        """Users who teach something I want to learn and want something I teach.
+
+        Ordered by the number of skills involved, best matches first.
+        """
+        self.ensure_fresh()
+        with self._lock:
+            teachers = self._skill_users[TEACH]
+            learners = self._skill_users[LEARN]
+            found = {}
+            for skill_id in self._user_skills[LEARN].get(user_id, ()):
+                for other_id in teachers.get(skill_id, ()):
+                    found.setdefault(other_id, SkillMatch(other_id)).teaches_me.add(skill_id)
+            for skill_id in self._user_skills[TEACH].get(user_id, ()):
+                for other_id in learners.get(skill_id, ()):
+                    if other_id in found:
+                        found[other_id].learns_from_me.add(skill_id)
+        found.pop(user_id, None)
+        matches = [m for m in found.values() if m.learns_from_me]
+        matches.sort(key=lambda m: (-m.score, m.user_id))
+        return matches
+
+
+def load_matches(matches) -> list:
+    """Attach ``User`` and ``Skill`` objects to a page of matches in two queries."""
+    from .models import Skill, User
+
+    users = User.objects.with_balances().in_bulk([m.user_id for m in matches])
+    skill_ids = set()
+    for m in matches:
+        skill_ids |= m.teaches_me | m.learns_from_me
+    skills = Skill.objects.in_bulk(skill_ids)
+    loaded = []
+    for m in matches:
+        if m.user_id not in users:
+            continue
+        m.user = users[m.user_id]
+        m.teaches_me_skills = sorted((skills[s] for s in m.teaches_me if s in skills), key=lambda s: s.name)
+        m.learns_from_me_skills = sorted((skills[s] for s in m.learns_from_me if s in skills), key=lambda s: s.name)
+        loaded.append(m)
+    return loaded
+
+
+def invalidate_match_index() -> None:
+    """Force every worker to rebuild the index on its next lookup."""
+    bump_version(MATCH_INDEX_VERSION_KEY)
+
+
+match_index = SkillMatchIndex()
@@ -0,0 +1,24 @@
+# Generated manually
+
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from accounts.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from accounts.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_user_role'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:00
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Skill = apps.get_model('accounts', 'Skill')
+    User = apps.get_model('accounts', 'User')
+
+    def count(through):
+        rows = (
+            through.objects.filter(skill_id=OuterRef('pk'))
+            .values('skill_id')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Skill.objects.update(
+        teachers_count=count(User.skills_can_teach.through),
+        learners_count=count(User.skills_to_learn.through),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='skill',
+            name='learners_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='skill',
+            name='teachers_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
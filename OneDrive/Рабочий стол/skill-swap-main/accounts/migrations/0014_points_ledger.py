@@ -0,0 +1,94 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:07
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Q, Sum
+
+
+def open_balances(apps, schema_editor):
+    """Turn the current ``points`` / ``points_hold`` columns into opening entries and snapshots."""
+    User = apps.get_model('accounts', 'User')
+    PointsEntry = apps.get_model('accounts', 'PointsEntry')
+    PointsBalance = apps.get_model('accounts', 'PointsBalance')
+
+    entries = []
+    for user_id, points, points_hold in User.objects.values_list('id', 'points', 'points_hold').iterator():
+        for account, amount in (('available', points), ('hold', points_hold)):
+            if amount:
+                txn = uuid.uuid4()
+                entries.append(PointsEntry(txn=txn, user_id=user_id, account=account, kind='opening', amount=amount))
+                entries.append(PointsEntry(txn=txn, user_id=None, account='system', kind='opening', amount=-amount))
+    PointsEntry.objects.bulk_create(entries, batch_size=500)
+    last_entry_id = PointsEntry.objects.aggregate(last=Max('id'))['last'] or 0
+    PointsBalance.objects.bulk_create(
+        [
+            PointsBalance(user_id=user_id, points=points, points_hold=points_hold, last_entry_id=last_entry_id)
+            for user_id, points, points_hold in User.objects.values_list('id', 'points', 'points_hold').iterator()
+        ],
+        batch_size=500,
+    )
+
+
+def restore_balances(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    PointsEntry = apps.get_model('accounts', 'PointsEntry')
+
+    totals = (
+        PointsEntry.objects.filter(user__isnull=False)
+        .order_by()
+        .values('user')
+        .annotate(
+            points=Sum('amount', filter=Q(account='available'), default=0),
+            points_hold=Sum('amount', filter=Q(account='hold'), default=0),
+        )
+    )
+    for row in totals:
+        User.objects.filter(pk=row['user']).update(points=row['points'], points_hold=row['points_hold'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='points_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('points', models.IntegerField(default=0)),
+                ('points_hold', models.IntegerField(default=0)),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PointsEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txn', models.UUIDField(db_index=True, default=uuid.uuid4)),
+                ('account', models.CharField(choices=[('available', 'Available'), ('hold', 'Hold'), ('system', 'System')], max_length=20)),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('adjust', 'Adjustment'), ('hold', 'Hold'), ('release', 'Release'), ('transfer', 'Transfer'), ('charge', 'Charge'), ('bonus', 'Bonus')], max_length=20)),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('exchange', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_entries', to='accounts.exchangerequest')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='points_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['user', 'account', 'id'], name='points_entry_balance_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, restore_balances),
+        migrations.RemoveField(
+            model_name='user',
+            name='points',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='points_hold',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated manually
+
+from django.db import migrations
+
+
+def backfill_slugs(apps, schema_editor):
+    """Give legacy skills without a slug one (previously done on every catalog view)."""
+    from accounts.slugs import SlugAllocator
+
+    Skill = apps.get_model('accounts', 'Skill')
+    missing = list(Skill.objects.filter(slug='').only('id', 'name'))
+    if not missing:
+        return
+    allocator = SlugAllocator(Skill.objects.all())
+    allocator.load(skill.name for skill in missing)
+    for skill in missing:
+        skill.slug = allocator.allocate(skill.name)
+    Skill.objects.bulk_update(missing, ['slug'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_points_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_backfill_skill_slugs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exchangerequest',
+            index=models.Index(fields=['receiver', 'status', '-created_at'], name='exchange_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangerequest',
+            index=models.Index(fields=['sender', '-created_at'], name='exchange_sender_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangerequest',
+            index=models.Index(fields=['receiver', '-created_at'], name='exchange_receiver_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangerequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='exchange_status_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangerequest',
+            index=models.Index(fields=['-created_at', '-id'], name='exchange_recent_idx'),
+        ),
+    ]
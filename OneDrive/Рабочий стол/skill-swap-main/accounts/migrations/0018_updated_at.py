@@ -0,0 +1,26 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # On SQLite adding a NOT NULL column remakes accounts_user, which drops the
+    # search index triggers; AccountsConfig reinstalls them after migrate
+
+    dependencies = [
+        ('accounts', '0017_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='skill',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,6 +1,68 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
-from django.utils.text import slugify
+import uuid
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager
+from django.utils import timezone
+
+from .catalog import invalidate_skill_catalog
+from .slugs import SlugAllocator, next_free_slug
+
+SLUG_ALLOCATION_ATTEMPTS = 5
+
+
+class SkillQuerySet(models.QuerySet):
+    def refresh_counters(self) -> int:
+        """Recompute ``teachers_count``/``learners_count`` from the M2M tables in one UPDATE."""
+        return self.update(
+            teachers_count=_through_count(User.skills_can_teach.through, 'skill_id'),
+            learners_count=_through_count(User.skills_to_learn.through, 'skill_id'),
+        )
+
+    def bulk_create_skills(self, skills, batch_size=500) -> list:
+        """Insert many unsaved skills with slugs allocated in one pass.
+
+        Skills whose name already exists (in the table or earlier in
+        ``skills``) are skipped; the inserted ones are returned. Like
+        ``Skill.save``, a name or slug taken by another request in the
+        meantime sends the batch round again against the current table.
+        ``bulk_create`` sends no ``post_save``, so the catalog version is
+        bumped here.
+        """
+        fresh, seen = [], set()
+        for skill in skills:
+            skill.name = skill.name.strip()
+            if skill.name and skill.name not in seen:
+                seen.add(skill.name)
+                fresh.append(skill)
+        unslugged = {id(skill) for skill in fresh if not skill.slug}
+
+        for attempt in range(SLUG_ALLOCATION_ATTEMPTS):
+            existing = set()
+            names = [skill.name for skill in fresh]
+            for start in range(0, len(names), batch_size):
+                existing.update(
+                    self.filter(name__in=names[start:start + batch_size]).values_list('name', flat=True)
+                )
+            fresh = [skill for skill in fresh if skill.name not in existing]
+            if not fresh:
+                return []
+
+            allocator = SlugAllocator(self.model.objects.all())
+            allocator.load(skill.name for skill in fresh if id(skill) in unslugged)
+            for skill in fresh:
+                if id(skill) in unslugged:
+                    skill.slug = allocator.allocate(skill.name)
+            try:
+                with transaction.atomic():
+                    created = self.bulk_create(fresh, batch_size=batch_size)
+            except IntegrityError:
+                if attempt == SLUG_ALLOCATION_ATTEMPTS - 1:
+                    raise
+                continue
+            invalidate_skill_catalog()
+            return created
 
 
 class Skill(models.Model):
@@ -8,7 +70,16 @@ class Skill(models.Model):
     slug = models.SlugField(max_length=120, unique=True, blank=True)
     description = models.TextField(blank=True)
     photo = models.ImageField(upload_to='skill_photos/', null=True, blank=True)
+    # Thumbnails of ``photo`` built by accounts.images
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     experience_years = models.PositiveIntegerField(null=True, blank=True)
+    # Denormalized from User.skills_can_teach / skills_to_learn, kept in sync by accounts.signals
+    teachers_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    learners_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    # Validator for conditional GETs (accounts.conditional); the counters above do not move it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = SkillQuerySet.as_manager()
 
     class Meta:
         ordering = ["name"]
@@ -17,15 +88,102 @@ class Skill(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base = slugify(self.name)
-            candidate = base
-            i = 1
-            while Skill.objects.filter(slug=candidate).exclude(pk=self.pk).exists():
-                i += 1
-                candidate = f"{base}-{i}"
-            self.slug = candidate
-        super().save(*args, **kwargs)
+        if kwargs.get('update_fields'):
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+        if self.slug:
+            return super().save(*args, **kwargs)
+        # Another request may take the same slug between the lookup and the
+        # INSERT; the unique index rejects it and the next free one is tried
+        for attempt in range(SLUG_ALLOCATION_ATTEMPTS):
+            self.slug = next_free_slug(Skill.objects.exclude(pk=self.pk), self.name)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                slug_taken = Skill.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                self.slug = ''
+                if not slug_taken or attempt == SLUG_ALLOCATION_ATTEMPTS - 1:
+                    raise
+
+
+class UserQuerySet(models.QuerySet):
+    def with_skill_cards(self, preview=None):
+        """Load both skill lists and their sizes for every user in a fixed number of queries.
+
+        Annotates ``teach_count`` / ``learn_count``. With ``preview`` only the first
+        N skills (by name) of each list are prefetched into ``teach_preview`` /
+        ``learn_preview``; without it the full lists fill the
+        ``skills_can_teach.all()`` / ``skills_to_learn.all()`` caches.
+        """
+        teach_through = self.model.skills_can_teach.through
+        learn_through = self.model.skills_to_learn.through
+        queryset = self.annotate(
+            teach_count=_through_count(teach_through, 'user_id'),
+            learn_count=_through_count(learn_through, 'user_id'),
+        )
+        teach = Skill.objects.order_by('name', 'id')
+        learn = Skill.objects.order_by('name', 'id')
+        if preview is None:
+            return queryset.prefetch_related(
+                Prefetch('skills_can_teach', queryset=teach),
+                Prefetch('skills_to_learn', queryset=learn),
+            )
+        return queryset.prefetch_related(
+            Prefetch('skills_can_teach', queryset=teach[:preview], to_attr='teach_preview'),
+            Prefetch('skills_to_learn', queryset=learn[:preview], to_attr='learn_preview'),
+        )
+
+    def touch(self) -> int:
+        """Move ``updated_at`` of these users, for changes that do not save the row (skill links)."""
+        return self.update(updated_at=timezone.now())
+
+    def with_balances(self):
+        """Annotate ``ledger_points`` / ``ledger_points_hold`` from the points ledger.
+
+        Each balance is the user's ``PointsBalance`` snapshot plus the entries
+        posted after it; ``User.points`` / ``User.points_hold`` read these
+        annotations instead of querying per user.
+        """
+        return self.annotate(
+            ledger_points=_ledger_balance(PointsEntry.ACCOUNT_AVAILABLE, 'points'),
+            ledger_points_hold=_ledger_balance(PointsEntry.ACCOUNT_HOLD, 'points_hold'),
+        )
+
+
+def _through_count(through, key):
+    """Correlated COUNT(*) of M2M rows whose ``key`` column equals the outer pk."""
+    counts = (
+        through.objects.filter(**{key: OuterRef('pk')})
+        .values(key)
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _ledger_balance(account, column):
+    """Snapshot ``column`` of the outer user plus the ``account`` entries newer than the snapshot."""
+    snapshot = PointsBalance.objects.filter(user=OuterRef('pk')).values(column)
+    since = PointsBalance.objects.filter(user=OuterRef('user')).values('last_entry_id')
+    recent = (
+        PointsEntry.objects.filter(
+            user=OuterRef('pk'),
+            account=account,
+            id__gt=Coalesce(Subquery(since, output_field=models.BigIntegerField()), 0),
+        )
+        .order_by()
+        .values('user')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return (
+        Coalesce(Subquery(snapshot, output_field=IntegerField()), 0)
+        + Coalesce(Subquery(recent, output_field=IntegerField()), 0)
+    )
+
+
+class UserManager(DjangoUserManager.from_queryset(UserQuerySet)):
+    pass
 
 
 class User(AbstractUser):
@@ -42,16 +200,79 @@ class User(AbstractUser):
     full_name = models.CharField(max_length=255, blank=True)
     university = models.CharField(max_length=255, blank=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
-    points = models.IntegerField(default=20)
-    points_hold = models.IntegerField(default=0)
+    # Thumbnails of ``avatar`` built by accounts.images
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default=ROLE_USER)
     skills_can_teach = models.ManyToManyField(Skill, related_name='teachers', blank=True)
     skills_to_learn = models.ManyToManyField(Skill, related_name='learners', blank=True)
+    # Validator for conditional GETs (accounts.conditional); also moved when the skill lists change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserManager()
 
     def __str__(self) -> str:
         if self.full_name:
             return self.full_name
         return super().__str__()
+
+    def save(self, *args, **kwargs):
+        from . import ledger
+
+        target = self.__dict__.pop('_points_target', None)
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # Balances live in the ledger; an empty list makes the row save a no-op
+            kwargs['update_fields'] = [name for name in update_fields if name not in ('points', 'points_hold')]
+            if kwargs['update_fields']:
+                kwargs['update_fields'].append('updated_at')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                ledger.open_account(self, ledger.INITIAL_POINTS if target is None else target)
+            elif target is not None:
+                ledger.adjust(self, target)
+        self.forget_balance()
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.forget_balance()
+        self.__dict__.pop('_points_target', None)
+        super().refresh_from_db(*args, **kwargs)
+
+    @property
+    def points(self) -> int:
+        """Available balance, read from the points ledger (see ``accounts.ledger``)."""
+        if '_points_target' in self.__dict__:
+            return self._points_target
+        return self._balance()[0]
+
+    @points.setter
+    def points(self, value: int) -> None:
+        # Applied on save(): the opening balance of a new user, an ``adjust`` entry otherwise
+        self._points_target = value
+
+    @property
+    def points_hold(self) -> int:
+        """Points reserved by the user's pending exchanges."""
+        return self._balance()[1]
+
+    def _balance(self):
+        if 'ledger_points' in self.__dict__:
+            return self.ledger_points, self.ledger_points_hold
+        if self.pk is None:
+            from .ledger import INITIAL_POINTS
+            return INITIAL_POINTS, 0
+        if '_balance_cache' not in self.__dict__:
+            self._balance_cache = (
+                User.objects.filter(pk=self.pk).with_balances()
+                .values_list('ledger_points', 'ledger_points_hold').get()
+            )
+        return self._balance_cache
+
+    def forget_balance(self) -> None:
+        """Drop the balance loaded on this instance; the next read queries the ledger."""
+        for name in ('ledger_points', 'ledger_points_hold', '_balance_cache'):
+            self.__dict__.pop(name, None)
     
     def is_admin_user(self):
         """Проверка, является ли пользователь администратором"""
@@ -66,6 +287,19 @@ class User(AbstractUser):
         return self.is_moderator()
 
 
+class ExchangeRequestQuerySet(models.QuerySet):
+    def involving(self, user):
+        """Exchanges the user sent or received.
+
+        Written as ``pk IN (… WHERE sender … UNION … WHERE receiver …)`` so each
+        branch is served by its own index, unlike ``Q(sender) | Q(receiver)``.
+        """
+        model = self.model
+        sent = model._base_manager.filter(sender=user).order_by().values('pk')
+        received = model._base_manager.filter(receiver=user).order_by().values('pk')
+        return self.filter(pk__in=sent.union(received))
+
+
 class ExchangeRequest(models.Model):
     STATUS_PENDING = 'pending'
     STATUS_ACCEPTED = 'accepted'
@@ -91,8 +325,20 @@ class ExchangeRequest(models.Model):
     receiver_confirmed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ExchangeRequestQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Inbox: pending requests of a receiver, newest first
+            models.Index(fields=['receiver', 'status', '-created_at'], name='exchange_inbox_idx'),
+            # Both branches of ExchangeRequest.objects.involving(user)
+            models.Index(fields=['sender', '-created_at'], name='exchange_sender_recent_idx'),
+            models.Index(fields=['receiver', '-created_at'], name='exchange_receiver_recent_idx'),
+            # Admin listing, with and without a status filter
+            models.Index(fields=['status', '-created_at', '-id'], name='exchange_status_recent_idx'),
+            models.Index(fields=['-created_at', '-id'], name='exchange_recent_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.sender} ↔ {self.receiver} · {self.skill} · {self.status}"
@@ -102,8 +348,7 @@ class ExchangeRequest(models.Model):
 
         Returns True if hold succeeded, False if sender has insufficient points.
         """
-        from django.db import transaction
-        from django.db.models import F
+        from . import ledger
 
         if self.price <= 0:
             return True
@@ -112,60 +357,178 @@ class ExchangeRequest(models.Model):
             self.sender_id = self.sender.pk
 
         with transaction.atomic():
-            sender_locked = User.objects.select_for_update().get(pk=self.sender_id)
-            if sender_locked.points < self.price:
+            ledger.lock_balance(self.sender_id)
+            if ledger.balance_of(self.sender_id).points < self.price:
                 return False
-            sender_locked.points = F('points') - self.price
-            sender_locked.points_hold = F('points_hold') + self.price
-            sender_locked.save(update_fields=['points', 'points_hold'])
             if self.pk is None:
                 self.status = self.STATUS_PENDING
                 self.save()
+            ledger.hold(self)
+        self._forget_balances()
         return True
 
-    def refund_to_sender(self) -> None:
-        """Atomically refund held points to sender and mark request declined."""
-        from django.db import transaction
-        from django.db.models import F
-
-        if self.price <= 0:
-            self.status = self.STATUS_DECLINED
-            self.save(update_fields=['status'])
-            return
+    def refund_to_sender(self) -> bool:
+        """Refund held points to sender and mark request declined.
 
-        with transaction.atomic():
-            sender_locked = User.objects.select_for_update().get(pk=self.sender_id)
-            sender_locked.points_hold = F('points_hold') - self.price
-            sender_locked.points = F('points') + self.price
-            sender_locked.save(update_fields=['points_hold', 'points'])
-            self.status = self.STATUS_DECLINED
-            self.save(update_fields=['status'])
+        Returns False if the request was already declined or completed.
+        """
+        from . import exchanges
+        return exchanges.decline(self)
 
     def try_complete(self) -> bool:
         """If both sides confirmed, mark completed and grant points to both.
         Returns True if completion happened in this call.
         """
-        if self.status == self.STATUS_COMPLETED:
-            return False
-        if self.sender_confirmed and self.receiver_confirmed and self.status in {self.STATUS_ACCEPTED, self.STATUS_PENDING}:
-            # Finalize transaction: move hold from sender to receiver and give bonus +1 to both
-            from django.db import transaction
-            from django.db.models import F
-            with transaction.atomic():
-                # reload users with select_for_update to avoid races
-                sender_locked = User.objects.select_for_update().get(pk=self.sender_id)
-                receiver_locked = User.objects.select_for_update().get(pk=self.receiver_id)
-                # Ensure hold covers price
-                hold_to_release = min(max(sender_locked.points_hold, 0), max(self.price, 0))
-                # Deduct hold and points from sender; credit receiver
-                sender_locked.points_hold = F('points_hold') - hold_to_release
-                sender_locked.points = F('points') - hold_to_release + 10
-                receiver_locked.points = F('points') + hold_to_release + 10
-                sender_locked.save(update_fields=['points_hold', 'points'])
-                receiver_locked.save(update_fields=['points'])
-                self.status = self.STATUS_COMPLETED
-                self.save(update_fields=['status'])
-            return True
-        return False
+        from . import exchanges
+        return exchanges.complete(self)
+
+    def _forget_balances(self) -> None:
+        for name in ('sender', 'receiver'):
+            user = self._state.fields_cache.get(name)
+            if user is not None:
+                user.forget_balance()
+
+
+class OutboundEmail(models.Model):
+    """Transactional email waiting to be delivered by ``manage.py send_outbox``.
+
+    Rows are written in the same transaction as the change they announce, so
+    a rolled-back request never sends mail and a committed one always does.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.subject} → {', '.join(self.recipients)} · {self.status}"
+
+
+class ImageTask(models.Model):
+    """An uploaded image waiting for ``accounts.images`` to build its derivatives.
+
+    Small uploads are processed right after the upload commits; large ones
+    are left to ``manage.py process_images``.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    field = models.CharField(max_length=50)
+    source = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='image_task_due_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.model}#{self.object_id}.{self.field} · {self.status}"
+
+
+class PointsEntry(models.Model):
+    """One leg of a points posting. Append-only: balances change by inserting rows.
+
+    The legs of a posting share ``txn`` and their amounts sum to zero. Each
+    user has an ``available`` and a ``hold`` account; points are issued and
+    burned through the ``system`` account, whose legs have no user.
+    """
+    ACCOUNT_AVAILABLE = 'available'
+    ACCOUNT_HOLD = 'hold'
+    ACCOUNT_SYSTEM = 'system'
+
+    ACCOUNT_CHOICES = [
+        (ACCOUNT_AVAILABLE, 'Available'),
+        (ACCOUNT_HOLD, 'Hold'),
+        (ACCOUNT_SYSTEM, 'System'),
+    ]
+
+    KIND_OPENING = 'opening'
+    KIND_ADJUST = 'adjust'
+    KIND_HOLD = 'hold'
+    KIND_RELEASE = 'release'
+    KIND_TRANSFER = 'transfer'
+    KIND_CHARGE = 'charge'
+    KIND_BONUS = 'bonus'
+
+    KIND_CHOICES = [
+        (KIND_OPENING, 'Opening balance'),
+        (KIND_ADJUST, 'Adjustment'),
+        (KIND_HOLD, 'Hold'),
+        (KIND_RELEASE, 'Release'),
+        (KIND_TRANSFER, 'Transfer'),
+        (KIND_CHARGE, 'Charge'),
+        (KIND_BONUS, 'Bonus'),
+    ]
+
+    txn = models.UUIDField(default=uuid.uuid4, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='points_entries')
+    account = models.CharField(max_length=20, choices=ACCOUNT_CHOICES)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    exchange = models.ForeignKey(
+        ExchangeRequest, on_delete=models.SET_NULL, null=True, blank=True, related_name='points_entries'
+    )
+    amount = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'account', 'id'], name='points_entry_balance_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} · {self.user or 'system'}/{self.account} · {self.amount:+d}"
+
+
+class PointsBalance(models.Model):
+    """Balance snapshot: the sum of a user's entries up to ``last_entry_id``.
+
+    Rolled forward by ``manage.py snapshot_balances``; the row is also the
+    lock that serializes debits of the user's available points.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='points_balance')
+    points = models.IntegerField(default=0)
+    points_hold = models.IntegerField(default=0)
+    last_entry_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.user}: {self.points} (+{self.points_hold} hold) @ {self.last_entry_id}"
 
 # Create your models here.
@@ -0,0 +1,219 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by the ordering key of their boundary row instead of an
+OFFSET, so fetching page 1000 is the same indexed range scan as page 1. The
+key always ends with ``id`` to make it unique, e.g. ``('-created_at', '-id')``.
+
+``KeysetPaginator`` serves the HTML views, ``KeysetPagination`` plugs into
+DRF. The exact total (``COUNT(*)``) is included by default and can be
+skipped with ``?count=0``.
+
+The ``a``-prefixed variants read the page with the async ORM for async views;
+``apage`` does the same for a plain ``Paginator`` (numbered pages).
+"""
+import base64
+import binascii
+import json
+
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_PARAM = 'cursor'
+COUNT_PARAM = 'count'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def wants_count(params) -> bool:
+    """``?count=0`` (or false/no) opts out of the exact total."""
+    return params.get(COUNT_PARAM, '').lower() not in ('0', 'false', 'no')
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, count=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), with_count=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.with_count = with_count
+        self._fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+
+    def encode_cursor(self, obj, backwards=False) -> str:
+        values = [field.value_to_string(obj) for field in self._fields]
+        payload = json.dumps({'v': values, 'b': backwards}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = [field.to_python(value) for field, value in zip(self._fields, payload['v'], strict=True)]
+            return values, bool(payload.get('b'))
+        except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+            raise InvalidCursor(str(exc)) from exc
+
+    def _after(self, values, backwards):
+        """Rows strictly after ``values`` in the (possibly reversed) ordering."""
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            descending = name.startswith('-') != backwards
+            field = name.lstrip('-')
+            step = Q(**{f'{field}__{"lt" if descending else "gt"}': values[position]})
+            for previous, value in zip(self.ordering[:position], values[:position]):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def _window(self, cursor):
+        """``(queryset, backwards)``: up to ``per_page + 1`` rows from ``cursor`` on."""
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            values, backwards = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(values, backwards))
+        if backwards:
+            queryset = queryset.order_by(*[name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        return queryset[:self.per_page + 1], backwards
+
+    def get_page(self, cursor=None) -> KeysetPage:
+        window, backwards = self._window(cursor)
+        count = self.queryset.count() if self.with_count else None
+        return self._page(list(window), cursor, backwards, count)
+
+    async def aget_page(self, cursor=None) -> KeysetPage:
+        window, backwards = self._window(cursor)
+        rows = [row async for row in window.aiterator(chunk_size=self.per_page + 1)]
+        count = await self.queryset.acount() if self.with_count else None
+        return self._page(rows, cursor, backwards, count)
+
+    def _page(self, rows, cursor, backwards, count) -> KeysetPage:
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode_cursor(rows[0], backwards=True) if has_previous and rows else None,
+            count=count,
+        )
+
+
+async def apage(paginator: Paginator, number, strict=False) -> Page:
+    """``paginator.get_page(number)`` (``page(number)`` if ``strict``) read with the async ORM."""
+    paginator.count = await paginator.object_list.acount()
+    number = paginator.validate_number(number) if strict else paginator.get_page(number).number
+    bottom = (number - 1) * paginator.per_page
+    window = paginator.object_list[bottom:bottom + paginator.per_page]
+    return Page([row async for row in window.aiterator(chunk_size=paginator.per_page)], number, paginator)
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination over a unique ordering key (``next``/``previous`` cursors)."""
+    page_size = api_settings.PAGE_SIZE
+    ordering = ('-created_at', '-id')
+
+    def _paginator(self, queryset, request):
+        self.request = request
+        return KeysetPaginator(queryset, self.page_size, self.ordering, wants_count(request.query_params))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            self.page = self._paginator(queryset, request).get_page(request.query_params.get(CURSOR_PARAM))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page.object_list)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        try:
+            self.page = await self._paginator(queryset, request).aget_page(request.query_params.get(CURSOR_PARAM))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page.object_list)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), CURSOR_PARAM, cursor)
+
+    def get_paginated_response(self, data):
+        payload = {}
+        if self.page.count is not None:
+            payload['count'] = self.page.count
+        payload['next'] = self.get_link(self.page.next_cursor)
+        payload['previous'] = self.get_link(self.page.previous_cursor)
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ExchangeKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class UserKeysetPagination(KeysetPagination):
+    ordering = ('username', 'id')
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """``PageNumberPagination`` that async views can await."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = request.query_params.get(self.page_query_param) or 1
+        try:
+            self.page = await apage(paginator, page_number, strict=True)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        if self.page.paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
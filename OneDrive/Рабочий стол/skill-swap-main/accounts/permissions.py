@@ -17,6 +17,14 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         )
 
 
+class IsAdmin(permissions.BasePermission):
+    """
+    Разрешение: только администраторы
+    """
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_admin_user()
+
+
 class IsModeratorOrReadOnly(permissions.BasePermission):
     """
     Разрешение: модераторы и администраторы могут изменять,
@@ -0,0 +1,184 @@
+"""
+Indexed user search.
+
+PostgreSQL: ``icontains`` filters are served by trigram GIN indexes on
+``UPPER(column::text)`` (the exact expression Django emits for the lookup)
+and matches are ranked with ``SearchRank`` plus trigram similarity.
+
+SQLite: an FTS5 shadow table with the ``trigram`` tokenizer mirrors the
+searchable ``accounts_user`` columns. Triggers keep it in sync on every
+insert/update/delete of a user and matches are ranked with ``bm25``.
+
+Other backends, and queries shorter than a trigram, fall back to plain
+``icontains``.
+"""
+from asgiref.sync import sync_to_async
+from django.db import OperationalError, connection as default_connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+USER_SEARCH_FIELDS = ('username', 'full_name', 'first_name', 'last_name')
+ADMIN_SEARCH_FIELDS = ('username', 'email', 'full_name')
+
+# Every column that any search may target; order matters for FTS5 bm25 weights
+INDEXED_FIELDS = ('username', 'full_name', 'first_name', 'last_name', 'email')
+FIELD_WEIGHTS = {'username': 10.0, 'full_name': 5.0, 'first_name': 5.0, 'last_name': 5.0, 'email': 1.0}
+
+USER_TABLE = 'accounts_user'
+FTS_TABLE = 'accounts_user_fts'
+MIN_INDEXED_QUERY = 3
+
+_sqlite_ready = {}
+
+
+def _icontains(fields, query):
+    condition = Q()
+    for name in fields:
+        condition |= Q(**{f'{name}__icontains': query})
+    return condition
+
+
+def _search_fallback(queryset, query, fields):
+    return queryset.filter(_icontains(fields, query)).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
+
+
+def _search_postgresql(queryset, query, fields):
+    from django.contrib.postgres.search import (
+        SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+    )
+
+    vector = None
+    for name in fields:
+        weight = 'A' if name == 'username' else 'B'
+        part = SearchVector(name, weight=weight, config='simple')
+        vector = part if vector is None else vector + part
+    ts_query = SearchQuery(query, config='simple', search_type='websearch')
+    similarity = Greatest(*[TrigramSimilarity(name, query) for name in fields])
+    return queryset.filter(_icontains(fields, query)).annotate(
+        search_rank=SearchRank(vector, ts_query) + similarity
+    )
+
+
+def _search_sqlite(queryset, query, fields):
+    match = '{%s} : "%s"' % (' '.join(fields), query.replace('"', '""'))
+    weights = ', '.join(str(FIELD_WEIGHTS[name]) for name in INDEXED_FIELDS)
+    matched_ids = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    # bm25() is negative, smaller is better
+    rank = RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{USER_TABLE}"."id"',
+        [match],
+        output_field=FloatField(),
+    )
+    return queryset.filter(pk__in=matched_ids).annotate(search_rank=rank)
+
+
+def search_users(queryset, query, fields=USER_SEARCH_FIELDS, ordering=('username',)):
+    """Filter ``queryset`` by ``query`` over ``fields``, most relevant first.
+
+    Matched rows get a ``search_rank`` annotation; ``ordering`` breaks ties.
+    """
+    query = query.strip()
+    if not query:
+        return queryset.order_by(*ordering)
+    vendor = default_connection.vendor
+    if vendor == 'postgresql':
+        queryset = _search_postgresql(queryset, query, fields)
+    elif vendor == 'sqlite' and len(query) >= MIN_INDEXED_QUERY and sqlite_index_ready():
+        queryset = _search_sqlite(queryset, query, fields)
+    else:
+        queryset = _search_fallback(queryset, query, fields)
+    return queryset.order_by('-search_rank', *ordering)
+
+
+async def asearch_users(queryset, query, fields=USER_SEARCH_FIELDS, ordering=('username',)):
+    """``search_users`` for async views: the one-off SQLite index check runs in a thread."""
+    if default_connection.vendor == 'sqlite' and len(query.strip()) >= MIN_INDEXED_QUERY:
+        await sync_to_async(sqlite_index_ready)()
+    return search_users(queryset, query, fields, ordering)
+
+
+def sqlite_index_ready(connection=default_connection) -> bool:
+    name = str(connection.settings_dict['NAME'])
+    if name not in _sqlite_ready:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _sqlite_ready[name] = cursor.fetchone() is not None
+    return _sqlite_ready[name]
+
+
+def _postgresql_statements():
+    statements = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+    for name in INDEXED_FIELDS:
+        statements.append(
+            f'CREATE INDEX IF NOT EXISTS {USER_TABLE}_{name}_trgm '
+            f'ON {USER_TABLE} USING gin (UPPER({name}::text) gin_trgm_ops)'
+        )
+    return statements
+
+
+def _sqlite_statements():
+    columns = ', '.join(INDEXED_FIELDS)
+    new_values = ', '.join(f'new.{name}' for name in INDEXED_FIELDS)
+    old_values = ', '.join(f'old.{name}' for name in INDEXED_FIELDS)
+    delete_old = (
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f'INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{columns}, content='{USER_TABLE}', content_rowid='id', tokenize='trigram')",
+        f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {USER_TABLE} BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {USER_TABLE} BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON {USER_TABLE} '
+        f'BEGIN {delete_old} {insert_new} END',
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def install_search_index(connection) -> None:
+    """Create the search index for ``connection`` if it is missing.
+
+    Idempotent. SQLite drops triggers when a migration remakes
+    ``accounts_user``, so this also runs after every ``migrate``.
+    """
+    if connection.vendor == 'postgresql':
+        statements = _postgresql_statements()
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{FTS_TABLE}_%'],
+            )
+            if cursor.fetchone()[0] == 3:
+                return
+        statements = _sqlite_statements()
+    else:
+        return
+    try:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    except OperationalError:
+        # SQLite built without FTS5/trigram support: search stays on icontains
+        if connection.vendor != 'sqlite':
+            raise
+    _sqlite_ready.pop(str(connection.settings_dict['NAME']), None)
+
+
+def uninstall_search_index(connection) -> None:
+    if connection.vendor == 'postgresql':
+        statements = [f'DROP INDEX IF EXISTS {USER_TABLE}_{name}_trgm' for name in INDEXED_FIELDS]
+    elif connection.vendor == 'sqlite':
+        statements = [f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au')]
+        statements.append(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    _sqlite_ready.pop(str(connection.settings_dict['NAME']), None)
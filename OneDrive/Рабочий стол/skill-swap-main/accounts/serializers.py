@@ -1,44 +1,265 @@
+from dataclasses import dataclass
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from .exchanges import ACTIONS
+from .images import FORMATS, ready_variants
+from .ledger import attach_balances
 from .models import Skill, ExchangeRequest
 
 User = get_user_model()
 
 
-class SkillSerializer(serializers.ModelSerializer):
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _names(value: str) -> set:
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+@dataclass(frozen=True)
+class Shape:
+    """Top-level ``fields`` to render and the relations among them to ``expand`` into objects"""
+    fields: frozenset
+    expand: frozenset
+
+    def expands(self, name) -> bool:
+        return name in self.fields and name in self.expand
+
+
+class ShapedSerializerMixin:
+    """``?fields=`` and ``?expand=`` for the serializer at the root of a GET response.
+
+    ``?fields=id,username`` keeps only the listed top-level fields. Nested
+    serializers are relations: without ``?expand=`` they are rendered in full
+    as before, with it only the listed ones are, the others as primary keys
+    (``?expand=`` alone collapses them all). ``setup_queryset`` loads what a
+    shape renders: ``only()`` the columns it reads, ``select_related`` /
+    ``prefetch_related`` for expanded relations, bare ids for collapsed ones.
+    """
+    # Columns read by fields that are not model fields of the same name
+    field_columns = {}
+
+    @classmethod
+    def relations(cls) -> dict:
+        """``{field name: nested serializer class}``"""
+        found = {}
+        for name, field in cls._declared_fields.items():
+            if isinstance(field, serializers.ListSerializer):
+                found[name] = type(field.child)
+            elif isinstance(field, serializers.BaseSerializer):
+                found[name] = type(field)
+        return found
+
+    @classmethod
+    def full_shape(cls) -> Shape:
+        return Shape(frozenset(cls.Meta.fields), frozenset(cls.relations()))
+
+    @classmethod
+    def get_shape(cls, request) -> Shape:
+        """The shape asked for in ``request``; unknown names are a validation error"""
+        shape = cls.full_shape()
+        params = request.query_params
+        fields = _names(params[FIELDS_PARAM]) if FIELDS_PARAM in params else set(shape.fields)
+        expand = _names(params[EXPAND_PARAM]) if EXPAND_PARAM in params else set(shape.expand)
+        errors = {}
+        if fields - shape.fields:
+            errors[FIELDS_PARAM] = [f'Unknown field: {name}' for name in sorted(fields - shape.fields)]
+        if expand - shape.expand:
+            errors[EXPAND_PARAM] = [f'Not expandable: {name}' for name in sorted(expand - shape.expand)]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return Shape(frozenset(fields), frozenset(expand))
+
+    @classmethod
+    def columns(cls, shape: Shape) -> set:
+        """Names for ``only()`` that the fields of ``shape`` read from the model's own table"""
+        opts = cls.Meta.model._meta
+        columns = {opts.pk.name}
+        for name in shape.fields:
+            for column in cls.field_columns.get(name, (name,)):
+                try:
+                    field = opts.get_field(column)
+                except FieldDoesNotExist:
+                    continue
+                if field.concrete and not field.many_to_many:
+                    columns.add(column)
+        return columns
+
+    @classmethod
+    def setup_queryset(cls, queryset, shape=None, extra_columns=()):
+        """``queryset`` loading what ``shape`` renders, plus ``extra_columns`` (e.g. a pagination key)"""
+        shape = shape or cls.full_shape()
+        columns = cls.columns(shape) | set(extra_columns)
+        opts = queryset.model._meta
+        for name, nested in cls.relations().items():
+            if name not in shape.fields:
+                continue
+            if opts.get_field(name).many_to_many:
+                related_model = nested.Meta.model
+                if shape.expands(name):
+                    related = nested.setup_queryset(related_model.objects.all())
+                else:
+                    related = related_model.objects.only('pk').order_by('pk')
+                queryset = queryset.prefetch_related(Prefetch(name, queryset=related))
+            elif shape.expands(name):
+                queryset = queryset.select_related(name)
+                columns.update(f'{name}__{column}' for column in nested.columns(nested.full_shape()))
+        return queryset.only(*columns)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        root = self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+        )
+        if request is None or not root or request.method not in ('GET', 'HEAD'):
+            return fields
+        shape = self.get_shape(request)
+        relations = self.relations()
+        shaped = {}
+        for name, field in fields.items():
+            if name not in shape.fields:
+                continue
+            if name in relations and name not in shape.expand:
+                many = isinstance(field, serializers.ListSerializer)
+                field = serializers.PrimaryKeyRelatedField(many=many, read_only=True, source=field.source)
+            shaped[name] = field
+        return shaped
+
+
+class ImageThumbnailsField(serializers.Field):
+    """Thumbnail URLs per size and ``srcset`` (width descriptors) per format; empty until processed"""
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        variants = sorted(ready_variants(instance, self.image_field).items())
+        storage = getattr(instance, self.image_field).storage
+        request = self.context.get('request')
+
+        def url(name):
+            location = storage.url(name)
+            return request.build_absolute_uri(location) if request is not None else location
+
+        return {
+            'sizes': {str(size): {fmt: url(name) for fmt, name in files.items()} for size, files in variants},
+            'srcset': {
+                fmt: ', '.join(f'{url(files[fmt])} {size}w' for size, files in variants)
+                for fmt in FORMATS
+            } if variants else {},
+        }
+
+
+class SkillSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
+    photo_thumbnails = ImageThumbnailsField('photo')
+    field_columns = {'photo_thumbnails': ('photo', 'photo_variants')}
+
     class Meta:
         model = Skill
-        fields = ['id', 'name', 'slug', 'description', 'photo', 'experience_years']
+        fields = ['id', 'name', 'slug', 'description', 'photo', 'photo_thumbnails', 'experience_years']
+
+
+SKILL_BULK_MAX = 5000
+
 
+class SkillBulkItemSerializer(serializers.Serializer):
+    """One skill of a bulk import; name uniqueness is resolved by the manager, not per item"""
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    experience_years = serializers.IntegerField(required=False, allow_null=True, min_value=0, default=None)
 
-class UserSerializer(serializers.ModelSerializer):
+
+class SkillBulkCreateSerializer(serializers.Serializer):
+    skills = SkillBulkItemSerializer(many=True, allow_empty=False, max_length=SKILL_BULK_MAX)
+
+    def create(self, validated_data):
+        return Skill.objects.bulk_create_skills(Skill(**item) for item in validated_data['skills'])
+
+
+class SkillSuggestionSerializer(serializers.Serializer):
+    """Lightweight skill entry for autocomplete"""
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    slug = serializers.CharField(read_only=True)
+
+
+USER_FIELD_COLUMNS = {'avatar_thumbnails': ('avatar', 'avatar_variants')}
+
+
+class UserSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     skills_can_teach = SkillSerializer(many=True, read_only=True)
     skills_to_learn = SkillSerializer(many=True, read_only=True)
+    avatar_thumbnails = ImageThumbnailsField('avatar')
+    field_columns = USER_FIELD_COLUMNS
+
+    @classmethod
+    def setup_queryset(cls, queryset, shape=None, extra_columns=()):
+        """Prefetch both skill lists so a page of users costs a fixed number of queries"""
+        shape = shape or cls.full_shape()
+        queryset = super().setup_queryset(queryset, shape, extra_columns)
+        return queryset.with_balances() if 'points' in shape.fields else queryset
     
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'full_name', 'university', 
-            'avatar', 'points', 'skills_can_teach', 'skills_to_learn',
+            'avatar', 'avatar_thumbnails', 'points', 'skills_can_teach', 'skills_to_learn',
             'date_joined', 'last_login'
         ]
         read_only_fields = ['id', 'date_joined', 'last_login', 'points']
 
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """Simplified user serializer for list views"""
+    avatar_thumbnails = ImageThumbnailsField('avatar')
+    field_columns = USER_FIELD_COLUMNS
+
+    @classmethod
+    def setup_queryset(cls, queryset, shape=None, extra_columns=()):
+        shape = shape or cls.full_shape()
+        queryset = super().setup_queryset(queryset, shape, extra_columns)
+        return queryset.with_balances() if 'points' in shape.fields else queryset
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'full_name', 'university', 'avatar', 'points']
+        fields = ['id', 'username', 'full_name', 'university', 'avatar', 'avatar_thumbnails', 'points']
+
+
+class UserMatchSerializer(serializers.Serializer):
+    """Reciprocal match: who I can swap with and over which skills"""
+    user = UserListSerializer(read_only=True)
+    teaches_me = SkillSerializer(source='teaches_me_skills', many=True, read_only=True)
+    learns_from_me = SkillSerializer(source='learns_from_me_skills', many=True, read_only=True)
+    score = serializers.IntegerField(read_only=True)
 
 
-class ExchangeRequestSerializer(serializers.ModelSerializer):
+class ExchangeRequestListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Balances of every sender/receiver on the page in one query
+        exchanges = list(data.all() if hasattr(data, 'all') else data)
+        nested_users = [
+            name for name in ('sender', 'receiver')
+            if isinstance(self.child.fields.get(name), serializers.BaseSerializer)
+        ]
+        attach_balances([getattr(ex, name) for ex in exchanges for name in nested_users])
+        return super().to_representation(exchanges)
+
+
+class ExchangeRequestSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     sender = UserListSerializer(read_only=True)
     receiver = UserListSerializer(read_only=True)
     skill = SkillSerializer(read_only=True)
     
     class Meta:
         model = ExchangeRequest
+        list_serializer_class = ExchangeRequestListSerializer
         fields = [
             'id', 'sender', 'receiver', 'skill', 'message', 'price',
             'status', 'sender_confirmed', 'receiver_confirmed',
@@ -47,6 +268,13 @@ class ExchangeRequestSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'sender_confirmed_at', 'receiver_confirmed_at']
 
 
+class InboxCountersSerializer(serializers.Serializer):
+    """Badge counters of the current user"""
+    pending_incoming = serializers.IntegerField(read_only=True)
+    awaiting_my_confirmation = serializers.IntegerField(read_only=True)
+    awaiting_other_side = serializers.IntegerField(read_only=True)
+
+
 class ExchangeRequestCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExchangeRequest
@@ -61,3 +289,25 @@ class ExchangeRequestActionSerializer(serializers.Serializer):
         if value not in ['accept', 'decline', 'confirm']:
             raise serializers.ValidationError("Invalid action")
         return value
+
+
+EXCHANGE_BULK_ACTION_MAX = 200
+
+
+class ExchangeBulkActionItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=ACTIONS)
+
+
+class ExchangeBulkActionSerializer(serializers.Serializer):
+    """A batch of actions applied in one transaction"""
+    actions = ExchangeBulkActionItemSerializer(many=True, allow_empty=False, max_length=EXCHANGE_BULK_ACTION_MAX)
+
+
+class ExchangeBulkActionResultSerializer(serializers.Serializer):
+    """Outcome of one item; ``status`` is the exchange status after the batch"""
+    id = serializers.IntegerField(read_only=True)
+    action = serializers.CharField(read_only=True)
+    ok = serializers.BooleanField(read_only=True)
+    status = serializers.CharField(read_only=True, allow_null=True)
+    error = serializers.CharField(read_only=True)
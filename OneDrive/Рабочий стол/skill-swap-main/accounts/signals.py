@@ -0,0 +1,193 @@
+"""
+Signal handlers keeping derived data in sync with the models
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_cached_token, invalidate_cached_user
+from .catalog import invalidate_skill_catalog
+from .events import publish_exchange_change, publish_exchange_event
+from .images import image_fields, queue_image
+from .inbox import exchange_state, invalidate_inbox_counters, record_exchange_change
+from .matching import LEARN, TEACH, invalidate_match_index, match_index
+from .models import ExchangeRequest, Skill, User
+from .stats import invalidate_dashboard_stats
+
+SKILL_LINK_THROUGHS = (User.skills_can_teach.through, User.skills_to_learn.through)
+
+
+def _skill_link_pairs(instance, reverse, pk_set):
+    if reverse:
+        return [(user_id, instance.pk) for user_id in pk_set]
+    return [(instance.pk, skill_id) for skill_id in pk_set]
+
+
+def _update_match_index(kind, instance, action, reverse, pk_set):
+    # Only committed links may reach the index, here or in other workers
+    if action in ('post_add', 'post_remove') and pk_set:
+        pairs = _skill_link_pairs(instance, reverse, pk_set)
+        add = action == 'post_add'
+        transaction.on_commit(lambda: match_index.update(kind, pairs, add=add), robust=True)
+    elif action == 'post_clear':
+        transaction.on_commit(invalidate_match_index, robust=True)
+
+
+def _update_skill_counters(through, instance, action, reverse, pk_set):
+    # remove/clear signals may name skills that were never linked, so the
+    # affected counters are recomputed from the through table rather than
+    # decremented
+    stash = f'_cleared_{through._meta.model_name}'
+    if action == 'pre_clear' and not reverse:
+        skill_ids = through.objects.filter(user_id=instance.pk).values_list('skill_id', flat=True)
+        setattr(instance, stash, set(skill_ids))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        skill_ids = {instance.pk}
+    elif action == 'post_clear':
+        skill_ids = instance.__dict__.pop(stash, set())
+    else:
+        skill_ids = pk_set
+    if skill_ids:
+        Skill.objects.filter(pk__in=skill_ids).refresh_counters()
+
+
+def _touch_linked_users(through, instance, action, reverse, pk_set):
+    # The users' skill lists changed without their rows being saved
+    if not reverse:
+        if action == 'post_clear' or (action in ('post_add', 'post_remove') and pk_set):
+            User.objects.filter(pk=instance.pk).touch()
+    elif action == 'pre_clear':
+        User.objects.filter(pk__in=through.objects.filter(skill_id=instance.pk).values('user_id')).touch()
+    elif action in ('post_add', 'post_remove') and pk_set:
+        User.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(m2m_changed, sender=User.skills_can_teach.through)
+def skills_can_teach_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _update_match_index(TEACH, instance, action, reverse, pk_set)
+    _update_skill_counters(sender, instance, action, reverse, pk_set)
+    _touch_linked_users(sender, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=User.skills_to_learn.through)
+def skills_to_learn_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _update_match_index(LEARN, instance, action, reverse, pk_set)
+    _update_skill_counters(sender, instance, action, reverse, pk_set)
+    _touch_linked_users(sender, instance, action, reverse, pk_set)
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_skills(sender, instance, **kwargs):
+    skill_ids = set()
+    for through in SKILL_LINK_THROUGHS:
+        skill_ids.update(through.objects.filter(user_id=instance.pk).values_list('skill_id', flat=True))
+    instance._linked_skill_ids = skill_ids
+
+
+@receiver(post_delete, sender=User)
+def refresh_counters_of_deleted_user(sender, instance, **kwargs):
+    skill_ids = instance.__dict__.pop('_linked_skill_ids', None)
+    if skill_ids:
+        Skill.objects.filter(pk__in=skill_ids).refresh_counters()
+
+
+@receiver(pre_delete, sender=Skill)
+def touch_users_of_deleted_skill(sender, instance, **kwargs):
+    # The cascaded through-table rows do not emit m2m_changed either
+    for through in SKILL_LINK_THROUGHS:
+        User.objects.filter(pk__in=through.objects.filter(skill_id=instance.pk).values('user_id')).touch()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Skill)
+def skill_graph_node_deleted(sender, instance, **kwargs):
+    # Cascaded through-table rows do not emit m2m_changed
+    transaction.on_commit(invalidate_match_index, robust=True)
+
+
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+def skill_catalog_changed(sender, instance, **kwargs):
+    invalidate_skill_catalog()
+
+
+def _touches(update_fields, relevant):
+    return update_fields is None or not relevant.isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    # Logins and balance updates do not change the dashboard numbers
+    if created or _touches(update_fields, {'is_active', 'date_joined'}):
+        invalidate_dashboard_stats()
+
+
+@receiver(post_save, sender=ExchangeRequest)
+def exchange_saved(sender, instance, created, update_fields, **kwargs):
+    if created or _touches(update_fields, {'status'}):
+        invalidate_dashboard_stats()
+
+
+INBOX_STATE_FIELDS = {'status', 'sender', 'receiver', 'sender_confirmed', 'receiver_confirmed'}
+INBOX_STATE_ATTNAMES = {'status', 'sender_id', 'receiver_id', 'sender_confirmed', 'receiver_confirmed'}
+_UNKNOWN = object()
+
+
+@receiver(post_init, sender=ExchangeRequest)
+def remember_inbox_state(sender, instance, **kwargs):
+    # Loaded with some of the fields deferred: the previous buckets are unknown
+    if INBOX_STATE_ATTNAMES & instance.get_deferred_fields():
+        instance._inbox_state = _UNKNOWN
+    else:
+        instance._inbox_state = exchange_state(instance)
+
+
+@receiver(post_save, sender=ExchangeRequest)
+def update_inbox_counters(sender, instance, created, update_fields, **kwargs):
+    if not created and not _touches(update_fields, INBOX_STATE_FIELDS):
+        return
+    old = None if created else getattr(instance, '_inbox_state', _UNKNOWN)
+    new = exchange_state(instance)
+    if old is _UNKNOWN:
+        invalidate_inbox_counters({instance.sender_id, instance.receiver_id})
+        publish_exchange_event(instance, 'exchange.updated')
+    else:
+        record_exchange_change(old, new)
+        publish_exchange_change(instance, old, new)
+    instance._inbox_state = new
+
+
+@receiver(post_delete, sender=ExchangeRequest)
+def drop_from_inbox_counters(sender, instance, **kwargs):
+    record_exchange_change(exchange_state(instance), None)
+    publish_exchange_change(instance, exchange_state(instance), None)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ExchangeRequest)
+def stats_row_deleted(sender, instance, **kwargs):
+    invalidate_dashboard_stats()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    # Password, role and is_active changes must reach the next request
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def drop_cached_token(sender, instance, **kwargs):
+    invalidate_cached_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Skill)
+def queue_image_derivatives(sender, instance, update_fields, **kwargs):
+    for field in image_fields(sender):
+        if update_fields is None or field in update_fields:
+            queue_image(instance, field)
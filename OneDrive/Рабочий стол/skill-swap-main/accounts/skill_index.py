@@ -0,0 +1,74 @@
+"""
+In-memory prefix index over skill names and slugs for autocomplete.
+
+Each worker keeps a sorted list of lower-cased keys and answers a prefix
+query with two binary searches. Saving or deleting a ``Skill`` bumps the
+shared catalog version (see ``accounts.catalog``) and every worker reloads
+the list on its next lookup. Without a shared cache other workers miss the
+bump and reload once their copy of the version expires (``LOCAL_CACHE_TTL``).
+"""
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from .catalog import catalog_version
+
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+
+
+@dataclass(frozen=True)
+class SkillSuggestion:
+    id: int
+    name: str
+    slug: str
+
+
+class SkillPrefixIndex:
+    """Per-worker sorted (key, suggestion) list over ``Skill.name`` and ``Skill.slug``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._entries = []
+
+    def rebuild(self) -> None:
+        from .models import Skill
+
+        with self._lock:
+            version = catalog_version()
+            pairs = []
+            for pk, name, slug in Skill.objects.values_list('id', 'name', 'slug').iterator():
+                suggestion = SkillSuggestion(pk, name, slug)
+                pairs.append((name.casefold(), pk, suggestion))
+                if slug and slug != name.casefold():
+                    pairs.append((slug, pk, suggestion))
+            pairs.sort(key=lambda pair: (pair[0], pair[1]))
+            self._keys = [key for key, _pk, _suggestion in pairs]
+            self._entries = [suggestion for _key, _pk, suggestion in pairs]
+            self._version = version
+
+    def ensure_fresh(self) -> None:
+        if self._version != catalog_version():
+            self.rebuild()
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_DEFAULT_LIMIT) -> list:
+        """Skills whose name or slug starts with ``prefix``, alphabetically."""
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        self.ensure_fresh()
+        keys, entries = self._keys, self._entries
+        found, seen = [], set()
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix) and len(found) < limit:
+            suggestion = entries[position]
+            if suggestion.id not in seen:
+                seen.add(suggestion.id)
+                found.append(suggestion)
+            position += 1
+        return found
+
+
+skill_index = SkillPrefixIndex()
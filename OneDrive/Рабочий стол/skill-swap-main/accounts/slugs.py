@@ -0,0 +1,90 @@
+"""
+Unique slug allocation for ``Skill``.
+
+Slugs follow the ``base``, ``base-2``, ``base-3`` … scheme. Instead of probing
+candidates one by one, the highest taken suffix of a base is read in a
+single query (``slug = 'base' OR slug LIKE 'base-%'``); bulk allocation reads
+the taken suffixes of many bases per query and hands out the rest in memory.
+"""
+import re
+
+from django.db.models import Case, IntegerField, Max, Q, Value, When
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+SLUG_MAX_LENGTH = 120
+DEFAULT_SLUG_BASE = 'skill'
+BASES_PER_QUERY = 200
+
+_SUFFIX = re.compile(r'-[0-9]+$')
+
+
+def slug_base(name: str) -> str:
+    # Room for a "-NNNNN" suffix; names without ASCII letters still get a slug
+    return slugify(name)[:SLUG_MAX_LENGTH - 8].strip('-') or DEFAULT_SLUG_BASE
+
+
+def _namespace(base: str) -> Q:
+    return Q(slug=base) | Q(slug__startswith=f'{base}-', slug__regex=rf'^{re.escape(base)}-[0-9]+$')
+
+
+def _suffix(slug: str, base: str) -> int:
+    if slug == base:
+        return 1
+    tail = slug[len(base) + 1:]
+    return int(tail) if tail.isdigit() else 0
+
+
+def _candidate(base: str, suffix: int) -> str:
+    return base if suffix == 1 else f'{base}-{suffix}'
+
+
+def next_free_slug(queryset, name: str) -> str:
+    """The next unused slug for ``name`` in one query."""
+    base = slug_base(name)
+    top = queryset.filter(_namespace(base)).aggregate(
+        top=Max(Case(
+            When(slug=base, then=Value(1)),
+            default=Cast(Substr('slug', len(base) + 2), IntegerField()),
+            output_field=IntegerField(),
+        ))
+    )['top']
+    return _candidate(base, (top or 0) + 1)
+
+
+class SlugAllocator:
+    """Allocate slugs for many names at once without per-name queries."""
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self._next = {}
+        self._allocated = set()
+
+    def load(self, names) -> None:
+        bases = list(dict.fromkeys(slug_base(name) for name in names if slug_base(name) not in self._next))
+        for start in range(0, len(bases), BASES_PER_QUERY):
+            chunk = bases[start:start + BASES_PER_QUERY]
+            condition = Q()
+            for base in chunk:
+                condition |= _namespace(base)
+            top = dict.fromkeys(chunk, 0)
+            for slug in self.queryset.filter(condition).values_list('slug', flat=True).iterator():
+                # "python-2" is both the base "python-2" and suffix 2 of "python"
+                for base in {slug, _SUFFIX.sub('', slug)}:
+                    if base in top:
+                        top[base] = max(top[base], _suffix(slug, base))
+            for base, taken in top.items():
+                self._next[base] = taken + 1
+
+    def allocate(self, name: str) -> str:
+        base = slug_base(name)
+        if base not in self._next:
+            self.load([name])
+        suffix = self._next[base]
+        # A batch may hold both "Python" and "Python 2", whose namespaces overlap
+        while _candidate(base, suffix) in self._allocated:
+            suffix += 1
+        self._next[base] = suffix + 1
+        slug = _candidate(base, suffix)
+        self._allocated.add(slug)
+        return slug
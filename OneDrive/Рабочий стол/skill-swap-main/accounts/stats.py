@@ -0,0 +1,56 @@
+"""
+Cached statistics snapshot for the admin dashboard.
+
+Each model is summarised with a single conditional ``aggregate()``; the
+result is cached for ``ADMIN_DASHBOARD_CACHE_TTL`` seconds and dropped
+explicitly by ``accounts.signals`` whenever a user or exchange change
+affects the numbers.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ExchangeRequest, Skill, User
+
+DASHBOARD_STATS_CACHE_KEY = 'accounts:dashboard_stats'
+DEFAULT_DASHBOARD_CACHE_TTL = 60
+
+
+def compute_dashboard_stats() -> dict:
+    now = timezone.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    stats = User.objects.aggregate(
+        total_users=Count('id'),
+        active_users=Count('id', filter=Q(is_active=True)),
+        new_users_today=Count('id', filter=Q(date_joined__gte=today)),
+        new_users_week=Count('id', filter=Q(date_joined__gte=now - timedelta(days=7))),
+    )
+    stats.update(ExchangeRequest.objects.aggregate(
+        total_exchanges=Count('id'),
+        pending_exchanges=Count('id', filter=Q(status=ExchangeRequest.STATUS_PENDING)),
+        completed_exchanges=Count('id', filter=Q(status=ExchangeRequest.STATUS_COMPLETED)),
+    ))
+    stats['total_skills'] = Skill.objects.count()
+    stats['popular_skills'] = list(
+        Skill.objects.order_by('-teachers_count', 'name')
+        .values('id', 'name', 'slug', 'teachers_count', 'learners_count')[:5]
+    )
+    stats['computed_at'] = now
+    return stats
+
+
+def get_dashboard_stats() -> dict:
+    """Return the cached snapshot, computing it on a miss."""
+    stats = cache.get(DASHBOARD_STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        ttl = getattr(settings, 'ADMIN_DASHBOARD_CACHE_TTL', DEFAULT_DASHBOARD_CACHE_TTL)
+        cache.set(DASHBOARD_STATS_CACHE_KEY, stats, ttl)
+    return stats
+
+
+def invalidate_dashboard_stats() -> None:
+    cache.delete(DASHBOARD_STATS_CACHE_KEY)
@@ -0,0 +1,70 @@
+"""
+Server-Sent Events endpoint for exchange events.
+
+Served by the ASGI application (``skillswap/asgi.py``): every open stream is
+a coroutine waiting on ``accounts.events``, not a worker thread. Browsers
+authenticate with the session cookie, API clients with their DRF token.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.authtoken.models import Token
+
+from .events import get_broker
+
+DEFAULT_HEARTBEAT = 15  # seconds; keeps proxies from closing an idle stream
+RECONNECT_DELAY_MS = 3000
+
+
+async def _authenticate(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword != 'Token' or not key.strip():
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=key.strip())
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def format_event(event_id, event) -> str:
+    data = json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f'id: {event_id}\nevent: {event["type"]}\ndata: {data}\n\n'
+
+
+async def _stream(subscription):
+    heartbeat = getattr(settings, 'EXCHANGE_EVENTS_HEARTBEAT', DEFAULT_HEARTBEAT)
+    yield f'retry: {RECONNECT_DELAY_MS}\n\n'
+    while True:
+        item = await subscription.get(heartbeat)
+        yield ': keep-alive\n\n' if item is None else format_event(*item)
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    def __init__(self, subscription):
+        super().__init__(_stream(subscription), content_type='text/event-stream')
+        self.subscription = subscription
+        self['Cache-Control'] = 'no-cache'
+        # nginx would otherwise buffer the stream
+        self['X-Accel-Buffering'] = 'no'
+
+    def close(self):
+        # Called by the handler when the client disconnects or the response ends
+        self.subscription.close()
+        super().close()
+
+
+@require_GET
+async def exchange_events(request):
+    """Stream of the current user's exchange events (text/event-stream)"""
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    subscription = await get_broker().subscribe(user.pk, request.headers.get('Last-Event-ID'))
+    return EventStreamResponse(subscription)
@@ -0,0 +1,42 @@
+"""
+Template tags for avatar and skill photo thumbnails (see ``accounts.images``).
+
+    {% load images %}
+    {% picture user "avatar" 64 alt="avatar" style="height:64px;width:64px;" %}
+"""
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from .. import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(instance, field, size, fmt='jpeg'):
+    return images.thumbnail_url(instance, field, int(size), fmt)
+
+
+@register.simple_tag
+def image_srcset(instance, field, size, fmt='jpeg'):
+    return images.srcset(instance, field, int(size), fmt)
+
+
+@register.simple_tag
+def picture(instance, field, size, **attrs):
+    """``<picture>`` with WebP and JPEG thumbnails for an image shown at ``size`` CSS pixels.
+
+    Keyword arguments become attributes of the ``<img>``; until the
+    thumbnails are ready it shows the original.
+    """
+    size = int(size)
+    if not images.ready_variants(instance, field):
+        return format_html('<img src="{}"{}>', images.thumbnail_url(instance, field, size), flatatt(attrs))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}" srcset="{}"{}></picture>',
+        images.srcset(instance, field, size, 'webp'),
+        images.thumbnail_url(instance, field, size),
+        images.srcset(instance, field, size),
+        flatatt(attrs),
+    )
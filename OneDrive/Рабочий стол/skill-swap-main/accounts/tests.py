@@ -1,8 +1,44 @@
-from django.test import TestCase
+import json
+import shutil
+import time
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.core.management import call_command
 from django.urls import reverse
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 
-from .models import Skill, ExchangeRequest
+from PIL import Image
+
+from .models import Skill, ExchangeRequest, ImageTask, OutboundEmail, PointsBalance, PointsEntry
+from .serializers import UserListSerializer
+from asgiref.sync import sync_to_async
+
+from . import exchanges, ledger
+from .events import CacheBroker, LocalBroker, get_broker
+from .inbox import compute_inbox_counters, get_inbox_counters
+from .mail import claim_batch, deliver_outbox
+from .matching import match_index
+from .search import search_users, ADMIN_SEARCH_FIELDS
+from .skill_index import skill_index
+from .slugs import SlugAllocator
+from .stats import get_dashboard_stats
+from .versioning import cache_is_shared
 
 
 User = get_user_model()
@@ -26,6 +62,56 @@ class SkillSlugTests(TestCase):
         self.assertNotEqual(third.slug, first.slug)
         self.assertNotEqual(third.slug, second.slug)
 
+    def test_slug_allocation_is_constant_query(self):
+        for i in range(12):
+            Skill.objects.create(name="Python" + " " * i)
+        Skill.objects.create(name="Python-advanced")
+        # one lookup of the highest suffix, then the INSERT (inside a savepoint)
+        with CaptureQueriesContext(connection) as ctx:
+            skill = Skill.objects.create(name="Python" + " " * 12)
+        self.assertEqual(skill.slug, "python-13")
+        self.assertEqual(sum(1 for q in ctx.captured_queries if q["sql"].startswith("SELECT")), 1)
+
+    def test_bulk_create_allocates_slugs_and_skips_existing(self):
+        Skill.objects.create(name="Python")
+        created = Skill.objects.bulk_create_skills(
+            Skill(name=name) for name in ["Python", "Python ", "python 2", "Python 2", "Гитара", "Гитара"]
+        )
+        self.assertEqual([s.name for s in created], ["python 2", "Python 2", "Гитара"])
+        slugs = set(Skill.objects.values_list("slug", flat=True))
+        self.assertEqual(len(slugs), Skill.objects.count())
+        self.assertIn("skill", slugs)
+
+    def test_bulk_create_retries_names_and_slugs_taken_meanwhile(self):
+        load = SlugAllocator.load
+
+        def racing_load(allocator, names):
+            load(allocator, names)
+            if not Skill.objects.filter(name="Go").exists():
+                # Another request inserts between the lookup and the INSERT
+                Skill.objects.bulk_create([Skill(name="Go", slug="go"), Skill(name="Snake", slug="python")])
+
+        with mock.patch.object(SlugAllocator, "load", racing_load):
+            created = Skill.objects.bulk_create_skills([Skill(name="Python"), Skill(name="Go")])
+        self.assertEqual([(s.name, s.slug) for s in created], [("Python", "python-2")])
+
+    def test_bulk_create_refreshes_skill_index(self):
+        cache.clear()
+        self.assertEqual(skill_index.suggest("rus"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Skill.objects.bulk_create_skills([Skill(name="Rust")])
+        self.assertEqual([s.name for s in skill_index.suggest("rus")], ["Rust"])
+
+    def test_skill_index_rechecks_unshared_cache(self):
+        cache.clear()
+        self.assertEqual(skill_index.suggest("go"), [])
+        # Added through another worker, whose catalog bump stays in its own LocMemCache
+        Skill.objects.bulk_create([Skill(name="Go", slug="go")])
+        self.assertEqual(skill_index.suggest("go"), [])
+        later = time.time() + settings.LOCAL_CACHE_TTL + 1
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual([s.name for s in skill_index.suggest("go")], ["Go"])
+
 
 class ExchangeRequestModelTests(TestCase):
     def setUp(self) -> None:
@@ -150,3 +236,762 @@ class ExchangeViewsTests(TestCase):
         self.assertContains(resp_learn, "receiver")
         self.assertNotContains(resp_learn, "sender")
 
+
+class AsyncPageViewsTests(TestCase):
+    def setUp(self) -> None:
+        self.me = User.objects.create_user(username="me", password="pass", points=20)
+        self.anna = User.objects.create_user(username="anna", password="pass")
+        self.boris = User.objects.create_user(username="boris", password="pass")
+        skill = Skill.objects.create(name="Python")
+        self.anna.skills_can_teach.add(skill)
+        ExchangeRequest.objects.create(sender=self.me, receiver=self.anna, skill=skill)
+        ExchangeRequest.objects.create(sender=self.anna, receiver=self.boris, skill=skill)
+
+    async def test_exchange_list_renders_from_async_view(self):
+        await self.async_client.aforce_login(self.me)
+        response = await self.async_client.get(reverse("accounts:exchange_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ex.receiver.username for ex in response.context["items"]], ["anna"])
+
+    async def test_user_search_pages_with_skill_cards(self):
+        await self.async_client.aforce_login(self.me)
+        response = await self.async_client.get(reverse("accounts:user_search"), {"skill": "Pyth"})
+        page = response.context["users"]
+        self.assertEqual([user.username for user in page], ["anna"])
+        self.assertEqual([skill.name for skill in page[0].teach_preview], ["Python"])
+        last = await self.async_client.get(reverse("accounts:user_search"), {"page": 99})
+        self.assertEqual(last.context["users"].number, 1)
+
+    async def test_anonymous_is_redirected_to_login(self):
+        response = await self.async_client.get(reverse("accounts:exchange_list"))
+        self.assertEqual(response.status_code, 302)
+
+
+class SkillMatchIndexTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.python = Skill.objects.create(name="Python")
+        self.guitar = Skill.objects.create(name="Guitar")
+        self.me = User.objects.create_user(username="me", password="pass")
+        self.partner = User.objects.create_user(username="partner", password="pass")
+        self.teacher_only = User.objects.create_user(username="teacher", password="pass")
+        self.me.skills_can_teach.add(self.python)
+        self.me.skills_to_learn.add(self.guitar)
+        self.partner.skills_can_teach.add(self.guitar)
+        self.partner.skills_to_learn.add(self.python)
+        self.teacher_only.skills_can_teach.add(self.guitar)
+
+    def test_matches_are_reciprocal(self):
+        matches = match_index.matches_for(self.me.pk)
+        self.assertEqual([m.user_id for m in matches], [self.partner.pk])
+        self.assertEqual(matches[0].teaches_me, {self.guitar.pk})
+        self.assertEqual(matches[0].learns_from_me, {self.python.pk})
+
+    def test_index_follows_profile_changes(self):
+        match_index.matches_for(self.me.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_only.skills_to_learn.add(self.python)
+        self.assertEqual(len(match_index.matches_for(self.me.pk)), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.partner.skills_to_learn.remove(self.python)
+        self.assertEqual([m.user_id for m in match_index.matches_for(self.me.pk)], [self.teacher_only.pk])
+
+    def test_reverse_side_updates_index(self):
+        match_index.matches_for(self.me.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.learners.add(self.teacher_only)
+        self.assertIn(self.teacher_only.pk, [m.user_id for m in match_index.matches_for(self.me.pk)])
+
+    def test_rolled_back_links_never_reach_the_index(self):
+        match_index.matches_for(self.me.pk)
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError), transaction.atomic():
+            self.teacher_only.skills_to_learn.add(self.python)
+            self.assertEqual(len(match_index.matches_for(self.me.pk)), 1)
+            raise RuntimeError
+        self.assertEqual(len(match_index.matches_for(self.me.pk)), 1)
+
+    def test_bump_by_another_worker_forces_a_rebuild(self):
+        match_index.matches_for(self.me.pk)
+        # Another worker links a skill and bumps the version first
+        User.skills_to_learn.through.objects.create(user=self.teacher_only, skill=self.python)
+        cache.incr("accounts:match_index:version")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.partner.skills_to_learn.remove(self.python)
+        self.assertEqual([m.user_id for m in match_index.matches_for(self.me.pk)], [self.teacher_only.pk])
+
+    def test_unseen_bump_is_picked_up_after_local_ttl(self):
+        match_index.matches_for(self.me.pk)
+        # A change made by another worker: its version bump never reaches this process
+        User.skills_to_learn.through.objects.create(user=self.teacher_only, skill=self.python)
+        self.assertEqual(len(match_index.matches_for(self.me.pk)), 1)
+        later = time.time() + settings.LOCAL_CACHE_TTL + 1
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual(len(match_index.matches_for(self.me.pk)), 2)
+
+    def test_caches_without_an_atomic_incr_are_not_shared(self):
+        for backend, shared in [
+            ("django.core.cache.backends.locmem.LocMemCache", False),
+            ("django.core.cache.backends.db.DatabaseCache", False),
+            ("django.core.cache.backends.redis.RedisCache", True),
+        ]:
+            with self.subTest(backend=backend), override_settings(CACHES={"default": {"BACKEND": backend}}):
+                self.assertEqual(cache_is_shared(), shared)
+
+    def test_matches_view_lists_partner(self):
+        self.client.login(username="me", password="pass")
+        response = self.client.get(reverse("accounts:user_matches"))
+        self.assertContains(response, "@partner")
+        self.assertNotContains(response, "@teacher")
+
+
+class UserSearchTests(TestCase):
+    def setUp(self) -> None:
+        self.anna = User.objects.create_user(username="anna", password="pass", full_name="Anna Smith")
+        self.bob = User.objects.create_user(username="bob", password="pass", full_name="Bob Annanov",
+                                            email="bob@example.com")
+        self.carl = User.objects.create_user(username="carl", password="pass", full_name="Carl")
+
+    def test_matches_substrings_ranked_by_relevance(self):
+        found = list(search_users(User.objects.all(), "anna"))
+        self.assertEqual(found, [self.anna, self.bob])
+
+    def test_index_follows_user_save(self):
+        self.carl.full_name = "Carl Annaberg"
+        self.carl.save()
+        self.assertIn(self.carl, search_users(User.objects.all(), "annab"))
+        self.anna.delete()
+        self.assertEqual(list(search_users(User.objects.all(), "anna smith")), [])
+
+    def test_short_query_and_custom_fields(self):
+        self.assertIn(self.bob, search_users(User.objects.all(), "bo"))
+        self.assertEqual(list(search_users(User.objects.all(), "example")), [])
+        found = search_users(User.objects.all(), "example", fields=ADMIN_SEARCH_FIELDS)
+        self.assertEqual(list(found), [self.bob])
+
+
+class ProfileEditFormTests(TestCase):
+    def test_skill_widgets_render_only_selected_skills(self):
+        user = User.objects.create_user(username="me", password="pass")
+        chosen = Skill.objects.create(name="Python")
+        Skill.objects.create(name="Cooking")
+        user.skills_can_teach.add(chosen)
+        self.client.login(username="me", password="pass")
+        response = self.client.get(reverse("accounts:profile_edit"))
+        self.assertContains(response, "Python")
+        self.assertNotContains(response, "Cooking")
+        self.assertContains(response, reverse("api:skill-suggest"))
+
+
+class AdminKeysetPaginationTests(TestCase):
+    def setUp(self) -> None:
+        self.admin = User.objects.create_user(username="admin", password="pass", role=User.ROLE_ADMIN)
+        other = User.objects.create_user(username="other", password="pass")
+        skill = Skill.objects.create(name="Python")
+        ExchangeRequest.objects.bulk_create([
+            ExchangeRequest(sender=self.admin, receiver=other, skill=skill, message=f"m{i}")
+            for i in range(25)
+        ])
+        self.client.login(username="admin", password="pass")
+
+    def test_admin_exchanges_cursor_pages(self):
+        url = reverse("accounts:admin_exchanges")
+        first = self.client.get(url)
+        self.assertEqual(len(first.context["exchanges"]), 20)
+        self.assertEqual(first.context["exchanges"].count, 25)
+        second = self.client.get(url, {"cursor": first.context["exchanges"].next_cursor, "count": "0"})
+        self.assertEqual(len(second.context["exchanges"]), 5)
+        self.assertIsNone(second.context["exchanges"].count)
+        self.assertFalse(second.context["exchanges"].has_next)
+
+    def test_admin_users_keyset_without_search(self):
+        response = self.client.get(reverse("accounts:admin_users"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([u.username for u in response.context["users"]], ["other", "admin"])
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class AdminExportTests(TestCase):
+    def setUp(self) -> None:
+        self.admin = User.objects.create_user(username="admin", password="pass", role=User.ROLE_ADMIN)
+        self.anna = User.objects.create_user(username="anna", password="pass", full_name="=HYPERLINK(1)")
+        self.boris = User.objects.create_user(username="boris", password="pass")
+        skill = Skill.objects.create(name="Python")
+        Skill.objects.create(name="Гитара")
+        ExchangeRequest.objects.create(sender=self.anna, receiver=self.boris, skill=skill)
+        ExchangeRequest.objects.create(
+            sender=self.boris, receiver=self.anna, skill=skill, status=ExchangeRequest.STATUS_ACCEPTED,
+        )
+        self.client.login(username="admin", password="pass")
+
+    def _rows(self, response):
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_users_csv_streams_all_rows_with_header(self):
+        response = self.client.get(reverse("accounts:admin_users_export"), {"format": "csv"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        self.assertIn('attachment; filename="users-', response["Content-Disposition"])
+        rows = self._rows(response)
+        self.assertTrue(rows[0].startswith("id,username,email"))
+        self.assertEqual(len(rows), 4)
+
+    def test_csv_escapes_formulas(self):
+        response = self.client.get(reverse("accounts:admin_users_export"), {"q": "anna"})
+        rows = self._rows(response)
+        self.assertEqual(len(rows), 2)
+        self.assertIn("'=HYPERLINK(1)", rows[1])
+
+    def test_exchanges_ndjson_honours_status_filter(self):
+        response = self.client.get(
+            reverse("accounts:admin_exchanges_export"),
+            {"format": "ndjson", "status": ExchangeRequest.STATUS_ACCEPTED},
+        )
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        rows = [json.loads(line) for line in self._rows(response)]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["sender__username"], "boris")
+        self.assertEqual(rows[0]["skill__name"], "Python")
+
+    def test_skills_filter_matches_list_page(self):
+        rows = self._rows(self.client.get(reverse("accounts:admin_skills_export"), {"q": "Гит"}))
+        self.assertEqual(len(rows), 2)
+        self.assertIn("Гитара", rows[1])
+
+    def test_non_admin_is_redirected(self):
+        self.client.login(username="anna", password="pass")
+        response = self.client.get(reverse("accounts:admin_users_export"))
+        self.assertEqual(response.status_code, 302)
+
+
+class UserCardProjectionTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.skills = [Skill.objects.create(name=f"Skill {i}") for i in range(5)]
+        self.viewer = User.objects.create_user(username="viewer", password="pass")
+
+    def _add_users(self, count, offset=0):
+        for i in range(offset, offset + count):
+            user = User.objects.create_user(username=f"user{i:02d}", password="pass")
+            user.skills_can_teach.add(*self.skills)
+            user.skills_to_learn.add(self.skills[0])
+
+    def _search_queries(self):
+        # Per-user caches (navigation badges) are warm for both measurements
+        self.client.get(reverse("accounts:user_search"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("accounts:user_search"))
+        return response, len(ctx.captured_queries)
+
+    def test_cards_carry_preview_and_counts(self):
+        self._add_users(1)
+        card = User.objects.with_skill_cards(preview=3).get(username="user00")
+        self.assertEqual([s.name for s in card.teach_preview], ["Skill 0", "Skill 1", "Skill 2"])
+        self.assertEqual(card.teach_count, 5)
+        self.assertEqual(card.learn_count, 1)
+
+    def test_search_page_query_count_is_constant(self):
+        self.client.login(username="viewer", password="pass")
+        self._add_users(2)
+        response, few = self._search_queries()
+        self.assertContains(response, "+2")
+        self._add_users(10, offset=2)
+        _response, many = self._search_queries()
+        self.assertEqual(few, many)
+
+
+class SkillCounterTests(TestCase):
+    def setUp(self) -> None:
+        self.python = Skill.objects.create(name="Python")
+        self.guitar = Skill.objects.create(name="Guitar")
+        self.anna = User.objects.create_user(username="anna", password="pass")
+        self.bob = User.objects.create_user(username="bob", password="pass")
+
+    def _counts(self, skill):
+        skill.refresh_from_db()
+        return skill.teachers_count, skill.learners_count
+
+    def test_counters_follow_m2m_changes(self):
+        self.anna.skills_can_teach.add(self.python, self.guitar)
+        self.bob.skills_can_teach.add(self.python)
+        self.bob.skills_to_learn.add(self.guitar)
+        self.assertEqual(self._counts(self.python), (2, 0))
+        self.assertEqual(self._counts(self.guitar), (1, 1))
+        # removing a skill that was never linked must not decrement
+        self.bob.skills_can_teach.remove(self.python, self.guitar)
+        self.assertEqual(self._counts(self.python), (1, 0))
+        self.assertEqual(self._counts(self.guitar), (1, 1))
+        self.python.teachers.add(self.bob)
+        self.anna.skills_can_teach.clear()
+        self.assertEqual(self._counts(self.python), (1, 0))
+        self.assertEqual(self._counts(self.guitar), (0, 1))
+        self.bob.delete()
+        self.assertEqual(self._counts(self.python), (0, 0))
+        self.assertEqual(self._counts(self.guitar), (0, 0))
+
+    def test_rebuild_command(self):
+        self.anna.skills_to_learn.add(self.python)
+        Skill.objects.update(teachers_count=7, learners_count=7)
+        call_command("rebuild_skill_counters", stdout=StringIO())
+        self.assertEqual(self._counts(self.python), (0, 1))
+
+    def test_skill_detail_uses_counters(self):
+        self.anna.skills_can_teach.add(self.python)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("skill_detail", args=[self.python.slug]))
+        self.assertEqual(response.context["can_teach_count"], 1)
+
+
+class AdminDashboardStatsTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.admin = User.objects.create_user(username="admin", password="pass", role=User.ROLE_ADMIN)
+        self.other = User.objects.create_user(username="other", password="pass")
+        self.skill = Skill.objects.create(name="Python")
+        self.client.login(username="admin", password="pass")
+
+    def test_snapshot_is_cached_until_invalidated(self):
+        url = reverse("accounts:admin_dashboard")
+        response = self.client.get(url)
+        self.assertEqual(response.context["total_users"], 2)
+        self.assertEqual(response.context["pending_exchanges"], 0)
+        self.assertIn("stats_computed_at", response.context)
+
+        # A warm snapshot skips every statistics query
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse(any('COUNT' in q["sql"] for q in ctx.captured_queries))
+
+        ExchangeRequest.objects.create(sender=self.admin, receiver=self.other, skill=self.skill)
+        response = self.client.get(url)
+        self.assertEqual(response.context["total_exchanges"], 1)
+        self.assertEqual(response.context["pending_exchanges"], 1)
+
+    def test_balance_updates_keep_snapshot(self):
+        url = reverse("accounts:admin_dashboard")
+        self.client.get(url)
+        self.other.points = 100
+        self.other.save(update_fields=["points"])
+        self.assertIsNotNone(cache.get("accounts:dashboard_stats"))
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self) -> None:
+        self.sender = User.objects.create_user(username="sender", password="pass", points=20, email="s@example.com")
+        self.receiver = User.objects.create_user(username="receiver", password="pass", email="r@example.com")
+        self.skill = Skill.objects.create(name="Python")
+        self.ex = ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=5)
+        self.ex.hold_from_sender()
+
+    def test_accept_queues_email_instead_of_sending(self):
+        self.client.login(username="receiver", password="pass")
+        self.client.post(reverse("accounts:exchange_accept", args=[self.ex.pk]))
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.recipients, ["s@example.com"])
+        self.assertEqual(queued.status, OutboundEmail.STATUS_PENDING)
+
+        call_command("send_outbox", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["s@example.com"])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundEmail.STATUS_SENT)
+        self.assertIsNotNone(queued.sent_at)
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        email = OutboundEmail.objects.create(subject="s", body="b", recipients=["x@example.com"])
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=OSError("smtp down")):
+            self.assertEqual(deliver_outbox(max_attempts=2), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("smtp down", email.last_error)
+        # Not due yet: the next run skips it
+        self.assertEqual(deliver_outbox(), (0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=email.created_at)
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=OSError("smtp down")):
+            deliver_outbox(max_attempts=2)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.STATUS_FAILED)
+
+    def test_unreachable_server_fails_the_batch_with_backoff(self):
+        OutboundEmail.objects.create(subject="s", body="b", recipients=["x@example.com"])
+        OutboundEmail.objects.create(subject="s", body="b", recipients=["y@example.com"])
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.open", side_effect=OSError("refused")):
+            self.assertEqual(deliver_outbox(), (0, 2))
+        for email in OutboundEmail.objects.all():
+            self.assertEqual(email.attempts, 1)
+            self.assertIn("refused", email.last_error)
+            self.assertGreater(email.next_attempt_at, timezone.now())
+
+    def test_claimed_batch_is_leased_before_sending(self):
+        email = OutboundEmail.objects.create(subject="s", body="b", recipients=["x@example.com"])
+        self.assertEqual(claim_batch(10), [email])
+        email.refresh_from_db()
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        # Another sender finds nothing due while the lease runs
+        self.assertEqual(claim_batch(10), [])
+
+    def test_messages_taken_over_after_the_lease_are_not_sent_twice(self):
+        first, second, third = (
+            OutboundEmail.objects.create(subject="s", body="b", recipients=[f"{n}@example.com"]) for n in "xyz"
+        )
+        real_send = EmailMessage.send
+
+        def slow_send(message, *args, **kwargs):
+            if message.to == ["x@example.com"]:
+                # The server is so slow that the batch lease runs out and
+                # another sender claims the third message
+                OutboundEmail.objects.filter(pk=third.pk).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+            else:
+                first.refresh_from_db()
+                self.assertEqual(first.status, OutboundEmail.STATUS_SENT)
+            return real_send(message, *args, **kwargs)
+
+        with mock.patch("django.core.mail.EmailMessage.send", slow_send):
+            self.assertEqual(deliver_outbox(), (2, 0))
+        self.assertEqual([m.to for m in mail.outbox], [["x@example.com"], ["y@example.com"]])
+        third.refresh_from_db()
+        self.assertEqual((third.status, third.attempts), (OutboundEmail.STATUS_PENDING, 0))
+
+    def test_loop_survives_delivery_errors(self):
+        calls = mock.Mock(side_effect=[OSError("db gone"), KeyboardInterrupt])
+        with mock.patch("accounts.management.commands.send_outbox.deliver_outbox", calls), \
+                mock.patch("accounts.management.commands.send_outbox.time.sleep") as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("send_outbox", "--loop", stdout=StringIO())
+        self.assertEqual(calls.call_count, 2)
+        sleep.assert_called_once()
+
+
+class PointsLedgerTests(TestCase):
+    def setUp(self) -> None:
+        self.sender = User.objects.create_user(username="sender", password="pass", points=20)
+        self.receiver = User.objects.create_user(username="receiver", password="pass", points=0)
+        self.skill = Skill.objects.create(name="Python")
+
+    def _complete(self):
+        ex = ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=5)
+        ex.hold_from_sender()
+        ex.sender_confirmed = ex.receiver_confirmed = True
+        ex.save(update_fields=["sender_confirmed", "receiver_confirmed"])
+        self.assertTrue(ex.try_complete())
+        return ex
+
+    def test_every_posting_balances(self):
+        ex = self._complete()
+        per_txn = PointsEntry.objects.order_by().values("txn").annotate(total=Sum("amount"))
+        self.assertTrue(per_txn)
+        self.assertTrue(all(row["total"] == 0 for row in per_txn))
+        kinds = set(ex.points_entries.values_list("kind", flat=True))
+        self.assertEqual(kinds, {"hold", "transfer", "charge", "bonus"})
+
+    def test_completion_does_not_touch_user_rows(self):
+        ex = ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=5)
+        ex.hold_from_sender()
+        ex.sender_confirmed = ex.receiver_confirmed = True
+        ex.save(update_fields=["sender_confirmed", "receiver_confirmed"])
+        with CaptureQueriesContext(connection) as ctx:
+            ex.try_complete()
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith(("UPDATE", "INSERT"))]
+        self.assertFalse(any('"accounts_user"' in sql for sql in writes if sql.startswith("UPDATE")))
+
+    def test_snapshot_keeps_balances(self):
+        self._complete()
+        before = (ledger.balance_of(self.sender.pk), ledger.balance_of(self.receiver.pk))
+        self.assertEqual(ledger.take_snapshots(lag=timedelta(0)), 2)
+        snapshot = PointsBalance.objects.get(user=self.receiver)
+        self.assertEqual(snapshot.points, 15)
+        self.assertEqual(snapshot.last_entry_id, PointsEntry.objects.order_by("-id").values_list("id", flat=True)[0])
+        self.assertEqual((ledger.balance_of(self.sender.pk), ledger.balance_of(self.receiver.pk)), before)
+
+        # Entries after the snapshot are still counted
+        self.receiver.points = 40
+        self.receiver.save()
+        self.receiver.refresh_from_db()
+        self.assertEqual(self.receiver.points, 40)
+        self.assertEqual(User.objects.with_balances().get(pk=self.receiver.pk).ledger_points, 40)
+
+    def test_overlapping_snapshot_runs_count_entries_once(self):
+        self._complete()
+        before = (ledger.balance_of(self.sender.pk), ledger.balance_of(self.receiver.pk))
+        lock = PointsBalance.objects.select_for_update
+        other_run = []
+
+        def select_for_update(*args, **kwargs):
+            # Another run commits while this one waits for the row locks
+            if not other_run:
+                other_run.append(None)
+                other_run[0] = ledger.take_snapshots(lag=timedelta(0))
+            return lock(*args, **kwargs)
+
+        with mock.patch.object(PointsBalance.objects, "select_for_update", select_for_update):
+            ledger.take_snapshots(lag=timedelta(0))
+        self.assertEqual(other_run, [2])
+        self.assertEqual(PointsBalance.objects.get(user=self.receiver).points, 15)
+        self.assertEqual((ledger.balance_of(self.sender.pk), ledger.balance_of(self.receiver.pk)), before)
+
+
+class InboxCountersTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.sender = User.objects.create_user(username="sender", password="pass", points=50)
+        self.receiver = User.objects.create_user(username="receiver", password="pass")
+        self.skill = Skill.objects.create(name="Python")
+
+    def _send(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ex = ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=5)
+            ex.hold_from_sender()
+        return ex
+
+    def test_counters_follow_exchange_lifecycle_without_queries(self):
+        # Warm both users' counters
+        get_inbox_counters(self.sender.pk)
+        get_inbox_counters(self.receiver.pk)
+        ex = self._send()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_inbox_counters(self.receiver.pk)["pending_incoming"], 1)
+            self.assertEqual(get_inbox_counters(self.sender.pk)["awaiting_other_side"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ex.status = ExchangeRequest.STATUS_ACCEPTED
+            ex.save(update_fields=["status"])
+        with self.captureOnCommitCallbacks(execute=True):
+            ex.sender_confirmed = True
+            ex.save(update_fields=["sender_confirmed"])
+        with self.assertNumQueries(0):
+            receiver = get_inbox_counters(self.receiver.pk)
+            sender = get_inbox_counters(self.sender.pk)
+        self.assertEqual(receiver, compute_inbox_counters(self.receiver.pk))
+        self.assertEqual(sender, compute_inbox_counters(self.sender.pk))
+        self.assertEqual(receiver["awaiting_my_confirmation"], 1)
+        self.assertEqual(sender["awaiting_other_side"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ex.delete()
+        self.assertEqual(get_inbox_counters(self.receiver.pk), compute_inbox_counters(self.receiver.pk))
+        self.assertEqual(sum(get_inbox_counters(self.sender.pk).values()), 0)
+
+    def test_unshared_cache_recomputes_after_local_ttl(self):
+        get_inbox_counters(self.receiver.pk)
+        # Sent through another worker: its incr never reaches this LocMemCache
+        ExchangeRequest.objects.bulk_create([ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill)])
+        self.assertEqual(get_inbox_counters(self.receiver.pk)["pending_incoming"], 0)
+        later = time.time() + settings.LOCAL_CACHE_TTL + 1
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual(get_inbox_counters(self.receiver.pk)["pending_incoming"], 1)
+
+    def test_badge_in_navigation(self):
+        self._send()
+        self.client.login(username="receiver", password="pass")
+        response = self.client.get(reverse("accounts:profile_detail"))
+        self.assertContains(response, '<span class="badge badge-warn">1</span>', html=True)
+
+
+class ExchangeTransitionTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.sender = User.objects.create_user(username="sender", password="pass", points=20)
+        self.receiver = User.objects.create_user(username="receiver", password="pass", points=0)
+        self.skill = Skill.objects.create(name="Python")
+        self.ex = ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=5)
+        self.ex.hold_from_sender()
+
+    def _copy(self):
+        # A second request that loaded the same row before the first one wrote it
+        return ExchangeRequest.objects.get(pk=self.ex.pk)
+
+    def test_racing_declines_refund_once(self):
+        stale = self._copy()
+        self.assertTrue(exchanges.decline(self.ex))
+        self.assertFalse(exchanges.decline(stale))
+        self.assertEqual(ledger.balance_of(self.sender.pk), ledger.Balance(20, 0))
+        self.assertEqual(self.ex.points_entries.filter(kind=PointsEntry.KIND_RELEASE).count(), 2)
+
+    def test_racing_confirmations_complete_once(self):
+        exchanges.accept(self.ex)
+        other = self._copy()
+        self.assertEqual(exchanges.confirm(self.ex, self.sender), exchanges.Confirmation(True, False))
+        self.assertEqual(exchanges.confirm(other, self.receiver), exchanges.Confirmation(True, True))
+        # The stale copy still thinks only the receiver confirmed
+        stale = self._copy()
+        stale.status = ExchangeRequest.STATUS_ACCEPTED
+        self.assertFalse(exchanges.complete(stale))
+        self.assertEqual(ledger.balance_of(self.receiver.pk).points, 15)
+        self.assertEqual(self.ex.points_entries.filter(kind=PointsEntry.KIND_TRANSFER).count(), 2)
+
+    def test_decline_of_a_copy_loaded_before_accept(self):
+        stale = self._copy()
+        exchanges.accept(self.ex)
+        self.assertTrue(exchanges.decline(stale))
+        self.ex.refresh_from_db()
+        self.assertEqual(self.ex.status, ExchangeRequest.STATUS_DECLINED)
+        self.assertEqual(ledger.balance_of(self.sender.pk), ledger.Balance(20, 0))
+
+    def test_accept_after_decline_is_rejected(self):
+        stale = self._copy()
+        exchanges.decline(self.ex)
+        self.assertFalse(exchanges.accept(stale))
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ExchangeRequest.STATUS_DECLINED)
+
+    def test_transitions_keep_caches_in_sync(self):
+        self.client.login(username="receiver", password="pass")
+        get_dashboard_stats()
+        get_inbox_counters(self.sender.pk)
+        get_inbox_counters(self.receiver.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accounts:exchange_accept", args=[self.ex.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accounts:exchange_confirm", args=[self.ex.pk]))
+        self.assertIsNone(cache.get("accounts:dashboard_stats"))
+        self.assertEqual(get_inbox_counters(self.sender.pk), compute_inbox_counters(self.sender.pk))
+        self.assertEqual(get_inbox_counters(self.receiver.pk), compute_inbox_counters(self.receiver.pk))
+        self.assertEqual(get_inbox_counters(self.sender.pk)["awaiting_my_confirmation"], 1)
+
+
+class ExchangeEventsTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.sender = User.objects.create_user(username="sender", password="pass", points=20)
+        self.receiver = User.objects.create_user(username="receiver", password="pass")
+        self.skill = Skill.objects.create(name="Python")
+
+    async def test_local_broker_delivers_to_participants_only(self):
+        broker = LocalBroker()
+        mine = await broker.subscribe(self.receiver.pk)
+        theirs = await broker.subscribe(self.sender.pk)
+        # Changes are published from the thread that committed them
+        await sync_to_async(broker.publish, thread_sensitive=False)({self.receiver.pk}, {"type": "exchange.created"})
+        self.assertEqual(await mine.get(1), (1, {"type": "exchange.created"}))
+        self.assertIsNone(await theirs.get(0.01))
+        mine.close()
+        theirs.close()
+        self.assertEqual(broker._subscribers, {})
+
+    @override_settings(CACHE_SHARED=True)
+    async def test_cache_broker_resumes_after_last_event_id(self):
+        broker = CacheBroker()
+        broker.poll_interval = 0.01
+        broker.publish({self.receiver.pk}, {"type": "exchange.created"})
+        broker.publish({self.receiver.pk}, {"type": "exchange.accepted"})
+        resumed = await broker.subscribe(self.receiver.pk, last_event_id="1")
+        self.assertEqual(await resumed.get(1), (2, {"type": "exchange.accepted"}))
+        fresh = await broker.subscribe(self.receiver.pk)
+        self.assertIsNone(await fresh.get(0.05))
+
+    @override_settings(CACHE_SHARED=True)
+    async def test_cache_broker_waits_for_numbered_events(self):
+        broker = CacheBroker()
+        broker.poll_interval = 0.01
+        subscription = await broker.subscribe(self.receiver.pk)
+        # Another worker took number 1 but has not written the event yet
+        await cache.aset(f"accounts:events:{self.receiver.pk}:seq", 1, None)
+        self.assertIsNone(await subscription.get(0.05))
+        await cache.aset(f"accounts:events:{self.receiver.pk}:1", {"type": "exchange.created"})
+        self.assertEqual(await subscription.get(1), (1, {"type": "exchange.created"}))
+
+        # A number whose event never shows up is skipped after the gap timeout
+        broker.gap_timeout = 0.05
+        await cache.aincr(f"accounts:events:{self.receiver.pk}:seq")
+        broker.publish({self.receiver.pk}, {"type": "exchange.accepted"})
+        self.assertEqual(await subscription.get(1), (3, {"type": "exchange.accepted"}))
+
+    def test_cache_broker_needs_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CacheBroker()
+
+    def _send_and_accept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ex = ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=5)
+            ex.hold_from_sender()
+        with self.captureOnCommitCallbacks(execute=True):
+            exchanges.accept(ex)
+        return ex
+
+    async def test_stream_relays_exchange_changes(self):
+        await self.async_client.aforce_login(self.receiver)
+        response = await self.async_client.get(reverse("api:events"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+        ex = await sync_to_async(self._send_and_accept)()
+        created, accepted = (await anext(stream)).decode(), (await anext(stream)).decode()
+        self.assertIn("event: exchange.created", created)
+        self.assertIn("event: exchange.accepted", accepted)
+        self.assertIn(f'"id": {ex.pk}', accepted)
+        # The ASGI handler closes the response once the client disconnects
+        await sync_to_async(response.close)()
+        self.assertEqual(get_broker()._subscribers, {})
+
+    async def test_stream_requires_authentication(self):
+        response = await self.async_client.get(reverse("api:events"))
+        self.assertEqual(response.status_code, 401)
+
+
+def _jpeg(width, height, exif=True, quality=95):
+    image = Image.new("RGB", (width, height), (200, 40, 40))
+    data = Image.Exif()
+    data[0x010F] = "Camera"  # Make
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=quality, exif=data.tobytes() if exif else b"")
+    return buffer.getvalue()
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self) -> None:
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, IMAGE_MAX_DIMENSION=1024, IMAGE_INLINE_MAX_BYTES=50_000)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username="pic", password="pass")
+
+    def _upload(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.avatar = SimpleUploadedFile("me.jpg", content, content_type="image/jpeg")
+            self.user.save()
+        self.user.refresh_from_db()
+
+    def test_small_upload_is_processed_inline(self):
+        self._upload(_jpeg(1600, 1200, quality=20))
+        self.assertEqual(ImageTask.objects.get().status, ImageTask.STATUS_DONE)
+        with Image.open(self.user.avatar.path) as original:
+            self.assertEqual(max(original.size), 1024)
+            self.assertFalse(original.getexif())
+        variants = self.user.avatar_variants
+        self.assertEqual(variants["source"], self.user.avatar.name)
+        with self.user.avatar.storage.open(variants["sizes"]["64"]["webp"]) as fh, Image.open(fh) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ("WEBP", (64, 64)))
+
+        html = Template('{% load images %}{% picture user "avatar" 64 alt="avatar" %}').render(Context({"user": self.user}))
+        self.assertIn('type="image/webp"', html)
+        self.assertRegex(html, r"thumbs/me_64\.[0-9a-f]{12}\.webp 1x")
+        self.assertRegex(html, r"thumbs/me_128\.[0-9a-f]{12}\.jpg 2x")
+        data = UserListSerializer(self.user).data["avatar_thumbnails"]
+        self.assertEqual(sorted(data["sizes"], key=int), ["48", "64", "96", "128"])
+        self.assertRegex(data["srcset"]["webp"], r"me_128\.[0-9a-f]{12}\.webp 128w")
+
+    def test_large_upload_waits_for_worker(self):
+        self._upload(_jpeg(2400, 1800, exif=True, quality=100))
+        self.assertEqual(ImageTask.objects.get().status, ImageTask.STATUS_PENDING)
+        # The original is shown until the thumbnails exist
+        html = Template('{% load images %}{% picture user "avatar" 64 %}').render(Context({"user": self.user}))
+        self.assertEqual(html, f'<img src="{self.user.avatar.url}">')
+
+        call_command("process_images", stdout=StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual(ImageTask.objects.get().status, ImageTask.STATUS_DONE)
+        self.assertEqual(self.user.avatar_variants["source"], self.user.avatar.name)
+
+    def test_replaced_upload_skips_stale_task(self):
+        self._upload(_jpeg(2400, 1800, quality=100))
+        first = self.user.avatar.name
+        self._upload(_jpeg(200, 200))
+        self.assertEqual(ImageTask.objects.get(source=first).status, ImageTask.STATUS_PENDING)
+        call_command("process_images", stdout=StringIO())
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.avatar.name, first)
+        self.assertEqual(self.user.avatar_variants["source"], self.user.avatar.name)
@@ -1,8 +1,14 @@
 """
 Integration tests for API endpoints
 """
-from django.test import TestCase
-from django.contrib.auth import get_user_model
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.backends import ModelBackend
 from rest_framework.test import APIClient
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -49,6 +55,101 @@ class APIAuthenticationTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+@override_settings(CACHE_SHARED=True)
+class APICachedAuthenticationTests(TestCase):
+    """Тесты кешированной аутентификации по токену и сессии"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def _auth_queries(self, url='/api/exchanges/counters/'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        tables = ('"authtoken_token"', '"accounts_user"')
+        return response, [q['sql'] for q in ctx.captured_queries if any(table in q['sql'] for table in tables)]
+
+    def test_token_lookup_is_cached(self):
+        """Тест что повторный запрос не читает токен и пользователя из БД"""
+        self._auth_queries()
+        response, queries = self._auth_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+
+    def test_logout_revokes_cached_token(self):
+        """Тест что удалённый при выходе токен сразу перестаёт работать"""
+        self._auth_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/logout/')
+        response, _queries = self._auth_queries()
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+    def test_deactivation_and_role_change_are_seen_immediately(self):
+        """Тест что изменения пользователя сбрасывают снимок"""
+        self._auth_queries()
+        self.user.role = User.ROLE_MODERATOR
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['role'])
+        response = self.client.get(f'/api/users/{self.user.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.wsgi_request.user.is_moderator())
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['is_active'])
+        response, _queries = self._auth_queries()
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+    def test_session_user_is_cached_until_password_change(self):
+        """Тест что сессия берёт пользователя из кеша и сбрасывается сменой пароля"""
+        client = APIClient()
+        client.login(username='testuser', password='testpass123')
+        client.get('/api/exchanges/counters/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/exchanges/counters/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if '"accounts_user"' in q['sql']])
+
+        self.user.set_password('newpass456')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = client.get('/api/exchanges/counters/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_failed_login_hashes_the_password_once(self):
+        """Тест что неудачный вход проверяет пароль одним бэкендом"""
+        for username in ('testuser', 'nobody'):
+            with self.subTest(username=username), mock.patch.object(
+                ModelBackend, 'authenticate', autospec=True, side_effect=ModelBackend.authenticate,
+            ) as check:
+                self.assertIsNone(authenticate(username=username, password='wrong'))
+                self.assertEqual(check.call_count, 1)
+        self.assertEqual(authenticate(username='testuser', password='testpass123'), self.user)
+
+    def test_snapshot_cached_before_commit_is_dropped_after_it(self):
+        """Тест что снимок, закешированный до фиксации изменения, сбрасывается после неё"""
+        self._auth_queries()
+        stale = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+            # Another request caches the row it read before the change committed
+            cache.set(f'accounts:auth:user:{self.user.pk}', stale)
+        response, _queries = self._auth_queries()
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+    @override_settings(CACHE_SHARED=False)
+    def test_unshared_cache_reads_the_database(self):
+        """Тест что без общего кеша пользователь читается из БД на каждом запросе"""
+        self._auth_queries()
+        response, queries = self._auth_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(queries)
+
+
 class APIUserTests(TestCase):
     """Тесты API для пользователей"""
     
@@ -134,6 +235,19 @@ class APISkillTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['description'], 'Updated description')
 
+    def test_bulk_create_skills(self):
+        """Тест массового создания навыков модератором"""
+        url = '/api/skills/bulk/'
+        payload = {'skills': [{'name': 'Go'}, {'name': 'Python'}, {'name': 'Rust', 'description': 'Systems'}]}
+        response = self.client.post(url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.role = User.ROLE_MODERATOR
+        self.user.save(update_fields=['role'])
+        response = self.client.post(url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(sorted(s['slug'] for s in response.data), ['go', 'rust'])
+
 
 class APIExchangeRequestTests(TestCase):
     """Тесты API для запросов на обмен"""
@@ -190,6 +304,23 @@ class APIExchangeRequestTests(TestCase):
         response = self.client.get(f'/api/exchanges/{exchange.id}/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['id'], exchange.id)
+
+    def test_exchange_counters(self):
+        """Тест счётчиков для значков уведомлений"""
+        cache.clear()
+        ExchangeRequest.objects.create(
+            sender=self.sender,
+            receiver=self.receiver,
+            skill=self.skill,
+            price=5
+        )
+        response = self.client.get('/api/exchanges/counters/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'pending_incoming': 0,
+            'awaiting_my_confirmation': 0,
+            'awaiting_other_side': 1,
+        })
     
     def test_exchange_action_accept(self):
         """Тест принятия запроса на обмен"""
@@ -212,6 +343,12 @@ class APIExchangeRequestTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         exchange.refresh_from_db()
         self.assertEqual(exchange.status, ExchangeRequest.STATUS_ACCEPTED)
+
+        # Повторное действие над уже принятым запросом отклоняется
+        response = self.client.post(f'/api/exchanges/{exchange.id}/action/', {
+            'action': 'accept'
+        })
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
     
     def test_exchange_action_confirm(self):
         """Тест подтверждения обмена"""
@@ -232,3 +369,374 @@ class APIExchangeRequestTests(TestCase):
         exchange.refresh_from_db()
         self.assertTrue(exchange.sender_confirmed)
 
+    def test_exchange_bulk_action(self):
+        """Тест пакетной обработки запросов"""
+        exchanges = []
+        for _ in range(3):
+            exchange = ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=5)
+            exchange.hold_from_sender()
+            exchanges.append(exchange)
+        stranger = User.objects.create_user(username='stranger', password='pass123')
+        foreign = ExchangeRequest.objects.create(sender=stranger, receiver=self.sender, skill=self.skill, price=0)
+        first, second, third = exchanges
+
+        receiver_token, _ = Token.objects.get_or_create(user=self.receiver)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + receiver_token.key)
+        response = self.client.post('/api/exchanges/bulk-action/', {'actions': [
+            {'id': first.id, 'action': 'decline'},
+            {'id': second.id, 'action': 'decline'},
+            {'id': third.id, 'action': 'accept'},
+            {'id': third.id, 'action': 'confirm'},
+            {'id': foreign.id, 'action': 'decline'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([item['ok'] for item in results], [True, True, True, False, False])
+        self.assertEqual([item['status'] for item in results[:3]], ['declined', 'declined', 'accepted'])
+        self.assertEqual(results[4]['error'], 'Exchange request not found')
+
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.points, 15)
+        self.assertEqual(self.sender.points_hold, 5)
+
+        # Повторный пакет не меняет уже закрытые запросы
+        response = self.client.post('/api/exchanges/bulk-action/', {'actions': [
+            {'id': first.id, 'action': 'decline'},
+        ]}, format='json')
+        self.assertFalse(response.data['results'][0]['ok'])
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.points, 15)
+
+
+class APIUserMatchesTests(TestCase):
+    """Тесты API взаимных совпадений"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.python = Skill.objects.create(name='Python')
+        self.guitar = Skill.objects.create(name='Guitar')
+        self.user = User.objects.create_user(username='me', password='pass123')
+        self.partner = User.objects.create_user(username='partner', password='pass123')
+        self.user.skills_can_teach.add(self.python)
+        self.user.skills_to_learn.add(self.guitar)
+        self.partner.skills_can_teach.add(self.guitar)
+        self.partner.skills_to_learn.add(self.python)
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_list_matches(self):
+        """Тест получения взаимных совпадений"""
+        response = self.client.get('/api/users/matches/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        result = response.data['results'][0]
+        self.assertEqual(result['user']['username'], 'partner')
+        self.assertEqual([s['name'] for s in result['teaches_me']], ['Guitar'])
+        self.assertEqual([s['name'] for s in result['learns_from_me']], ['Python'])
+
+
+class APISkillSuggestTests(TestCase):
+    """Тесты автодополнения навыков"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        for name in ['Python', 'PyTorch', 'Piano', 'Go']:
+            Skill.objects.create(name=name)
+
+    def test_suggest_by_prefix(self):
+        """Тест подсказок по префиксу"""
+        response = self.client.get('/api/skills/suggest/', {'prefix': 'py'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([s['name'] for s in response.data], ['Python', 'PyTorch'])
+
+    def test_suggest_sees_new_skills(self):
+        """Тест обновления индекса при создании навыка"""
+        self.client.get('/api/skills/suggest/', {'prefix': 'pi'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Skill.objects.create(name='Pixel Art')
+        response = self.client.get('/api/skills/suggest/', {'prefix': 'pi', 'limit': 1})
+        self.assertEqual([s['name'] for s in response.data], ['Piano'])
+        response = self.client.get('/api/skills/suggest/', {'prefix': 'pix'})
+        self.assertEqual([s['slug'] for s in response.data], ['pixel-art'])
+
+
+class APIKeysetPaginationTests(TestCase):
+    """Тесты курсорной пагинации"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.sender = User.objects.create_user(username='sender', password='pass123')
+        self.receiver = User.objects.create_user(username='receiver', password='pass123')
+        self.skill = Skill.objects.create(name='Python')
+        ExchangeRequest.objects.bulk_create([
+            ExchangeRequest(sender=self.sender, receiver=self.receiver, skill=self.skill, price=1)
+            for _ in range(45)
+        ])
+        self.token, _ = Token.objects.get_or_create(user=self.sender)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_walk_all_pages(self):
+        """Тест обхода страниц по курсору без повторов"""
+        seen = []
+        url = '/api/exchanges/'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 45)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        expected = list(ExchangeRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_and_count_opt_out(self):
+        """Тест ссылки назад и отключения подсчёта"""
+        first = self.client.get('/api/exchanges/?count=0')
+        self.assertNotIn('count', first.data)
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in back.data['results']],
+            [item['id'] for item in first.data['results']],
+        )
+
+    def test_invalid_cursor(self):
+        """Тест некорректного курсора"""
+        response = self.client.get('/api/exchanges/inbox/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_users_paginated_by_username(self):
+        """Тест курсорной пагинации пользователей"""
+        response = self.client.get('/api/users/')
+        self.assertEqual([u['username'] for u in response.data['results']], ['receiver'])
+        self.assertIsNone(response.data['next'])
+
+
+@override_settings(CACHE_SHARED=True)
+class APIConditionalGetTests(TestCase):
+    """Тесты условных GET-запросов (ETag / If-None-Match)"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.skill = Skill.objects.create(name='Python')
+        self.user.skills_can_teach.add(self.skill)
+
+    def test_unchanged_resources_answer_304_without_serializing(self):
+        """Тест что неизменённые ресурсы отдают пустой 304 за один запрос к БД"""
+        for url in ('/api/skills/', f'/api/skills/{self.skill.slug}/', f'/api/users/{self.user.pk}/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED, url)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+            self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_skill_changes_move_etags(self):
+        """Тест что изменение навыка меняет ETag списка и карточки"""
+        list_etag = self.client.get('/api/skills/')['ETag']
+        detail_etag = self.client.get(f'/api/skills/{self.skill.slug}/')['ETag']
+        user_etag = self.client.get(f'/api/users/{self.user.pk}/')['ETag']
+
+        self.skill.description = 'Язык программирования'
+        self.skill.save(update_fields=['description'])
+        for url, etag in (
+            ('/api/skills/', list_etag),
+            (f'/api/skills/{self.skill.slug}/', detail_etag),
+            (f'/api/users/{self.user.pk}/', user_etag),
+        ):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+        list_etag = self.client.get('/api/skills/')['ETag']
+        Skill.objects.create(name='Rust').delete()
+        self.assertEqual(self.client.get('/api/skills/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        Skill.objects.create(name='Go')
+        self.assertEqual(self.client.get('/api/skills/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_user_etag_follows_skill_links_and_points(self):
+        """Тест что ETag пользователя учитывает навыки и баланс"""
+        url = f'/api/users/{self.user.pk}/'
+        etags = [self.client.get(url)['ETag']]
+        other = Skill.objects.create(name='Guitar')
+        other.learners.add(self.user)
+        etags.append(self.client.get(url)['ETag'])
+        self.user.points = 42
+        self.user.save()
+        etags.append(self.client.get(url)['ETag'])
+        other.delete()
+        etags.append(self.client.get(url)['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+
+@override_settings(CACHE_SHARED=True)
+class APIShapedResponseTests(TestCase):
+    """Тесты параметров ?fields= и ?expand="""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.sender = User.objects.create_user(username='sender', password='pass123', points=20)
+        self.receiver = User.objects.create_user(username='receiver', password='pass123')
+        self.skill = Skill.objects.create(name='Python')
+        self.sender.skills_can_teach.add(self.skill)
+        self.exchange = ExchangeRequest.objects.create(sender=self.sender, receiver=self.receiver, skill=self.skill)
+        token, _ = Token.objects.get_or_create(user=self.sender)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.client.get('/api/exchanges/counters/')  # warm the token cache
+
+    def _get(self, url, skip=0):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, ' '.join(q['sql'] for q in ctx.captured_queries[skip:])
+
+    def test_sparse_fields_skip_relations_and_balances(self):
+        """Тест что ?fields= не загружает ненужные связи и баланс"""
+        # skip=1: the ETag validator query of the user detail reads everything by design
+        data, sql = self._get(f'/api/users/{self.sender.pk}/?fields=id,username', skip=1)
+        self.assertEqual(data, {'id': self.sender.pk, 'username': 'sender'})
+        self.assertNotIn('accounts_skill', sql)
+        self.assertNotIn('accounts_pointsentry', sql)
+        self.assertNotIn('"email"', sql)
+
+    def test_collapsed_relations_are_ids(self):
+        """Тест что нераскрытые связи отдаются идентификаторами"""
+        data, sql = self._get(f'/api/users/{self.sender.pk}/?fields=id,skills_can_teach&expand=', skip=1)
+        self.assertEqual(data, {'id': self.sender.pk, 'skills_can_teach': [self.skill.pk]})
+        self.assertNotIn('"accounts_skill"."name"', sql)
+
+        data, sql = self._get('/api/exchanges/?expand=skill')
+        item = data['results'][0]
+        self.assertEqual((item['sender'], item['receiver']), (self.sender.pk, self.receiver.pk))
+        self.assertEqual(item['skill']['name'], 'Python')
+        self.assertNotIn('"accounts_user"."username"', sql)
+
+    def test_default_shape_is_unchanged(self):
+        """Тест что без параметров ответ остаётся полным"""
+        data, _sql = self._get('/api/exchanges/')
+        item = data['results'][0]
+        self.assertEqual(item['sender']['points'], 20)
+        self.assertEqual(item['skill']['slug'], 'python')
+        data, _sql = self._get(f'/api/users/{self.sender.pk}/')
+        self.assertEqual(data['skills_can_teach'][0]['name'], 'Python')
+
+    def test_unknown_names_are_rejected(self):
+        """Тест что неизвестные поля дают 400"""
+        response = self.client.get('/api/skills/?fields=id,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+        response = self.client.get('/api/exchanges/?expand=message')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CACHE_SHARED=True)
+class APIMultiGetTests(TestCase):
+    """Тесты пакетного получения объектов по списку идентификаторов"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='me', password='pass123')
+        self.others = [User.objects.create_user(username=f'user{i}', password='pass123') for i in range(3)]
+        self.skills = [Skill.objects.create(name=name) for name in ('Python', 'Rust')]
+        for other in self.others:
+            other.skills_can_teach.add(*self.skills)
+        self.mine = ExchangeRequest.objects.create(sender=self.user, receiver=self.others[0], skill=self.skills[0])
+        self.foreign = ExchangeRequest.objects.create(
+            sender=self.others[1], receiver=self.others[2], skill=self.skills[0]
+        )
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.client.get('/api/exchanges/counters/')  # warm the token cache
+
+    def test_users_by_ids_in_constant_queries(self):
+        """Тест что пользователи загружаются фиксированным числом запросов"""
+        ids = [self.others[2].pk, self.user.pk, 999, self.others[0].pk]
+        # users with balances + two skill prefetches
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/users/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [ids[0], ids[1], ids[3]])
+        self.assertEqual(response.data['missing'], [999])
+        self.assertEqual(len(response.data['results'][0]['skills_can_teach']), 2)
+
+    def test_skills_by_slugs(self):
+        """Тест получения навыков по slug"""
+        response = self.client.get('/api/skills/', {'slugs': 'rust,python,cobol'})
+        self.assertEqual([item['name'] for item in response.data['results']], ['Rust', 'Python'])
+        self.assertEqual(response.data['missing'], ['cobol'])
+
+    def test_exchanges_respect_visibility(self):
+        """Тест что чужие обмены не выдаются"""
+        response = self.client.get('/api/exchanges/', {'ids': f'{self.mine.pk},{self.foreign.pk}'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.mine.pk])
+        self.assertEqual(response.data['missing'], [self.foreign.pk])
+
+    def test_invalid_and_oversized_batches(self):
+        """Тест ограничений размера и формата пакета"""
+        self.assertEqual(self.client.get('/api/users/', {'ids': '1,abc'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/users/', {'ids': ''}).status_code, status.HTTP_400_BAD_REQUEST)
+        too_many = ','.join(str(pk) for pk in range(1, 102))
+        self.assertEqual(self.client.get('/api/exchanges/', {'ids': too_many}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class APIAsyncReadTests(TestCase):
+    """Тесты асинхронных list-эндпоинтов под ASGI"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='me', password='pass123')
+        self.others = [User.objects.create_user(username=f'user{i}', password='pass123') for i in range(3)]
+        self.skill = Skill.objects.create(name='Python')
+        self.others[0].skills_can_teach.add(self.skill)
+        for other in self.others:
+            ExchangeRequest.objects.create(sender=other, receiver=self.user, skill=self.skill)
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.headers = {'Authorization': 'Token ' + token.key}
+
+    async def test_lists_are_served_by_async_views(self):
+        """Тест что пользователи, навыки и входящие читаются асинхронно"""
+        users = await self.async_client.get('/api/users/', headers=self.headers)
+        self.assertEqual(users.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['username'] for row in users.json()['results']], ['user0', 'user1', 'user2'])
+
+        batch = await self.async_client.get('/api/users/', {'ids': f'{self.others[0].pk},999'}, headers=self.headers)
+        self.assertEqual(batch.json()['results'][0]['skills_can_teach'][0]['name'], 'Python')
+        self.assertEqual(batch.json()['missing'], [999])
+
+        found = await self.async_client.get('/api/users/', {'search': 'user1'}, headers=self.headers)
+        self.assertEqual(found.json()['count'], 1)
+
+        inbox = await self.async_client.get('/api/exchanges/inbox/', headers=self.headers)
+        self.assertEqual(len(inbox.json()['results']), 3)
+        self.assertEqual(inbox.json()['results'][0]['sender']['username'], 'user2')
+
+    async def test_skill_list_etag_and_sync_create(self):
+        """Тест условного GET списка навыков и синхронного POST в том же view"""
+        first = await self.async_client.get('/api/skills/', headers=self.headers)
+        again = await self.async_client.get('/api/skills/', headers={**self.headers, 'If-None-Match': first['ETag']})
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        created = await self.async_client.post(
+            '/api/skills/', {'name': 'Rust'}, content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        changed = await self.async_client.get('/api/skills/', headers={**self.headers, 'If-None-Match': first['ETag']})
+        self.assertEqual(changed.json()['count'], 2)
+
+    async def test_unauthenticated_and_bad_page(self):
+        """Тест что ошибки аутентификации и пагинации обрабатываются как в синхронных view"""
+        anonymous = await self.async_client.get('/api/exchanges/inbox/')
+        self.assertEqual(anonymous.status_code, status.HTTP_403_FORBIDDEN)
+        missing = await self.async_client.get('/api/skills/', {'page': 5}, headers=self.headers)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,106 @@
+"""
+Query plan regression tests for the hot ExchangeRequest queries.
+
+Each query is EXPLAINed on a seeded dataset and must reach the exchange
+table through an index. On PostgreSQL sequential scans are disabled for the
+EXPLAIN, so a failure means no usable index exists, not that the planner
+preferred a scan on a small table.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import TestCase
+
+from .inbox import compute_inbox_counters
+from .models import ExchangeRequest, Skill
+from .pagination import KeysetPaginator
+
+User = get_user_model()
+
+TABLE = ExchangeRequest._meta.db_table
+# SQLite: "SCAN accounts_exchangerequest" (a bare table scan, unlike
+# "SCAN … USING INDEX", which walks an index in order); PostgreSQL: "Seq Scan on …"
+SEQUENTIAL_SCAN = re.compile(rf'(\bSCAN {TABLE}(?! USING)\b)|(Seq Scan on {TABLE}\b)')
+
+
+def explain(queryset) -> str:
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+class ExchangeQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(10)]
+        skill = Skill.objects.create(name='Python')
+        statuses = [choice for choice, _label in ExchangeRequest.STATUS_CHOICES]
+        ExchangeRequest.objects.bulk_create([
+            ExchangeRequest(
+                sender=users[i % 10],
+                receiver=users[(i * 7 + 1) % 10],
+                skill=skill,
+                status=statuses[i % len(statuses)],
+            )
+            for i in range(400)
+        ])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        cls.user = users[0]
+
+    def assertUsesIndex(self, queryset):
+        plan = explain(queryset)
+        self.assertIsNone(SEQUENTIAL_SCAN.search(plan), f'Sequential scan of {TABLE}:\n{plan}')
+
+    def test_inbox(self):
+        self.assertUsesIndex(
+            ExchangeRequest.objects.filter(receiver=self.user, status=ExchangeRequest.STATUS_PENDING)
+            .order_by('-created_at')
+        )
+
+    def test_exchange_list(self):
+        self.assertUsesIndex(ExchangeRequest.objects.involving(self.user).order_by('-created_at', '-id')[:21])
+
+    def test_exchange_list_next_page(self):
+        queryset = ExchangeRequest.objects.involving(self.user)
+        paginator = KeysetPaginator(queryset, 20)
+        boundary = queryset.order_by('-created_at', '-id')[19]
+        values, _backwards = paginator.decode_cursor(paginator.encode_cursor(boundary))
+        self.assertUsesIndex(queryset.filter(paginator._after(values, False)).order_by('-created_at', '-id')[:21])
+
+    def test_admin_listing_by_status(self):
+        self.assertUsesIndex(
+            ExchangeRequest.objects.filter(status=ExchangeRequest.STATUS_COMPLETED)
+            .order_by('-created_at', '-id')[:21]
+        )
+
+    def test_admin_listing(self):
+        self.assertUsesIndex(ExchangeRequest.objects.order_by('-created_at', '-id')[:21])
+
+    def test_completed_count_for_user(self):
+        self.assertUsesIndex(
+            ExchangeRequest.objects.involving(self.user).filter(status=ExchangeRequest.STATUS_COMPLETED)
+        )
+
+    def test_detector_flags_sequential_scan(self):
+        # Guard against a plan format change silently passing every test
+        self.assertIsNotNone(SEQUENTIAL_SCAN.search(f'2 0 0 SCAN {TABLE}'))
+        self.assertIsNotNone(SEQUENTIAL_SCAN.search(f'Seq Scan on {TABLE}  (cost=0.00..1.05 rows=5 width=4)'))
+        self.assertIsNone(SEQUENTIAL_SCAN.search(f'3 0 0 SCAN {TABLE} USING INDEX exchange_recent_idx'))
+        if connection.vendor == 'sqlite':
+            self.assertIsNotNone(SEQUENTIAL_SCAN.search(explain(ExchangeRequest.objects.filter(message='x').order_by())))
+
+    def test_union_matches_or_query(self):
+        expected = set(
+            ExchangeRequest.objects.filter(Q(sender=self.user) | Q(receiver=self.user)).values_list('id', flat=True)
+        )
+        self.assertEqual(set(ExchangeRequest.objects.involving(self.user).values_list('id', flat=True)), expected)
+        self.assertEqual(
+            compute_inbox_counters(self.user.pk)['pending_incoming'],
+            ExchangeRequest.objects.filter(receiver=self.user, status=ExchangeRequest.STATUS_PENDING).count(),
+        )
@@ -1,13 +1,14 @@
 from django.urls import path
 from .views import (
     UserLoginView, UserLogoutView, register, profile_edit, profile_detail,
-    user_detail, send_request, user_search,
+    user_detail, send_request, user_search, user_matches,
     exchange_list, exchange_create, exchange_accept, exchange_decline, exchange_confirm, inbox_requests, exchange_detail,
     make_me_superuser,
 )
 from .admin_views import (
     admin_dashboard, admin_users, admin_user_detail,
     admin_skills, admin_exchanges, admin_exchange_detail,
+    admin_users_export, admin_skills_export, admin_exchanges_export,
 )
 
 
@@ -21,6 +22,7 @@ urlpatterns = [
     path('profile/', profile_edit, name='profile_edit'),
     path('me/', profile_detail, name='profile_detail'),
     path('users/', user_search, name='user_search'),
+    path('users/matches/', user_matches, name='user_matches'),
     path('users/<int:user_id>/', user_detail, name='user_detail'),
     path('users/<int:user_id>/send/', send_request, name='send_request'),
     # Exchanges
@@ -34,9 +36,12 @@ urlpatterns = [
     # Admin panel
     path('admin-panel/', admin_dashboard, name='admin_dashboard'),
     path('admin-panel/users/', admin_users, name='admin_users'),
+    path('admin-panel/users/export/', admin_users_export, name='admin_users_export'),
     path('admin-panel/users/<int:user_id>/', admin_user_detail, name='admin_user_detail'),
     path('admin-panel/skills/', admin_skills, name='admin_skills'),
+    path('admin-panel/skills/export/', admin_skills_export, name='admin_skills_export'),
     path('admin-panel/exchanges/', admin_exchanges, name='admin_exchanges'),
+    path('admin-panel/exchanges/export/', admin_exchanges_export, name='admin_exchanges_export'),
     path('admin-panel/exchanges/<int:exchange_id>/', admin_exchange_detail, name='admin_exchange_detail'),
     # TEMP: promote current user to superuser in DEBUG
     path('make-me-super/', make_me_superuser, name='make_me_superuser'),
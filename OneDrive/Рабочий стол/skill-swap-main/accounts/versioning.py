@@ -0,0 +1,74 @@
+"""
+Version counters for in-process caches shared across workers.
+
+Each worker keeps its own copy of a derived structure and compares the
+version it was built from with the counter stored in the Django cache.
+Bumping the counter makes every other worker rebuild on its next read.
+
+That needs a cache all workers see, with an atomic ``incr``
+(``cache_is_shared``). With a per-process cache (LocMemCache) a bump
+reaches only the worker that made it, and with DatabaseCache two bumps at
+once can both end at the same value, so there the counters expire after
+``LOCAL_CACHE_TTL`` seconds instead of never: each worker then re-seeds
+its own counter and rebuilds from the database, which bounds how long it
+can serve a stale copy.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Backends whose contents are private to one process
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# Shared backends whose incr() is a get followed by a set, so concurrent
+# increments lose updates
+NON_ATOMIC_CACHE_BACKENDS = (
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+DEFAULT_LOCAL_CACHE_TTL = 60
+
+
+def cache_is_shared() -> bool:
+    """Whether every worker process reads and writes the same default cache
+    and can increment a counter in it atomically.
+
+    Guessed from the backend unless ``CACHE_SHARED`` says otherwise.
+    """
+    shared = getattr(settings, 'CACHE_SHARED', None)
+    if shared is None:
+        backend = settings.CACHES['default']['BACKEND']
+        return backend not in LOCAL_CACHE_BACKENDS and backend not in NON_ATOMIC_CACHE_BACKENDS
+    return shared
+
+
+def local_cache_ttl() -> int:
+    """Upper bound for how long a worker may keep derived data when the cache is not shared."""
+    return getattr(settings, 'LOCAL_CACHE_TTL', DEFAULT_LOCAL_CACHE_TTL)
+
+
+def _timeout():
+    return None if cache_is_shared() else local_cache_ttl()
+
+
+def get_version(key: str) -> int:
+    """Return the current version for ``key``, initialising it if missing."""
+    version = cache.get(key)
+    if version is None:
+        # A time-based seed guarantees a fresh value after cache.clear() or expiry
+        cache.add(key, time.time_ns(), timeout=_timeout())
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> int:
+    """Increment the version for ``key`` and return the new value."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=_timeout())
+        return version
@@ -1,20 +1,27 @@
 import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.contrib.auth import login
 from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
 from django.core.paginator import Paginator
 from django.http import HttpResponse, HttpResponseForbidden
+from django.template.response import TemplateResponse
 from django.conf import settings
+from django.db import transaction
 from .models import ExchangeRequest, User, Skill
+from . import exchanges
+from .mail import queue_mail
+from .matching import match_index, load_matches
+from .pagination import apage
+from .search import asearch_users
 from .forms import RegisterForm, LoginForm, ProfileForm, ExchangeCreateForm, ExchangeSendForm
 
 logger = logging.getLogger('accounts')
 
+USER_CARD_SKILLS = 3
+
 
 class UserLoginView(LoginView):
     authentication_form = LoginForm
@@ -56,19 +63,23 @@ def profile_edit(request):
 @login_required
 def profile_detail(request):
     # Skeleton history: last 10 exchanges related to the user
-    recent_exchanges = ExchangeRequest.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user)
-    ).select_related('sender', 'receiver', 'skill')[:10]
+    recent_exchanges = ExchangeRequest.objects.involving(request.user).select_related('sender', 'receiver', 'skill')[:10]
+    user_obj = User.objects.with_skill_cards().with_balances().get(pk=request.user.pk)
     return render(request, 'accounts/profile_detail.html', {
-        'user_obj': request.user,
+        'user_obj': user_obj,
         'recent_exchanges': recent_exchanges,
     })
 
 
 @login_required
-def exchange_list(request):
-    items = ExchangeRequest.objects.filter(Q(sender=request.user) | Q(receiver=request.user)).select_related('sender', 'receiver', 'skill')
-    return render(request, 'exchanges/list.html', { 'items': items })
+async def exchange_list(request):
+    user = await request.auser()
+    items = ExchangeRequest.objects.involving(user).select_related('sender', 'receiver', 'skill')
+    # Async views return a TemplateResponse: it is rendered in a thread, where
+    # context processors may still touch the session and the cache
+    return TemplateResponse(request, 'exchanges/list.html', {
+        'items': [ex async for ex in items.aiterator()],
+    })
 
 
 @login_required
@@ -95,7 +106,7 @@ def exchange_create(request):
 
 @login_required
 def user_detail(request, user_id: int):
-    target = get_object_or_404(request.user.__class__, pk=user_id)
+    target = get_object_or_404(User.objects.with_skill_cards(), pk=user_id)
     # Show send-request card
     form = ExchangeSendForm()
     form.fields['skill'].queryset = target.skills_can_teach.all()
@@ -116,19 +127,19 @@ def send_request(request, user_id: int):
             ex.sender = request.user
             ex.receiver = target
             ex.price = 5  # Fixed price for request
-            if not ex.hold_from_sender():
-                form.add_error(None, 'Недостаточно баллов')
-                messages.error(request, 'Недостаточно баллов для отправки запроса.')
-            else:
-                # Email-уведомление получателю
-                if target.email:
-                    send_mail(
+            with transaction.atomic():
+                held = ex.hold_from_sender()
+                if held:
+                    # Email-уведомление получателю уходит через outbox вместе с запросом
+                    queue_mail(
                         subject='Новый запрос на обмен в SkillSwap',
                         message=f'{request.user.get_username()} отправил(а) вам запрос по навыку {ex.skill.name}.',
-                        from_email=None,
                         recipient_list=[target.email],
-                        fail_silently=True,
                     )
+            if not held:
+                form.add_error(None, 'Недостаточно баллов')
+                messages.error(request, 'Недостаточно баллов для отправки запроса.')
+            else:
                 messages.success(request, 'Запрос отправлен пользователю.')
                 return redirect('accounts:exchange_list')
     else:
@@ -144,19 +155,20 @@ def send_request(request, user_id: int):
 def exchange_accept(request, pk: int):
     if request.method == 'POST':
         ex = get_object_or_404(ExchangeRequest, pk=pk, receiver=request.user)
-        ex.status = ExchangeRequest.STATUS_ACCEPTED
-        ex.save(update_fields=['status'])
-        logger.info(f'Exchange request {pk} accepted by {request.user.username}')
-        messages.success(request, 'Запрос принят.')
-        # Уведомим отправителя по email
-        if ex.sender.email:
-            send_mail(
-                subject='Ваш запрос принят',
-                message=f'Пользователь {request.user.get_username()} принял ваш запрос по навыку {ex.skill.name}.',
-                from_email=None,
-                recipient_list=[ex.sender.email],
-                fail_silently=True,
-            )
+        with transaction.atomic():
+            accepted = exchanges.accept(ex)
+            if accepted:
+                # Уведомим отправителя по email
+                queue_mail(
+                    subject='Ваш запрос принят',
+                    message=f'Пользователь {request.user.get_username()} принял ваш запрос по навыку {ex.skill.name}.',
+                    recipient_list=[ex.sender.email],
+                )
+        if accepted:
+            logger.info(f'Exchange request {pk} accepted by {request.user.username}')
+            messages.success(request, 'Запрос принят.')
+        else:
+            messages.error(request, 'Запрос уже обработан.')
     return redirect('accounts:exchange_list')
 
 
@@ -164,17 +176,19 @@ def exchange_accept(request, pk: int):
 def exchange_decline(request, pk: int):
     if request.method == 'POST':
         ex = get_object_or_404(ExchangeRequest, pk=pk, receiver=request.user)
-        ex.refund_to_sender()
-        messages.info(request, 'Запрос отклонён, баллы возвращены отправителю.')
-        # Email отправителю
-        if ex.sender.email:
-            send_mail(
-                subject='Ваш запрос отклонён',
-                message=f'Пользователь {request.user.get_username()} отклонил ваш запрос по навыку {ex.skill.name}.',
-                from_email=None,
-                recipient_list=[ex.sender.email],
-                fail_silently=True,
-            )
+        with transaction.atomic():
+            declined = exchanges.decline(ex)
+            if declined:
+                # Email отправителю
+                queue_mail(
+                    subject='Ваш запрос отклонён',
+                    message=f'Пользователь {request.user.get_username()} отклонил ваш запрос по навыку {ex.skill.name}.',
+                    recipient_list=[ex.sender.email],
+                )
+        if declined:
+            messages.info(request, 'Запрос отклонён, баллы возвращены отправителю.')
+        else:
+            messages.error(request, 'Запрос уже обработан.')
     return redirect('accounts:exchange_list')
 
 
@@ -188,38 +202,25 @@ def inbox_requests(request):
 @login_required
 def exchange_confirm(request, pk: int):
     if request.method == 'POST':
-        ex = get_object_or_404(ExchangeRequest, pk=pk)
-        if ex.sender == request.user:
-            ex.sender_confirmed = True
-            from django.utils import timezone
-            ex.sender_confirmed_at = timezone.now()
-            logger.info(f'Exchange request {pk} confirmed by sender {request.user.username}')
-        if ex.receiver == request.user:
-            ex.receiver_confirmed = True
-            from django.utils import timezone
-            ex.receiver_confirmed_at = timezone.now()
-            logger.info(f'Exchange request {pk} confirmed by receiver {request.user.username}')
-        ex.save(update_fields=['sender_confirmed', 'receiver_confirmed', 'sender_confirmed_at', 'receiver_confirmed_at'])
-        completed = ex.try_complete()
-        if completed:
-            logger.info(f'Exchange request {pk} completed successfully. Points transferred.')
-            messages.success(request, 'Обмен успешно завершён, баллы начислены.')
-            # Письма обеим сторонам о завершении
-            emails = []
-            if ex.sender.email:
-                emails.append(ex.sender.email)
-            if ex.receiver.email:
-                emails.append(ex.receiver.email)
-            if emails:
-                send_mail(
+        ex = get_object_or_404(ExchangeRequest.objects.involving(request.user), pk=pk)
+        with transaction.atomic():
+            result = exchanges.confirm(ex, request.user)
+            if result.completed:
+                # Письма обеим сторонам о завершении
+                queue_mail(
                     subject='Обмен завершён',
                     message=f'Обмен по навыку {ex.skill.name} успешно завершён. Баллы начислены.',
-                    from_email=None,
-                    recipient_list=emails,
-                    fail_silently=True,
+                    recipient_list=[ex.sender.email, ex.receiver.email],
                 )
-        else:
+        if result.confirmed:
+            logger.info(f'Exchange request {pk} confirmed by {request.user.username}')
+        if result.completed:
+            logger.info(f'Exchange request {pk} completed successfully. Points transferred.')
+            messages.success(request, 'Обмен успешно завершён, баллы начислены.')
+        elif result.confirmed:
             messages.info(request, 'Ваше подтверждение сохранено. Ожидается подтверждение второй стороны.')
+        else:
+            messages.error(request, 'Обмен уже подтверждён или закрыт.')
     return redirect('accounts:exchange_list')
 
 
@@ -230,42 +231,44 @@ def exchange_detail(request, pk: int):
 
 
 @login_required
-def user_search(request):
+async def user_search(request):
     search_query = request.GET.get('q', '')
     mode = request.GET.get('mode', 'teach')  # teach | learn
     skill_name = request.GET.get('skill', '')
-    users = User.objects.all()
-    
-    if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(full_name__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query)
-        )
+    # Exclude current user from results
+    users = User.objects.exclude(id=(await request.auser()).id)
 
     if skill_name:
         if mode == 'learn':
             users = users.filter(skills_to_learn__name__icontains=skill_name)
         else:
             users = users.filter(skills_can_teach__name__icontains=skill_name)
+
+    # Ranked by relevance when a query is given, otherwise by username
+    users = (await asearch_users(users, search_query)).distinct()
     
-    # Exclude current user from results
-    users = users.exclude(id=request.user.id).order_by('username').distinct()
-    
-    # Pagination
-    paginator = Paginator(users, 12)  # 12 users per page
+    # Pagination; cards carry the first 3 skills of each list and their totals
+    paginator = Paginator(users.with_skill_cards(preview=USER_CARD_SKILLS), 12)  # 12 users per page
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = await apage(paginator, page_number)
 
-    all_skills = Skill.objects.order_by('name')
-
-    return render(request, 'accounts/user_search.html', {
+    return TemplateResponse(request, 'accounts/user_search.html', {
         'users': page_obj,
         'search_query': search_query,
         'mode': mode,
         'skill_name': skill_name,
-        'all_skills': all_skills,
+    })
+
+
+@login_required
+def user_matches(request):
+    # Users who teach what I want to learn and want to learn what I teach
+    matches = match_index.matches_for(request.user.pk)
+    paginator = Paginator(matches, 12)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'accounts/user_matches.html', {
+        'matches': load_matches(page_obj.object_list),
+        'page_obj': page_obj,
     })
 
 
@@ -0,0 +1,27 @@
+from django import forms
+from django.urls import reverse_lazy
+
+
+class SkillAutocompleteWidget(forms.SelectMultiple):
+    """Multi-select that renders only the selected skills.
+
+    Other options are fetched on demand from the skill suggestion API by
+    ``static/js/skill-suggest.js``, so the page never embeds the whole catalog.
+    """
+
+    class Media:
+        js = ('js/skill-suggest.js',)
+
+    def __init__(self, attrs=None):
+        attrs = {'data-suggest-url': reverse_lazy('api:skill-suggest'), 'size': 8, **(attrs or {})}
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if v]
+        options = []
+        if selected:
+            queryset = self.choices.queryset.filter(pk__in=selected)
+            for index, obj in enumerate(queryset):
+                option_value, option_label = self.choices.choice(obj)
+                options.append(self.create_option(name, option_value, option_label, True, index))
+        return [(None, options, 0)]
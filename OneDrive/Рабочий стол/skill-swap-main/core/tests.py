@@ -1,3 +1,223 @@
-from django.test import TestCase
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+
+from accounts.catalog import catalog_cache_ttl, catalog_version
+from accounts.models import Skill, User
+from skillswap.metrics import MULTIPROC_DIR_ENV, render_metrics
+
+
+class SkillCatalogCacheTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        Skill.objects.create(name="Python")
+
+    def test_warm_catalog_costs_no_queries(self):
+        url = reverse("skill_list")
+        self.assertContains(self.client.get(url), "Python")
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Python")
+
+    def test_fragment_ttl_is_bounded_without_a_shared_cache(self):
+        with self.settings(SKILL_CATALOG_CACHE_TTL=3600, LOCAL_CACHE_TTL=60):
+            self.assertEqual(catalog_cache_ttl(), 60)
+            with self.settings(CACHE_SHARED=True):
+                self.assertEqual(catalog_cache_ttl(), 3600)
+
+    def test_skill_changes_refresh_catalog(self):
+        url = reverse("skill_list")
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            guitar = Skill.objects.create(name="Guitar")
+        self.assertContains(self.client.get(url), "Guitar")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            guitar.delete()
+        self.assertNotContains(self.client.get(url), "Guitar")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Skill.objects.bulk_create_skills([Skill(name="Rust")])
+        self.assertContains(self.client.get(url), "Rust")
+
+    def test_catalog_version_is_bumped_after_commit(self):
+        version = catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Skill.objects.create(name="Guitar")
+            # Until the commit, other requests must not render under a new version
+            self.assertEqual(catalog_version(), version)
+        self.assertNotEqual(catalog_version(), version)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self) -> None:
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        os.makedirs(os.path.join(self.media, "avatars"))
+        for name in ("me.jpg", "me.0123456789ab.jpg"):
+            with open(os.path.join(self.media, "avatars", name), "wb") as fh:
+                fh.write(bytes(range(100)))
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_streams_with_validators(self):
+        response = self.client.get("/media/avatars/me.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+
+        not_modified = self.client.get("/media/avatars/me.jpg", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        hashed = self.client.get("/media/avatars/me.0123456789ab.jpg")
+        self.assertEqual(hashed["Cache-Control"], "public, max-age=31536000, immutable")
+
+    def test_ranges(self):
+        response = self.client.get("/media/avatars/me.jpg", HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+
+        suffix = self.client.get("/media/avatars/me.jpg", HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(suffix.streaming_content), bytes(range(95, 100)))
+
+        unsatisfiable = self.client.get("/media/avatars/me.jpg", HTTP_RANGE="bytes=200-")
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable["Content-Range"], "bytes */100")
+
+        stale = self.client.get("/media/avatars/me.jpg", HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale["Content-Length"], "100")
+
+    async def test_asgi_streams_asynchronously(self):
+        response = await self.async_client.get("/media/avatars/me.jpg", headers={"Range": "bytes=90-"})
+        self.assertTrue(response.is_async)
+        self.assertEqual(b"".join([chunk async for chunk in response.streaming_content]), bytes(range(90, 100)))
+
+    def test_missing_and_escaping_paths(self):
+        self.assertEqual(self.client.get("/media/avatars/none.jpg").status_code, 404)
+        self.assertEqual(self.client.get("/media/avatars").status_code, 404)
+        self.assertEqual(self.client.get("/media/../settings.py").status_code, 404)
+        self.assertEqual(self.client.post("/media/avatars/me.jpg").status_code, 405)
+
+    def test_offload_headers(self):
+        with self.settings(MEDIA_SERVING="x-accel-redirect"):
+            response = self.client.get("/media/avatars/me.jpg")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/avatars/me.jpg")
+        self.assertEqual(response.content, b"")
+        self.assertFalse(response.has_header("Content-Type"))
+
+        with self.settings(MEDIA_SERVING="x-sendfile"):
+            response = self.client.get("/media/avatars/me.0123456789ab.jpg")
+        self.assertEqual(response["X-Sendfile"], os.path.join(self.media, "avatars", "me.0123456789ab.jpg"))
+        self.assertIn("immutable", response["Cache-Control"])
+
+
+class SkillPageConditionalGetTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.skill = Skill.objects.create(name="Python")
+        self.user = User.objects.create_user(username="viewer", password="pass")
+        self.url = reverse("skill_detail", args=[self.skill.slug])
+
+    def test_revalidation(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.user.skills_can_teach.add(self.skill)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Могут преподавать")
+        etag = response["ETag"]
+
+        # The header shows the viewer's balance and badges
+        self.client.login(username="viewer", password="pass")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.user.points = 5
+        self.user.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.skill = Skill.objects.create(name="Python")
+        self.admin = User.objects.create_user(username="admin", password="pass", role=User.ROLE_ADMIN)
+        User.objects.create_user(username="plain", password="pass")
+
+    def _sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_latency_status_and_queries_are_recorded_per_route(self):
+        labels = {"method": "GET", "route": "skills/<slug:slug>/"}
+        requests = self._sample("skillswap_requests_total", status="200", **labels)
+        observed = self._sample("skillswap_request_duration_seconds_count", **labels)
+        queries = self._sample("skillswap_db_queries_sum", **labels)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse("skill_detail", args=[self.skill.slug]))
+        self.assertEqual(self._sample("skillswap_requests_total", status="200", **labels), requests + 1)
+        self.assertEqual(self._sample("skillswap_request_duration_seconds_count", **labels), observed + 1)
+        self.assertEqual(self._sample("skillswap_db_queries_sum", **labels), queries + len(captured))
+
+        missing = self._sample("skillswap_requests_total", method="GET", route="<unmatched>", status="404")
+        self.client.get("/no/such/page/")
+        self.assertEqual(
+            self._sample("skillswap_requests_total", method="GET", route="<unmatched>", status="404"), missing + 1,
+        )
+
+    def test_responses_of_other_middleware_are_counted(self):
+        # CommonMiddleware answers the missing slash before the URL is resolved
+        labels = {"method": "GET", "route": "<unmatched>", "status": "301"}
+        redirects = self._sample("skillswap_requests_total", **labels)
+        response = self.client.get(reverse("skill_detail", args=[self.skill.slug]).rstrip("/"))
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(self._sample("skillswap_requests_total", **labels), redirects + 1)
+
+    async def test_async_view_queries_are_counted_under_asgi(self):
+        labels = {"method": "GET", "route": "accounts/exchanges/"}
+        queries = self._sample("skillswap_db_queries_sum", **labels)
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse("accounts:exchange_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self._sample("skillswap_db_queries_sum", **labels), queries)
+
+    def test_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        self.client.login(username="plain", password="pass")
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+
+        self.client.logout()
+        token = Token.objects.create(user=self.admin)
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(b"skillswap_request_duration_seconds_bucket", response.content)
+
+    def test_multiprocess_mode_sums_the_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        worker = (
+            "from prometheus_client import Counter;"
+            "Counter('skillswap_requests', '', ['method', 'route', 'status']).labels('GET', 'api/', '200').inc()"
+        )
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", worker], env={**os.environ, MULTIPROC_DIR_ENV: directory}, check=True)
+        with mock.patch.dict(os.environ, {MULTIPROC_DIR_ENV: directory}):
+            text = render_metrics().decode()
+        self.assertIn('skillswap_requests_total{method="GET",route="api/",status="200"} 2.0', text)
@@ -1,5 +1,9 @@
+from django.contrib import messages
 from django.http import HttpResponse
 from django.shortcuts import render
+from accounts.catalog import catalog_cache_ttl, catalog_version
+from accounts.conditional import not_modified, set_validators
+from accounts.inbox import get_inbox_counters
 from accounts.models import Skill, User
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
@@ -11,33 +15,48 @@ def home(request):
 
 
 def skill_list(request):
-    # Ensure legacy skills without slug get populated
-    for sk in Skill.objects.filter(slug__isnull=True):
-        sk.save()
-    for sk in Skill.objects.filter(slug=""):
-        sk.save()
     form = SkillForm()
     if request.user.is_authenticated:
         skills_teach = request.user.skills_can_teach.all()
         skills_learn = request.user.skills_to_learn.all()
         context = { 'skills_teach': skills_teach, 'skills_learn': skills_learn, 'form': form }
     else:
-        # For guests show all skills as catalog
-        skills = Skill.objects.all()
-        context = { 'skills': skills, 'form': form }
+        # For guests show all skills as catalog; the queryset is only evaluated
+        # when the cached fragment for the current catalog version is missing
+        skills = Skill.objects.only('name', 'slug')
+        context = {
+            'skills': skills,
+            'form': form,
+            'catalog_version': catalog_version(),
+            'catalog_cache_ttl': catalog_cache_ttl(),
+        }
     return render(request, 'skills/list.html', context)
 
 
+def _skill_page_validators(request, skill):
+    parts = ('skill_page', skill.pk, skill.updated_at, skill.teachers_count, skill.learners_count)
+    if request.user.is_authenticated:
+        # The header shows the viewer's balance and badges
+        counters = get_inbox_counters(request.user.pk)
+        parts += (request.user.pk, request.user.updated_at, request.user.points, *sorted(counters.items()))
+    return parts
+
+
 def skill_detail(request, slug: str):
     from django.shortcuts import get_object_or_404
     skill = get_object_or_404(Skill, slug=slug)
-    can_teach_count = User.objects.filter(skills_can_teach=skill).count()
-    to_learn_count = User.objects.filter(skills_to_learn=skill).count()
-    return render(request, 'skills/detail.html', {
+    # Pending flash messages must be rendered, not answered with a 304
+    check = request.method in ('GET', 'HEAD') and not len(messages.get_messages(request))
+    if check:
+        etag, response = not_modified(request, _skill_page_validators(request, skill))
+        if response is not None:
+            return response
+    response = render(request, 'skills/detail.html', {
         'skill': skill,
-        'can_teach_count': can_teach_count,
-        'to_learn_count': to_learn_count,
+        'can_teach_count': skill.teachers_count,
+        'to_learn_count': skill.learners_count,
     })
+    return set_validators(response, etag) if check else response
 
 
 @login_required
@@ -2,6 +2,9 @@
 ASGI config for skillswap project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Production runs it under gunicorn with uvicorn workers (Procfile, render.yaml,
+Dockerfile); the async read views only free their worker thread here, under
+WSGI they are run through ``async_to_sync``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
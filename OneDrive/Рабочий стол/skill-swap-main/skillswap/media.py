@@ -0,0 +1,210 @@
+"""
+Serving of uploaded media (MEDIA_URL).
+
+``MEDIA_SERVING`` selects how a request for ``/media/<path>`` is answered:
+
+* ``stream`` (default) - Django streams the file itself, with ``ETag``,
+  ``Last-Modified``, single ``Range`` requests and ``Cache-Control``. Under
+  ASGI the file is read in a thread chunk by chunk, so a slow client holds a
+  coroutine, not a worker;
+* ``x-accel-redirect`` - Django only resolves the file and answers with
+  ``X-Accel-Redirect: <MEDIA_ACCEL_REDIRECT_PREFIX><path>``; nginx sends it
+  from an ``internal`` location (ranges, validators, sendfile included);
+* ``x-sendfile`` - the same with ``X-Sendfile: <absolute path>`` for Apache
+  (mod_xsendfile) and lighttpd;
+* ``off`` - no media URLs in Django at all: the proxy serves MEDIA_ROOT.
+
+Names produced by ``hashed_name`` contain a digest of the content, so their
+responses are cacheable for a year as ``immutable``; other names get
+``MEDIA_MAX_AGE`` and are revalidated with the ETag.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+STREAM = 'stream'
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+OFF = 'off'
+
+DEFAULT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+DEFAULT_MAX_AGE = 3600
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+CHUNK_SIZE = 64 * 1024
+
+DIGEST_LENGTH = 12
+# "<stem>.<digest>[_<suffix storage added on a clash>].<ext>"
+HASHED_NAME = re.compile(rf'\.[0-9a-f]{{{DIGEST_LENGTH}}}(_[A-Za-z0-9]{{7}})?\.[A-Za-z0-9]+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def hashed_name(name: str, content: bytes) -> str:
+    """``name`` with a digest of ``content`` before the extension (replacing an earlier one)."""
+    stem, ext = posixpath.splitext(name)
+    stem = re.sub(rf'\.[0-9a-f]{{{DIGEST_LENGTH}}}$', '', stem)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:DIGEST_LENGTH]}{ext}'
+
+
+def is_hashed(name: str) -> bool:
+    return bool(HASHED_NAME.search(name))
+
+
+def cache_control(name: str) -> str:
+    if is_hashed(name):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={getattr(settings, "MEDIA_MAX_AGE", DEFAULT_MAX_AGE)}'
+
+
+def parse_range(header: str, size: int):
+    """``(start, end)`` (inclusive) of a single-range ``Range`` header.
+
+    ``None`` means the header is absent or not one we handle (several ranges,
+    another unit), and the whole file is sent. Raises ``ValueError`` when the
+    range cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # "bytes=-500": the last 500 bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag: str, mtime: int) -> bool:
+    validator = request.headers.get('If-Range')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        # Weak ETags never match for ranges
+        return validator == etag
+    return parse_http_date_safe(validator) == mtime
+
+
+def _read(path: str, start: int, length: int):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def _aread(path: str, start: int, length: int):
+    fh = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(fh.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(fh.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+def _offload(mode: str, name: str, full_path: str) -> HttpResponse:
+    response = HttpResponse()
+    # Content-Type, validators and ranges are the proxy's job
+    del response['Content-Type']
+    if mode == X_ACCEL_REDIRECT:
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', DEFAULT_ACCEL_REDIRECT_PREFIX)
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+def _stream(request, full_path: str, stat) -> HttpResponse:
+    size = stat.st_size
+    mtime = int(stat.st_mtime)
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    start, end, status = 0, size - 1, 200
+    if _if_range_matches(request, etag, mtime):
+        try:
+            requested = parse_range(request.headers.get('Range', ''), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if requested is not None:
+            (start, end), status = requested, 206
+    length = max(end - start + 1, 0)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(status=status, content_type=content_type or 'application/octet-stream')
+    else:
+        chunks = _aread if isinstance(request, ASGIRequest) else _read
+        response = StreamingHttpResponse(
+            chunks(full_path, start, length), status=status,
+            content_type=content_type or 'application/octet-stream',
+        )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """A file from MEDIA_ROOT, streamed or handed over to the proxy (``MEDIA_SERVING``)."""
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(full_path)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+
+    mode = getattr(settings, 'MEDIA_SERVING', STREAM)
+    if mode in (X_ACCEL_REDIRECT, X_SENDFILE):
+        response = _offload(mode, name, full_path)
+    else:
+        response = _stream(request, full_path, stat)
+    response['Cache-Control'] = cache_control(name)
+    return response
+
+
+def media_urlpatterns() -> list:
+    """URL patterns for MEDIA_URL; empty when the proxy serves it (``MEDIA_SERVING = 'off'``)."""
+    if getattr(settings, 'MEDIA_SERVING', STREAM) == OFF:
+        return []
+    prefix = settings.MEDIA_URL.lstrip('/')
+    return [re_path(rf'^{re.escape(prefix)}(?P<path>.+)$', serve_media, name='media')]
@@ -0,0 +1,113 @@
+"""
+Request metrics in the Prometheus text format.
+
+``RequestLoggingMiddleware`` records for every request:
+
+* ``skillswap_request_duration_seconds`` - latency histogram by method and
+  route. The route is the URL pattern (``api/users/<int:pk>/``), so ids do
+  not multiply the series;
+* ``skillswap_requests_total`` - counter by method, route and status code;
+* ``skillswap_db_queries`` / ``skillswap_db_query_duration_seconds`` -
+  histograms of how many SQL queries a request ran and how long they took in
+  total, counted with ``connection.execute_wrapper``.
+
+``/metrics/`` serves them to administrators (session or ``Authorization:
+Token``). Each gunicorn worker counts its own requests: with
+``PROMETHEUS_MULTIPROC_DIR`` pointing to a directory shared by the workers
+(emptied before gunicorn starts), prometheus_client keeps the values in
+per-process files there and every worker answers a scrape with the sum.
+"""
+import os
+import time
+
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from rest_framework.decorators import api_view, permission_classes
+
+from accounts.permissions import IsAdmin
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+UNMATCHED_ROUTE = '<unmatched>'
+# Anything else is counted as "other", so arbitrary verbs cannot add series
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+REQUEST_DURATION = Histogram(
+    'skillswap_request_duration_seconds', 'Request latency by route',
+    ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    'skillswap_requests', 'Responses by route and status code',
+    ['method', 'route', 'status'],
+)
+DB_QUERIES = Histogram(
+    'skillswap_db_queries', 'SQL queries per request',
+    ['method', 'route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_QUERY_DURATION = Histogram(
+    'skillswap_db_query_duration_seconds', 'Total SQL time per request',
+    ['method', 'route'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` that counts the queries run through it and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._scope = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+    def start(self) -> None:
+        # The middleware hooks run in the thread that also runs the view and,
+        # under ASGI, the async ORM calls of the request
+        self._scope = connection.execute_wrapper(self)
+        self._scope.__enter__()
+
+    def stop(self) -> None:
+        if self._scope is not None:
+            self._scope.__exit__(None, None, None)
+            self._scope = None
+
+
+def route_of(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else UNMATCHED_ROUTE
+
+
+def observe(request, response, duration: float, queries: QueryCounter) -> None:
+    method = request.method if request.method in METHODS else 'other'
+    route = route_of(request)
+    REQUEST_DURATION.labels(method, route).observe(duration)
+    REQUESTS.labels(method, route, str(response.status_code)).inc()
+    DB_QUERIES.labels(method, route).observe(queries.count)
+    DB_QUERY_DURATION.labels(method, route).observe(queries.duration)
+
+
+def render_metrics() -> bytes:
+    """All metrics in the text format; summed over the workers in multiprocess mode."""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def metrics_view(request):
+    """Метрики запросов для Prometheus (только администраторы)"""
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -3,23 +3,33 @@ Custom middleware for monitoring and logging
 """
 import logging
 import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from .metrics import QueryCounter, observe
 
 logger = logging.getLogger('accounts')
 
 
 class RequestLoggingMiddleware(MiddlewareMixin):
     """
-    Middleware для логирования всех запросов и времени их выполнения
+    Middleware для логирования всех запросов и времени их выполнения.
+    Заодно собирает метрики (skillswap.metrics): задержку по маршрутам,
+    коды ответов, число и время SQL-запросов.
     """
     
     def process_request(self, request):
         request.start_time = time.time()
+        request.db_queries = QueryCounter()
+        request.db_queries.start()
         return None
     
     def process_response(self, request, response):
         if hasattr(request, 'start_time'):
             duration = time.time() - request.start_time
+            request.db_queries.stop()
+            observe(request, response, duration, request.db_queries)
             
             # Логируем только медленные запросы (> 1 секунды) или ошибки
             if duration > 1.0 or response.status_code >= 400:
@@ -27,8 +37,40 @@ class RequestLoggingMiddleware(MiddlewareMixin):
                     f'{request.method} {request.path} - '
                     f'Status: {response.status_code} - '
                     f'Duration: {duration:.2f}s - '
-                    f'User: {getattr(request.user, "username", "Anonymous")}'
+                    f'Queries: {request.db_queries.count} - '
+                    f'User: {getattr(getattr(request, "user", None), "username", "Anonymous")}'
                 )
         
         return response
 
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise, пригодный для ASGI без переключения в синхронный режим.
+
+    Исходный класс только синхронный: под ASGI Django оборачивал бы им всю
+    цепочку, и каждый запрос, в том числе к асинхронным view, занимал бы поток
+    до самого ответа.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # В режиме разработки файл ищется на диске
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -82,14 +82,16 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Снаружи остальных middleware: в метрики входят время и SQL-запросы сессий и
+    # аутентификации и ответы, которые middleware возвращают сами (редиректы и т.п.)
+    'skillswap.middleware.RequestLoggingMiddleware',  # Custom monitoring middleware
+    'skillswap.middleware.WhiteNoiseMiddleware',  # WhiteNoise с поддержкой ASGI
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'skillswap.middleware.RequestLoggingMiddleware',  # Custom monitoring middleware
 ]
 
 ROOT_URLCONF = 'skillswap.urls'
@@ -105,12 +107,14 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.context_processors.inbox_counters',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'skillswap.wsgi.application'
+ASGI_APPLICATION = 'skillswap.asgi.application'
 
 
 # Database
@@ -182,13 +186,73 @@ WHITENOISE_USE_FINDERS = True
 WHITENOISE_MANIFEST_STRICT = False
 WHITENOISE_ALLOW_ALL_ORIGINS = True
 
+# Cache: по умолчанию локальная память процесса. Для нескольких воркеров gunicorn
+# укажите общий backend с атомарным incr, например
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache и CACHE_LOCATION=redis://...
+# DatabaseCache не подходит: параллельные incr теряют обновления счётчиков
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'skillswap'),
+    }
+}
+# С локальным кешем (или общим без атомарного incr) версии индексов, счётчики и снимки,
+# которые другой воркер не может сбросить, живут не дольше LOCAL_CACHE_TTL секунд
+# (accounts.versioning.cache_is_shared)
+LOCAL_CACHE_TTL = int(os.environ.get('LOCAL_CACHE_TTL', 60))
+
+# Время жизни снимка статистики админ-панели (секунды)
+ADMIN_DASHBOARD_CACHE_TTL = int(os.environ.get('ADMIN_DASHBOARD_CACHE_TTL', 60))
+
+# Каталог навыков для гостей кешируется по версии каталога (accounts.catalog);
+# с локальным кешем - не дольше LOCAL_CACHE_TTL
+SKILL_CATALOG_CACHE_TTL = int(os.environ.get('SKILL_CATALOG_CACHE_TTL', 3600))
+
+# Счётчики для значков «Уведомления» (accounts.inbox); точны только с общим кешем,
+# с локальным пересчитываются не реже раза в LOCAL_CACHE_TTL
+INBOX_COUNTERS_CACHE_TTL = int(os.environ.get('INBOX_COUNTERS_CACHE_TTL', 300))
+
+# Поток событий обменов /api/events/ (accounts.events). LocalBroker доставляет события
+# только в пределах одного ASGI-процесса; при нескольких воркерах или серверах укажите
+# EXCHANGE_EVENTS_BACKEND=accounts.events.CacheBroker вместе с общим CACHE_BACKEND (Redis,
+# Memcached). EXCHANGE_EVENTS_GAP_TIMEOUT - сколько секунд подписчик ждёт событие,
+# номер которого уже выдан, но само оно ещё не записано
+EXCHANGE_EVENTS_BACKEND = os.environ.get('EXCHANGE_EVENTS_BACKEND', 'accounts.events.LocalBroker')
+EXCHANGE_EVENTS_HEARTBEAT = int(os.environ.get('EXCHANGE_EVENTS_HEARTBEAT', 15))
+EXCHANGE_EVENTS_TTL = int(os.environ.get('EXCHANGE_EVENTS_TTL', 300))
+EXCHANGE_EVENTS_POLL_INTERVAL = float(os.environ.get('EXCHANGE_EVENTS_POLL_INTERVAL', 1.0))
+EXCHANGE_EVENTS_GAP_TIMEOUT = float(os.environ.get('EXCHANGE_EVENTS_GAP_TIMEOUT', 5.0))
+
 # Email (для разработки выводим письма в консоль)
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 DEFAULT_FROM_EMAIL = "no-reply@skillswap.local"
 
+# Очередь писем (accounts.mail), её разбирает `python manage.py send_outbox --loop`
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_BACKOFF = int(os.environ.get('OUTBOX_RETRY_BACKOFF', 30))
+OUTBOX_LEASE = int(os.environ.get('OUTBOX_LEASE', 300))
+
+# Миниатюры аватаров и фото навыков (accounts.images). Файлы крупнее
+# IMAGE_INLINE_MAX_BYTES обрабатывает `python manage.py process_images --loop`
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 2048))
+IMAGE_INLINE_MAX_BYTES = int(os.environ.get('IMAGE_INLINE_MAX_BYTES', 1024 * 1024))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 82))
+
+# Выгрузки админ-панели в CSV / NDJSON (accounts.exports): строк за одну выборку
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Раздача медиа (skillswap.media): stream - Django отдаёт файлы сам (Range, ETag);
+# x-accel-redirect / x-sendfile - файл отправляет nginx / Apache по заголовку;
+# off - MEDIA_URL целиком обслуживает прокси, Django его не маршрутизирует.
+# Для nginx: location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+MEDIA_SERVING = os.environ.get('MEDIA_SERVING', 'stream')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 3600))
+
 # Ensure the media directory exists
 os.makedirs(MEDIA_ROOT, exist_ok=True)
 
@@ -203,6 +267,19 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
+# Пользователь сессии и API-токена берётся из кеша (accounts.authentication) -
+# только с общим CACHE_BACKEND, иначе из БД на каждом запросе.
+# ModelBackend оставлен только для сессий, созданных до подключения кеша (их
+# пользователь читается из БД); пароли он не проверяет - неудачный вход
+# останавливается на CachedModelBackend
+AUTHENTICATION_BACKENDS = [
+    'accounts.authentication.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 60))
+# Сессии читаются из кеша, в БД идут только записи
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # Auth redirects
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
@@ -212,7 +289,7 @@ LOGIN_URL = 'accounts:login'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
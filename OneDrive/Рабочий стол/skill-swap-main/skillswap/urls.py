@@ -16,12 +16,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from .media import media_urlpatterns
+from .metrics import metrics_view
+
 schema_view = get_schema_view(
    openapi.Info(
       title="SkillSwap API",
@@ -40,11 +41,13 @@ urlpatterns = [
     path('', include('core.urls')),
     path('accounts/', include('accounts.urls', namespace='accounts')),
     path('api/', include('accounts.api_urls', namespace='api')),
+    # Prometheus scrape endpoint (skillswap.metrics), administrators only
+    path('metrics/', metrics_view, name='metrics'),
     # API Documentation
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
 
-# Serve media files in both development and production
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploaded media: streamed by Django or handed over to the proxy (MEDIA_SERVING, skillswap.media)
+urlpatterns += media_urlpatterns()
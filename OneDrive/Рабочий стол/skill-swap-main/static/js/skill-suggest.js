@@ -0,0 +1,66 @@
+// Skill autocomplete backed by /api/skills/suggest/
+(function () {
+  let counter = 0;
+
+  function fetchSuggestions(url, prefix) {
+    const query = new URLSearchParams({ prefix: prefix });
+    return fetch(url + '?' + query.toString(), { credentials: 'same-origin' })
+      .then((response) => (response.ok ? response.json() : []))
+      .catch(() => []);
+  }
+
+  function attach(field) {
+    const url = field.dataset.suggestUrl;
+    const list = document.createElement('datalist');
+    list.id = 'skill-suggest-' + ++counter;
+    let input = field;
+    let byName = {};
+
+    if (field.tagName === 'SELECT') {
+      input = document.createElement('input');
+      input.type = 'text';
+      input.placeholder = 'Начните вводить навык...';
+      field.parentNode.insertBefore(input, field);
+      // Double-clicking an option removes it from the selection
+      field.addEventListener('dblclick', (event) => {
+        if (event.target.tagName === 'OPTION') event.target.remove();
+      });
+      field.form && field.form.addEventListener('submit', () => {
+        Array.from(field.options).forEach((option) => { option.selected = true; });
+      });
+      input.addEventListener('change', () => {
+        const skill = byName[input.value];
+        if (!skill) return;
+        if (!field.querySelector('option[value="' + skill.id + '"]')) {
+          field.add(new Option(skill.name, skill.id, true, true));
+        }
+        input.value = '';
+      });
+    }
+
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+    input.parentNode.insertBefore(list, input.nextSibling);
+
+    let timer = null;
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      const prefix = input.value.trim();
+      if (!prefix) return;
+      timer = setTimeout(() => {
+        fetchSuggestions(url, prefix).then((skills) => {
+          byName = {};
+          list.innerHTML = '';
+          skills.forEach((skill) => {
+            byName[skill.name] = skill;
+            list.appendChild(new Option(skill.name, skill.name));
+          });
+        });
+      }, 150);
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-suggest-url]').forEach(attach);
+  });
+})();